@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Adaptive I/O tuning
+Hashing and copying run with as many parallel file operations and as large
+read/write blocks as the device handles best. Parallel reads help on SSDs,
+but cheap SD cards and USB card readers get slower, so there is no fixed
+setting that suits every machine.
+
+Each mount point gets an IoTuner. It runs file operations through a gate
+that admits `workers` operations at a time, measures the achieved
+throughput in windows of WINDOW_SECONDS and adjusts the settings like TCP
+congestion control (AIMD): as long as throughput doesn't drop, the worker
+count is raised by one or the block size doubled (alternating); when it
+drops, the setting changed last is halved. The best settings seen are
+stored per mount point in the cache (io_tuning.json), so the next run on
+the same device starts there.
+
+Usage:
+    tuner = adaptive_io.tuner_for(folder)
+    results = tuner.map(lambda path, block_size: (do_io(path, block_size), bytes_done), paths)
+"""
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from tonuino_cache import JsonCache
+
+
+MIN_WORKERS = 1
+MAX_WORKERS = 8
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 1
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Throughput is measured over windows of at least this long / this many operations
+WINDOW_SECONDS = 1.0
+WINDOW_MIN_OPS = 2
+# Relative drop of throughput that counts as congestion (smaller changes are noise)
+DROP_TOLERANCE = 0.1
+
+_settings = JsonCache('io_tuning')
+_tuners: Dict[str, 'IoTuner'] = {}
+_tuners_lock = threading.Lock()
+
+
+def mount_point(path) -> str:
+    """The mount point of the file system a path is on (the path itself may not exist yet)"""
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    path = path.resolve()
+    while not os.path.ismount(path) and path != path.parent:
+        path = path.parent
+    return str(path)
+
+
+class IoTuner:
+    """Worker count and block size of one device, tuned from the measured throughput"""
+
+    def __init__(self, mount: str, settings: Optional[JsonCache] = None):
+        self.mount = mount
+        self.settings = settings if settings is not None else _settings
+        stored = self.settings.get(mount) or {}
+        self.workers = min(MAX_WORKERS, max(MIN_WORKERS, stored.get('workers', DEFAULT_WORKERS)))
+        self.block_size = min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, stored.get('block_size', DEFAULT_BLOCK_SIZE)))
+        # Best (throughput, workers, block size) of this run, stored by save()
+        self.best = (0.0, self.workers, self.block_size)
+        self._probe = 'workers'
+        self._previous = None
+        self._active = 0
+        self._gate = threading.Condition()
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_ops = 0
+
+    def _acquire(self):
+        with self._gate:
+            while self._active >= self.workers:
+                self._gate.wait()
+            self._active += 1
+
+    def _release(self):
+        with self._gate:
+            self._active -= 1
+            self._gate.notify_all()
+
+    def record(self, transferred: int):
+        """Count the bytes of a finished operation; adjusts the settings at the end of a window"""
+        if transferred <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = now
+            self._window_bytes += transferred
+            self._window_ops += 1
+            elapsed = now - self._window_start
+            if elapsed < WINDOW_SECONDS or self._window_ops < WINDOW_MIN_OPS:
+                return
+            throughput = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+            self._window_ops = 0
+            self._adjust(throughput)
+
+    def _adjust(self, throughput: float):
+        if throughput > self.best[0]:
+            self.best = (throughput, self.workers, self.block_size)
+        if self._previous is None or throughput >= self._previous * (1 - DROP_TOLERANCE):
+            # No congestion: additive increase of workers, or a larger block size
+            if self._probe == 'workers':
+                self.workers = min(MAX_WORKERS, self.workers + 1)
+            else:
+                self.block_size = min(MAX_BLOCK_SIZE, self.block_size * 2)
+        else:
+            # Throughput dropped: multiplicative decrease of the setting changed last
+            if self._probe == 'workers':
+                self.workers = max(MIN_WORKERS, self.workers // 2)
+            else:
+                self.block_size = max(MIN_BLOCK_SIZE, self.block_size // 2)
+        self._previous = throughput
+        self._probe = 'block_size' if self._probe == 'workers' else 'workers'
+        with self._gate:
+            self._gate.notify_all()
+
+    def map(self, func: Callable[[Any, int], Tuple[Any, int]], items: Sequence[Any]) -> List[Any]:
+        """Run func(item, block_size) -> (result, bytes transferred) for all items, returning the results in order
+
+        Up to MAX_WORKERS threads are started, the gate lets `workers` of them
+        do I/O at the same time. The first exception is raised after all
+        threads have stopped.
+        """
+        items = list(items)
+        results: List[Any] = [None] * len(items)
+        errors: List[BaseException] = []
+        next_index = [0]
+        index_lock = threading.Lock()
+
+        def work():
+            while True:
+                with index_lock:
+                    if errors or next_index[0] >= len(items):
+                        return
+                    index = next_index[0]
+                    next_index[0] += 1
+                self._acquire()
+                try:
+                    results[index], transferred = func(items[index], self.block_size)
+                    self.record(transferred)
+                except BaseException as e:
+                    with index_lock:
+                        errors.append(e)
+                    return
+                finally:
+                    self._release()
+
+        if len(items) <= 1:
+            work()
+        else:
+            threads = [threading.Thread(target=work, daemon=True) for _ in range(min(MAX_WORKERS, len(items)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.save()
+        if errors:
+            raise errors[0]
+        return results
+
+    def save(self):
+        """Store the best settings seen in this run for this mount point"""
+        throughput, workers, block_size = self.best
+        if throughput <= 0:
+            return
+        stored = self.settings.get(self.mount) or {}
+        if (stored.get('workers'), stored.get('block_size'), stored.get('throughput')) != (workers, block_size, throughput):
+            self.settings.set(self.mount, {'workers': workers, 'block_size': block_size, 'throughput': throughput})
+            self.settings.save()
+
+    def describe(self) -> str:
+        return (f"{self.mount}: {self.workers} worker(s), {self.block_size // 1024} KB blocks"
+                + (f", best {self.best[0] / (1024 * 1024):.1f} MB/s" if self.best[0] else ""))
+
+
+def tuner_for(path) -> IoTuner:
+    """The shared tuner of the device a path is on"""
+    mount = mount_point(path)
+    with _tuners_lock:
+        if mount not in _tuners:
+            _tuners[mount] = IoTuner(mount)
+        return _tuners[mount]
+
+
+def copy_file(source: Path, dest: Path, block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """Copy a file with its timestamps (like shutil.copy2) using block_size; returns the bytes copied"""
+    copied = 0
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        while True:
+            chunk = src.read(block_size)
+            if not chunk:
+                break
+            dst.write(chunk)
+            copied += len(chunk)
+    shutil.copystat(source, dest)
+    return copied
+
+
+if __name__ == '__main__':
+    for mount in _settings.keys():
+        tuner = IoTuner(mount)
+        print(tuner.describe())
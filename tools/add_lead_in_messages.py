@@ -4,7 +4,7 @@
 # So - when played e.g. on a TonUINO - you first will hear the title of the track, then the track itself.
 
 
-import argparse, base64, json, os, re, subprocess, sys, text_to_speech
+import argparse, base64, json, os, re, subprocess, sys, audio_postprocess, job_queue, polly_client, profiling, run_planner, text_to_speech, tool_registry, tts_quota
 
 
 argFormatter = lambda prog: argparse.RawDescriptionHelpFormatter(prog, max_help_position=27, width=100)
@@ -18,11 +18,15 @@ argparser = text_to_speech.PatchedArgumentParser(
 argparser.add_argument('-i', '--input', type=str, required=True, help='The input directory or mp3 file to process (input won\'t be changed)')
 argparser.add_argument('-o', '--output', type=str, required=True, help='The output directory where to write the mp3 files (will be created if not existing)')
 text_to_speech.addArgumentsToArgparser(argparser)
+audio_postprocess.addArgumentsToArgparser(argparser)
 argparser.add_argument('--file-regex', type=str, default=None, help="The regular expression to use for parsing the mp3 file name. If missing the whole file name except a leading number will be used as track title.")
 argparser.add_argument('--title-pattern', type=str, default=None, help="The pattern to use as track title. May contain groups of `--file-regex`, e.g. '\\1'")
 argparser.add_argument('--add-numbering', action='store_true', help='Whether to add a three-digit number to the mp3 files (suitable for DFPlayer Mini)')
-argparser.add_argument('--dry-run', action='store_true', help='Dry run: Only prints what the script would do, without actually creating files')
+argparser.add_argument('--dry-run', action='store_true', help='Dry run: Only prints what the script would do, without actually creating files, and estimates time and cost from earlier runs')
+run_planner.addArgumentsToArgparser(argparser)
+profiling.add_profile_argument(argparser)
 args = argparser.parse_args()
+profiling.enable_from_args(args)
 
 text_to_speech.checkArgs(argparser, args)
 
@@ -31,6 +35,11 @@ titlePattern = args.title_pattern if args.title_pattern is not None else '\\1'
 
 mp3FileIndex = 0
 
+tools = tool_registry.get_registry()
+if not args.dry_run and not tools.available('ffmpeg'):
+    print('ERROR: ffmpeg is needed to add lead-in messages, but it is not installed.')
+    sys.exit(1)
+
 
 def fail(msg):
     print('ERROR: ' + msg)
@@ -69,8 +78,10 @@ def addLeadInMessage(inputPath, outputPath):
         outputPath = os.path.join(outputPathSplit[0], '{:0>3}_{}'.format(mp3FileIndex + 1, outputPathSplit[1]))
         mp3FileIndex += 1
 
-    if os.path.isfile(outputPath):
+    if os.path.isfile(outputPath) and not (job and job.is_partial(outputPath)):
         print('Skipping {} (file already exists)'.format(os.path.abspath(outputPath)))
+        tts_quota.usage.addCacheHits('existing files')
+        plan.addCacheHits('existing files')
         return
 
     text = re.sub(fileRegex, titlePattern, inputFileName).replace('_', ' ').strip()
@@ -79,33 +90,47 @@ def addLeadInMessage(inputPath, outputPath):
         return
     print('Adding lead-in "{}" to {}'.format(text, os.path.abspath(outputPath)))
 
-    if not args.dry_run:
-        tempLeadInFile = 'temp-lead-in.mp3'
-        tempLeadInFileAdjusted = 'temp-lead-in_adjusted.mp3'
-        text_to_speech.textToSpeechUsingArgs(text=text, targetFile=tempLeadInFile, args=args)
-
-        # Adjust sample rate and mono/stereo
-        print('Detecting sample rate and channels')
-        detectionInfo = detectAudioData(inputPath)
-        if detectionInfo is None:
-            # We can't adjust
-            print('Detecting sample rate and channels failed -> Skipping adjustment')
-            tempLeadInFileAdjusted = tempLeadInFile
-        else:
-            print('Adjust sample rate to {} and channels to {}'.format(detectionInfo['sampleRate'], detectionInfo['channels']))
-            subprocess.call([ 'ffmpeg', '-i', tempLeadInFile, '-vn', '-ar', detectionInfo['sampleRate'], '-ac', detectionInfo['channels'], tempLeadInFileAdjusted ])
-
-        print('Concat')
-        subprocess.call([ 'ffmpeg', '-i', 'concat:{}|{}'.format(tempLeadInFileAdjusted, inputPath), '-acodec', 'copy', outputPath, '-map_metadata', '0:1' ])
-
-        os.remove(tempLeadInFile)
-        os.remove(tempLeadInFileAdjusted)
-        print('\n')
+    if args.dry_run:
+        plan.addSynthesis(text)
+        plan.add('ffmpeg:lead_in')
+        if args.post_process:
+            plan.add('ffmpeg:post_process')
+        plan.filesToWrite += 1
+        plan.bytesToCopy += os.path.getsize(inputPath)
+    else:
+        def createLeadIn():
+            with profiling.span('lead_in', file=os.path.basename(inputPath)) as span:
+                span.add_bytes(os.path.getsize(inputPath))
+                tempLeadInFile = 'temp-lead-in.mp3'
+                tempLeadInFileAdjusted = 'temp-lead-in_adjusted.mp3'
+                text_to_speech.textToSpeechUsingArgs(text=text, targetFile=tempLeadInFile, args=args)
+                audio_postprocess.processFileUsingArgs(tempLeadInFile, args)
+
+                with run_planner.timed('ffmpeg:lead_in'):
+                    # Adjust sample rate and mono/stereo
+                    print('Detecting sample rate and channels')
+                    detectionInfo = detectAudioData(inputPath)
+                    if detectionInfo is None:
+                        # We can't adjust
+                        print('Detecting sample rate and channels failed -> Skipping adjustment')
+                        tempLeadInFileAdjusted = tempLeadInFile
+                    else:
+                        print('Adjust sample rate to {} and channels to {}'.format(detectionInfo['sampleRate'], detectionInfo['channels']))
+                        subprocess.call([ tools.path('ffmpeg'), '-i', tempLeadInFile, '-vn', '-ar', detectionInfo['sampleRate'], '-ac', detectionInfo['channels'], tempLeadInFileAdjusted ])
+
+                    print('Concat')
+                    with profiling.span('lead_in_concat', 'ffmpeg'):
+                        subprocess.call([ tools.path('ffmpeg'), '-i', 'concat:{}|{}'.format(tempLeadInFileAdjusted, inputPath), '-acodec', 'copy', outputPath, '-map_metadata', '0:1' ])
+
+                os.remove(tempLeadInFile)
+                os.remove(tempLeadInFileAdjusted)
+                print('\n')
+        job.file_step(outputPath, createLeadIn)
 
 
 def detectAudioData(mp3File):
     try:
-        output = subprocess.check_output([ 'ffmpeg', '-i', mp3File, '-hide_banner' ], stderr=subprocess.STDOUT)
+        output = subprocess.check_output([ tools.path('ffmpeg'), '-i', mp3File, '-hide_banner' ], stderr=subprocess.STDOUT)
     except Exception as e:
         output = str(e.output)
 
@@ -124,4 +149,39 @@ if not os.path.exists(args.output) and not args.dry_run:
     if not os.path.isdir(outputParent):
         fail('Parent of output is no directory: ' + os.path.abspath(outputParent))
 
-addLeadInMessage(args.input, args.output)
+# Every created file is checkpointed, so an interrupted run continues where it stopped
+job = None
+if not args.dry_run:
+    jobQueue = job_queue.JobQueue()
+    job = jobQueue.resume_or_submit('lead_in', {
+        'input': os.path.abspath(args.input),
+        'output': os.path.abspath(args.output),
+        'lang': args.lang,
+        'engine': text_to_speech.engineNameUsingArgs(args),
+        'file_regex': args.file_regex,
+        'title_pattern': args.title_pattern,
+        'add_numbering': args.add_numbering,
+        'post_process': args.post_process,
+    }, title='Lead-in messages for ' + os.path.basename(os.path.abspath(args.input)))
+    if jobQueue.step_count(job.id):
+        print('Resuming interrupted run (job {})'.format(job.id))
+
+# What a dry run would do (see run_planner.py)
+text_to_speech.configureUsingArgs(args)
+plan = run_planner.RunPlan(text_to_speech.engineNameUsingArgs(args))
+
+try:
+    addLeadInMessage(args.input, args.output)
+except (text_to_speech.TextToSpeechError, polly_client.PollyError) as e:
+    tts_quota.printReport()
+    print('ERROR: {}\nRun the same command again to continue.'.format(e))
+    sys.exit(2)
+
+if args.dry_run:
+    print('\n' + plan.report(pricePerMillionChars=args.price_per_million_chars))
+    sys.exit(0)
+
+if job is not None:
+    jobQueue.finish(job.id)
+run_planner.saveHistory()
+tts_quota.printReport()
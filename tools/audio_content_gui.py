@@ -9,6 +9,8 @@ Features:
 - Delete content from both filesystem and database
 - Track file integrity using MD5 hashes
 - Synchronize database with actual files
+- Refresh content from its source folder (only added, changed and removed
+  source files are copied/converted again, track numbers stay stable)
 - Support for Audible AAX audiobooks with automatic conversion
 - Color-coded status indicators:
   * Green (✅ Synced): Files match database and hashes
@@ -25,8 +27,11 @@ AAX Support:
 - Supports activation bytes for DRM removal
 """
 
+import argparse
 import os
 import sys
+import copy
+import queue
 import csv
 import shutil
 import tkinter as tk
@@ -34,14 +39,39 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
 from typing import List, Optional, Dict, Tuple
 import threading
-import hashlib
 import json
 import subprocess
 import tempfile
+import time
+
+import adaptive_io
+import content_database
+import job_queue
+import layout_planner
+import log_sink
+import media_store
+import mp3_utils
+import profiling
+import tonuino_cache
+import tool_registry
+
+
+# Log messages are written to the log window in batches at most this often (seconds)
+LOG_FLUSH_INTERVAL = 0.1
+# Number of lines kept in the log window
+LOG_MAX_LINES = 2000
+
+LOG_STYLES = {
+    "ERROR": ("error", "❌ ERROR: "),
+    "SUCCESS": ("success", "✅ SUCCESS: "),
+    "WARNING": ("warning", "⚠️  WARNING: "),
+    "INFO": ("info", "ℹ️  INFO: "),
+}
 
 
 class TonUINOContentManager:
     def __init__(self, root):
+        start_time = time.monotonic()
         self.root = root
         self.root.title("TonUINO Audio Content Manager")
         self.root.geometry("800x700")
@@ -55,6 +85,17 @@ class TonUINOContentManager:
         
         # Database cache
         self.audio_database = {}
+        # Content list rows currently displayed: folder number -> (name, values, tag)
+        self.displayed_rows = {}
+        # Track diffs of the last verification: folder number -> diff
+        self.folder_diffs = {}
+        # Last verified status of a folder: folder -> (entry hash, status, tag, diff)
+        self.folder_status = {}
+        # Playtime/size totals of the folders (content_database.summarize_metadata): folder number -> totals
+        self.folder_stats = {}
+        self.hash_cache = content_database.HashCache()
+        # Track digest / folder hash -> folders, updated from the database as it changes
+        self.duplicate_index = content_database.DuplicateIndex()
         
         # Variables
         self.content_path = tk.StringVar()
@@ -62,19 +103,55 @@ class TonUINOContentManager:
         self.content_type = tk.StringVar(value="audiobook")
         self.folder_number = tk.StringVar()
         self.auto_folder = tk.BooleanVar(value=True)
+        self.split_long_files = tk.BooleanVar(value=False)
+        self.strip_tags = tk.BooleanVar(value=False)
+        self.keep_basic_tags = tk.BooleanVar(value=True)
+        self.segment_minutes = tk.StringVar(value=str(layout_planner.DEFAULT_SEGMENT_MINUTES))
         self.sd_dir_path = tk.StringVar(value=str(self.sd_card_dir))
+        self.media_store_path = tk.StringVar(value=os.environ.get('TONUINO_MEDIA_STORE', ''))
+        self.store = None
         self.activation_bytes = tk.StringVar()
+        # Copy for the job threads (Tk variables belong to the UI thread); the secret is never stored with a job
+        self.activation_secret = ''
+        self.activation_bytes.trace_add(
+            'write', lambda *args: setattr(self, 'activation_secret', self.activation_bytes.get().strip()))
         self.is_aax = False
         self.temp_dir = None
+        self.verify_results = queue.Queue()
+        self.verify_thread = None
+        self.verify_again = False
+        
+        # Imports run as durable jobs in the background (resumed after a restart)
+        self.jobs = job_queue.JobQueue()
+        self.job_events = queue.Queue()
+        self.job_runner = job_queue.JobRunner(self.jobs, {'import': self.run_import_job, 'refresh': self.run_refresh_job,
+                                                          'sync': self.run_sync_job},
+                                              on_event=self.on_job_event)
+        
+        # Log pipeline: messages are queued and written to the log window in batches,
+        # and mirrored to a rotating log file
+        self.log_sink = log_sink.LogSink(max_lines=LOG_MAX_LINES,
+                                         log_file=tonuino_cache.cache_dir() / "logs" / "audio_content_gui.log")
+        self.last_log_flush = 0.0
+        
+        # Probe external tools (ffmpeg, AAXtoMP3, ...) in the background
+        self.tools = tool_registry.get_registry()
+        self.tools.start_background_probe()
         
         # Setup UI first (needed for logging)
         self.setup_ui()
         self.update_next_folder()
         
-        # Load existing data after UI is ready
+        # Load existing data after UI is ready and show it right away (from the database only),
+        # the folders are verified in the background afterwards
         self.load_database()
+        self.refresh_content_list(verify=False)
+        self.root.after_idle(lambda: self.log(
+            f"Ready in {(time.monotonic() - start_time) * 1000:.0f} ms, verifying content in the background..."))
         self.verify_sync_silent()
-        self.refresh_content_list()
+        self.resume_jobs()
+        self.job_runner.start()
+        self.root.after(200, self.poll_job_events)
         
     def setup_ui(self):
         """Setup the user interface"""
@@ -108,19 +185,27 @@ class TonUINOContentManager:
         tree_frame.rowconfigure(0, weight=1)
         
         # Treeview for existing content
-        columns = ('Folder', 'Type', 'Tracks', 'Status')
+        columns = ('Folder', 'Type', 'Tracks', 'Duration', 'Bitrate', 'Format', 'Size', 'Status')
         self.content_tree = ttk.Treeview(tree_frame, columns=columns, show='tree headings', height=6)
         
         self.content_tree.heading('#0', text='Name')
         self.content_tree.heading('Folder', text='Folder')
         self.content_tree.heading('Type', text='Type')
         self.content_tree.heading('Tracks', text='Tracks')
+        self.content_tree.heading('Duration', text='Duration')
+        self.content_tree.heading('Bitrate', text='Bitrate')
+        self.content_tree.heading('Format', text='Format')
+        self.content_tree.heading('Size', text='Size')
         self.content_tree.heading('Status', text='Status')
         
         self.content_tree.column('#0', width=250)
         self.content_tree.column('Folder', width=60, anchor='center')
         self.content_tree.column('Type', width=80, anchor='center')
         self.content_tree.column('Tracks', width=60, anchor='center')
+        self.content_tree.column('Duration', width=70, anchor='e')
+        self.content_tree.column('Bitrate', width=75, anchor='e')
+        self.content_tree.column('Format', width=100, anchor='center')
+        self.content_tree.column('Size', width=75, anchor='e')
         self.content_tree.column('Status', width=100, anchor='center')
         
         # Scrollbar
@@ -128,15 +213,35 @@ class TonUINOContentManager:
         self.content_tree.configure(yscrollcommand=tree_scroll.set)
         
         self.content_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.content_tree.bind('<<TreeviewOpen>>', self.on_tree_open)
+        
+        # Status colors
+        self.content_tree.tag_configure('pending', foreground='gray')
+        self.content_tree.tag_configure('synced', foreground='green')
+        self.content_tree.tag_configure('modified', foreground='orange')
+        self.content_tree.tag_configure('mismatch', foreground='orange')
+        self.content_tree.tag_configure('not_in_db', foreground='red')
+        self.content_tree.tag_configure('error', foreground='red')
         tree_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
+        # Totals of all folders on the card
+        self.card_totals = tk.StringVar()
+        ttk.Label(tree_frame, textvariable=self.card_totals, foreground='gray').grid(row=1, column=0, sticky=tk.W)
+        
         # Buttons for content management
         content_button_frame = ttk.Frame(main_frame)
         content_button_frame.grid(row=row+1, column=0, columnspan=3, pady=5)
         
         ttk.Button(content_button_frame, text="Refresh", command=self.refresh_content_list).pack(side=tk.LEFT, padx=5)
         ttk.Button(content_button_frame, text="Delete Selected", command=self.delete_selected_content).pack(side=tk.LEFT, padx=5)
+        ttk.Button(content_button_frame, text="Quick Verify", 
+                  command=lambda: self.verify_sync(content_database.VERIFY_QUICK)).pack(side=tk.LEFT, padx=5)
         ttk.Button(content_button_frame, text="Verify Sync", command=self.verify_sync).pack(side=tk.LEFT, padx=5)
+        ttk.Button(content_button_frame, text="Sync Selected", command=self.sync_selected_content).pack(side=tk.LEFT, padx=5)
+        ttk.Button(content_button_frame, text="Refresh from Source", 
+                  command=self.refresh_from_source).pack(side=tk.LEFT, padx=5)
+        ttk.Button(content_button_frame, text="Add from Store", command=self.add_from_store).pack(side=tk.LEFT, padx=5)
+        ttk.Button(content_button_frame, text="Duplicates", command=self.show_duplicates).pack(side=tk.LEFT, padx=5)
         
         row += 2
         
@@ -230,6 +335,23 @@ class TonUINOContentManager:
             row=row, column=1, sticky=tk.W, pady=5, padx=(80, 0))
         row += 1
         
+        # Split long files
+        ttk.Checkbutton(main_frame, text="Split long files into segments of (minutes):", 
+                       variable=self.split_long_files).grid(
+            row=row, column=0, columnspan=2, sticky=tk.W, pady=5)
+        ttk.Entry(main_frame, textvariable=self.segment_minutes, width=6).grid(
+            row=row, column=1, sticky=tk.W, pady=5, padx=(280, 0))
+        row += 1
+        
+        # Tag stripping
+        ttk.Checkbutton(main_frame, text="Strip tags and cover art (faster track start)", 
+                       variable=self.strip_tags).grid(
+            row=row, column=0, columnspan=2, sticky=tk.W, pady=5)
+        ttk.Checkbutton(main_frame, text="Keep title/artist/album", 
+                       variable=self.keep_basic_tags).grid(
+            row=row, column=1, columnspan=2, sticky=tk.W, pady=5, padx=(280, 0))
+        row += 1
+        
         # SD card directory
         ttk.Label(main_frame, text="SD Card Dir:").grid(row=row, column=0, sticky=tk.W, pady=5)
         ttk.Entry(main_frame, textvariable=self.sd_dir_path, width=50).grid(
@@ -238,6 +360,14 @@ class TonUINOContentManager:
                   command=self.browse_sd_dir).grid(row=row, column=2, pady=5)
         row += 1
         
+        # Shared media store (optional)
+        ttk.Label(main_frame, text="Media Store:").grid(row=row, column=0, sticky=tk.W, pady=5)
+        ttk.Entry(main_frame, textvariable=self.media_store_path, width=50).grid(
+            row=row, column=1, sticky=(tk.W, tk.E), pady=5, padx=5)
+        ttk.Button(main_frame, text="Browse", 
+                  command=self.browse_media_store).grid(row=row, column=2, pady=5)
+        row += 1
+        
         # Separator
         ttk.Separator(main_frame, orient='horizontal').grid(
             row=row, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=10)
@@ -266,6 +396,12 @@ class TonUINOContentManager:
                           pady=5)
         main_frame.rowconfigure(row, weight=1)
         
+        self.log_text.tag_config("error", foreground="red")
+        self.log_text.tag_config("success", foreground="green")
+        self.log_text.tag_config("warning", foreground="orange")
+        self.log_text.tag_config("info", foreground="black")
+        self.root.after(int(LOG_FLUSH_INTERVAL * 1000), self.flush_log_timer)
+        
         # Configure styles
         self.setup_styles()
         
@@ -282,27 +418,40 @@ class TonUINOContentManager:
     
     def calculate_hash(self, filepath: Path) -> str:
         """Calculate MD5 hash of a file"""
-        hash_md5 = hashlib.md5()
-        try:
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception as e:
-            return ""
+        return content_database.calculate_hash(filepath)
     
     def calculate_folder_hash(self, folder: Path) -> str:
         """Calculate combined hash of all MP3 files in a folder"""
-        hash_md5 = hashlib.md5()
-        mp3_files = sorted(folder.glob("*.mp3"))
-        
-        for mp3_file in mp3_files:
-            # Include filename and file hash
-            hash_md5.update(mp3_file.name.encode())
-            file_hash = self.calculate_hash(mp3_file)
-            hash_md5.update(file_hash.encode())
-        
-        return hash_md5.hexdigest()
+        with profiling.span('hash_folder', 'hash', folder=folder.name):
+            fingerprints = content_database.scan_tracks(folder, self.hash_cache)
+            self.hash_cache.save()
+            return content_database.folder_hash_from_tracks(fingerprints)
+    
+    def check_folder(self, folder_num: str, folder: Path, 
+                     level: str = content_database.VERIFY_CACHED) -> Tuple[str, str, Optional[Dict]]:
+        """Determine the sync status of a folder: (status, tag, track diff)"""
+        if folder_num not in self.audio_database:
+            return "❌ Not in DB", 'not_in_db', None
+        
+        db_info = self.audio_database[folder_num]
+        if content_database.has_fingerprints(db_info):
+            diff = content_database.diff_tracks(db_info, folder, level, self.hash_cache)
+            self.hash_cache.save()
+            if not content_database.is_clean(diff):
+                return "⚠️ Modified", 'modified', diff
+        else:
+            # Entry from an older version without per-track fingerprints
+            diff = None
+            fingerprints = content_database.scan_tracks(folder, self.hash_cache, 
+                                                        full=level == content_database.VERIFY_FULL)
+            self.hash_cache.save()
+            if content_database.folder_hash_from_tracks(fingerprints) != db_info.get('hash', ''):
+                return "⚠️ Modified", 'modified', None
+        
+        db_track_count = db_info.get('track_count', len(db_info.get('tracks', [])))
+        if len(content_database.list_tracks(folder)) != db_track_count:
+            return "⚠️ Mismatch", 'mismatch', diff
+        return "✅ Synced", 'synced', diff
     
     def load_database(self):
         """Load audio content database from JSON file"""
@@ -323,65 +472,183 @@ class TonUINOContentManager:
         except Exception as e:
             self.log(f"Failed to save database: {e}", "ERROR")
     
-    def refresh_content_list(self):
-        """Refresh the content list display"""
-        # Clear existing items
-        for item in self.content_tree.get_children():
-            self.content_tree.delete(item)
+    def folder_row(self, folder_num: str, folder: Path) -> Tuple[str, tuple, str]:
+        """Content list row of a folder: (name, values, tag)
+        
+        Nothing is hashed here: the status is the last verified one as long as
+        the database entry didn't change since, "⏳ Checking" otherwise (see
+        verify_sync_silent).
+        """
+        self.folder_diffs.pop(folder_num, None)
+        
+        # Get info from database
+        if folder_num in self.audio_database:
+            db_info = self.audio_database[folder_num]
+            name = db_info['name']
+            content_type = db_info['type']
+            track_count = db_info.get('track_count', len(db_info.get('tracks', [])))
+            
+            verified = self.folder_status.get(folder_num)
+            if verified is not None and verified[0] == db_info.get('hash'):
+                _, status, tag, diff = verified
+                if diff is not None:
+                    self.folder_diffs[folder_num] = diff
+            else:
+                status, tag = "⏳ Checking", 'pending'
+        else:
+            track_count = len(content_database.list_tracks(folder))
+            name = f"Folder {folder_num}"
+            content_type = "unknown"
+            status = "❌ Not in DB"
+            tag = 'not_in_db'
         
+        return name, self.row_values(folder_num, content_type, track_count, status), tag
+    
+    def compute_folder_stats(self, folder: Path) -> Dict:
+        """Playtime and size totals of a folder (only new or changed files are read)"""
+        stats = content_database.summarize_metadata(content_database.folder_metadata(folder, self.hash_cache))
+        self.hash_cache.save()
+        return stats
+    
+    def row_values(self, folder_num: str, content_type: str, track_count: int, status: str) -> tuple:
+        """Column values of a folder row; playtime columns stay empty until the folder was scanned"""
+        stats = self.folder_stats.get(folder_num)
+        if stats is None:
+            return (folder_num, content_type, track_count, '', '', '', '', status)
+        return (folder_num, content_type, track_count) + self.audio_columns(stats) + (status,)
+    
+    def audio_columns(self, meta: Dict) -> tuple:
+        """Duration, bitrate, format and size columns of track metadata or folder totals"""
+        if meta.get('sample_rate'):
+            audio_format = f"{meta['sample_rate'] / 1000:g} kHz {'mono' if meta['channels'] == 1 else 'stereo'}"
+        else:
+            audio_format = "mixed" if meta.get('tracks') else ""
+        bitrate = f"{'~' if meta.get('vbr') else ''}{meta['bitrate']} kbps" if meta.get('bitrate') else ""
+        size = meta.get('size', 0)
+        return (content_database.format_duration(meta.get('duration', 0.0)), bitrate, audio_format,
+                f"{size / (1024 * 1024):.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.0f} KB")
+    
+    def update_card_totals(self):
+        """Show the totals of all scanned folders below the content list"""
+        stats = [self.folder_stats[f] for f in self.displayed_rows if f in self.folder_stats]
+        if not stats:
+            self.card_totals.set("")
+            return
+        duration = sum(s['duration'] for s in stats)
+        weighted = sum(s['bitrate'] * s['duration'] for s in stats)
+        pending = len(self.displayed_rows) - len(stats)
+        self.card_totals.set(
+            f"Card: {len(stats)} folder(s), {sum(s['tracks'] for s in stats)} tracks, "
+            f"{content_database.format_duration(duration)} playtime, "
+            f"{sum(s['size'] for s in stats) / (1024 * 1024):.1f} MB"
+            + (f", {round(weighted / duration)} kbps average" if duration else "")
+            + (f" ({pending} folder(s) still being scanned)" if pending else ""))
+    
+    def build_inventory(self) -> Dict[str, Tuple[str, tuple, str]]:
+        """Rows for all content folders of the SD card directory, keyed by folder number"""
         sd_dir = Path(self.sd_dir_path.get())
         if not sd_dir.exists():
-            return
+            return {}
         
         # Scan folders
         folders = sorted([d for d in sd_dir.iterdir() if d.is_dir() and d.name.isdigit() and len(d.name) == 2])
-        
-        for folder in folders:
-            folder_num = folder.name
-            mp3_files = list(folder.glob("*.mp3"))
-            track_count = len(mp3_files)
-            
-            # Get info from database
-            if folder_num in self.audio_database:
-                db_info = self.audio_database[folder_num]
-                name = db_info['name']
-                content_type = db_info['type']
-                db_track_count = db_info.get('track_count', len(db_info.get('tracks', [])))
-                
-                # Check sync status
-                folder_hash = self.calculate_folder_hash(folder)
-                stored_hash = db_info.get('hash', '')
-                
-                if folder_hash != stored_hash:
-                    status = "⚠️ Modified"
-                    tag = 'modified'
-                elif track_count != db_track_count:
-                    status = "⚠️ Mismatch"
-                    tag = 'mismatch'
-                else:
-                    status = "✅ Synced"
-                    tag = 'synced'
+        return {folder.name: self.folder_row(folder.name, folder) for folder in folders}
+    
+    def refresh_content_list(self, verify: bool = True):
+        """Refresh the content list display
+        
+        Status and track count come from the database; with verify, the
+        folders are checked again in the background (see verify_sync_silent).
+        Rows are keyed by folder number; only rows that changed are inserted,
+        updated or removed. Track rows are loaded when a folder is expanded.
+        """
+        inventory = self.build_inventory()
+        
+        for folder_num in set(self.displayed_rows) - set(inventory):
+            if self.content_tree.exists(folder_num):
+                self.content_tree.delete(folder_num)
+        
+        for index, folder_num in enumerate(sorted(inventory)):
+            row = inventory[folder_num]
+            if folder_num not in self.displayed_rows or not self.content_tree.exists(folder_num):
+                self.insert_row(folder_num, row, index)
             else:
-                name = f"Folder {folder_num}"
-                content_type = "unknown"
-                status = "❌ Not in DB"
-                tag = 'not_in_db'
-            
-            # Insert into treeview
-            item = self.content_tree.insert('', 'end', text=name, 
-                                           values=(folder_num, content_type, track_count, status),
-                                           tags=(tag,))
-        
-        # Configure tags
-        self.content_tree.tag_configure('synced', foreground='green')
-        self.content_tree.tag_configure('modified', foreground='orange')
-        self.content_tree.tag_configure('mismatch', foreground='orange')
-        self.content_tree.tag_configure('not_in_db', foreground='red')
+                if self.displayed_rows[folder_num] != row:
+                    self.update_row(folder_num, row)
+                if self.content_tree.index(folder_num) != index:
+                    self.content_tree.move(folder_num, '', index)
+        
+        self.displayed_rows = inventory
+        for folder_num in set(self.folder_stats) - set(inventory):
+            del self.folder_stats[folder_num]
+        self.update_card_totals()
+        if verify:
+            self.verify_sync_silent()
+    
+    def insert_row(self, folder_num: str, row: Tuple[str, tuple, str], index='end'):
+        """Insert a folder row with a placeholder child, so that it can be expanded"""
+        name, values, tag = row
+        self.content_tree.insert('', index, iid=folder_num, text=name, values=values, tags=(tag,))
+        self.content_tree.insert(folder_num, 'end', iid=f"{folder_num}/", text="...")
+    
+    def update_row(self, folder_num: str, row: Tuple[str, tuple, str]):
+        """Update a folder row in place, reloading its track rows if they were loaded"""
+        name, values, tag = row
+        self.content_tree.item(folder_num, text=name, values=values, tags=(tag,))
+        self.displayed_rows[folder_num] = row
+        children = self.content_tree.get_children(folder_num)
+        if children != (f"{folder_num}/",):
+            self.content_tree.delete(*children)
+            self.content_tree.insert(folder_num, 'end', iid=f"{folder_num}/", text="...")
+            if self.content_tree.item(folder_num, 'open'):
+                self.load_track_rows(folder_num)
     
-    def verify_sync(self):
+    def on_tree_open(self, event=None):
+        """Load the track rows of a folder when it is expanded"""
+        folder_num = self.content_tree.focus()
+        if folder_num in self.displayed_rows:
+            self.load_track_rows(folder_num)
+    
+    def load_track_rows(self, folder_num: str):
+        """Replace the placeholder child of a folder row by its tracks"""
+        placeholder = f"{folder_num}/"
+        if not self.content_tree.exists(placeholder):
+            return
+        self.content_tree.delete(placeholder)
+        
+        folder = Path(self.sd_dir_path.get()) / folder_num
+        db_tracks = {t['file']: t for t in self.audio_database.get(folder_num, {}).get('tracks', []) if 'file' in t}
+        diff = self.folder_diffs.get(folder_num)
+        changed = {t['file'] for t in diff['changed']} if diff else set()
+        added = {t['file'] for t in diff['added']} if diff else set()
+        
+        for index, track_file in enumerate(content_database.list_tracks(folder), start=1):
+            track = db_tracks.get(track_file.name, {})
+            meta = content_database.track_metadata(track_file, self.hash_cache)
+            if track_file.name in changed:
+                status, tag = "⚠️ Changed", 'modified'
+            elif track_file.name in added or (folder_num in self.audio_database and not track):
+                status, tag = "⚠️ Added", 'modified'
+            else:
+                status, tag = "", ''
+            self.content_tree.insert(folder_num, 'end', iid=f"{folder_num}/{track_file.name}",
+                                     text=track.get('name', track_file.stem),
+                                     values=('', '', f"{index:03d}") + self.audio_columns(meta) + (status,),
+                                     tags=(tag,))
+        self.hash_cache.save()
+    
+    def selected_folder(self) -> Optional[str]:
+        """Folder number of the selected row (track rows select their folder)"""
+        selection = self.content_tree.selection()
+        if not selection:
+            return None
+        return selection[0].split('/')[0]
+    
+    def verify_sync(self, level: str = content_database.VERIFY_FULL):
         """Verify synchronization between files and database"""
         self.log("=" * 60)
-        self.log("Verifying synchronization...")
+        self.log(f"Verifying synchronization ({level})...")
+        start_time = time.monotonic()
         
         sd_dir = Path(self.sd_dir_path.get())
         if not sd_dir.exists():
@@ -396,63 +663,288 @@ class TonUINOContentManager:
         
         for folder in folders:
             folder_num = folder.name
-            folder_hash = self.calculate_folder_hash(folder)
-            
+            status, tag, diff = self.check_folder(folder_num, folder, level)
             if folder_num in self.audio_database:
-                stored_hash = self.audio_database[folder_num].get('hash', '')
-                if folder_hash == stored_hash:
-                    synced += 1
-                else:
-                    modified += 1
-                    self.log(f"Folder {folder_num}: Modified", "WARNING")
-            else:
+                self.folder_status[folder_num] = (self.audio_database[folder_num].get('hash'), status, tag, diff)
+            
+            if tag == 'synced':
+                synced += 1
+            elif tag == 'not_in_db':
                 not_in_db += 1
                 self.log(f"Folder {folder_num}: Not in database", "ERROR")
+            else:
+                modified += 1
+                details = content_database.describe_diff(diff) if diff else "folder hash differs"
+                self.log(f"Folder {folder_num}: Modified - {details}", "WARNING")
         
-        self.log(f"Synced: {synced}, Modified: {modified}, Not in DB: {not_in_db}", "INFO")
+        self.log(f"Synced: {synced}, Modified: {modified}, Not in DB: {not_in_db} "
+                 f"({time.monotonic() - start_time:.1f}s)", "INFO")
         self.log("=" * 60)
         
-        self.refresh_content_list()
+        self.refresh_content_list(verify=False)
+    
+    def compute_folder_sync(self, db_info: Dict, folder: Path) -> Tuple[str, object]:
+        """Determine what syncing a folder would change, without modifying the database"""
+        with profiling.span('verify_folder', 'hash', folder=folder.name):
+            if not content_database.has_fingerprints(db_info):
+                # Older entries: fingerprint all tracks once
+                result = ('attach', content_database.scan_tracks(folder, self.hash_cache))
+            else:
+                result = ('diff', content_database.diff_tracks(db_info, folder, content_database.VERIFY_CACHED, 
+                                                               self.hash_cache))
+            self.hash_cache.save()
+        return result
+    
+    def apply_folder_sync(self, folder_num: str, result: Tuple[str, object]) -> Optional[Dict]:
+        """Apply the result of compute_folder_sync to the database entry (returns the diff)"""
+        db_info = self.audio_database[folder_num]
+        kind, data = result
+        track_name = lambda i, count: self.track_name(db_info['name'], db_info['type'], i, count)
+        if kind == 'attach':
+            content_database.attach_fingerprints(db_info, data, track_name)
+            return None
+        if not content_database.is_clean(data) or data['touched']:
+            content_database.apply_diff(db_info, data, track_name)
+        return data
+    
+    def sync_folder(self, folder_num: str, folder: Path) -> Optional[Dict]:
+        """Update the database entry of a folder for the tracks that changed (returns the diff)"""
+        return self.apply_folder_sync(folder_num, self.compute_folder_sync(self.audio_database[folder_num], folder))
     
     def verify_sync_silent(self):
-        """Verify synchronization without logging (for startup)"""
+        """Verify synchronization without logging (for startup)
+        
+        The folders are fingerprinted in a background thread; the database and
+        the rows of the content list are updated on the UI thread as the
+        results arrive (see poll_verify_results). If a verification is already
+        running, another one follows when it has finished.
+        """
         sd_dir = Path(self.sd_dir_path.get())
         if not sd_dir.exists():
             return
+        if self.verify_thread and self.verify_thread.is_alive():
+            self.verify_again = True
+            return
         
         folders = sorted([d for d in sd_dir.iterdir() if d.is_dir() and d.name.isdigit() and len(d.name) == 2])
+        # Snapshot of the entries so that the worker never reads the database while the UI changes it
+        entries = {f.name: copy.deepcopy(self.audio_database[f.name]) for f in folders if f.name in self.audio_database}
+        
+        def worker():
+            start_time = time.monotonic()
+            for folder in folders:
+                if folder.name in entries:
+                    entry = entries[folder.name]
+                    try:
+                        result = self.compute_folder_sync(entry, folder)
+                        stats = self.compute_folder_stats(folder)
+                    except OSError as e:
+                        result, stats = ('error', str(e)), None
+                    self.verify_results.put((folder.name, entry.get('hash'), result, stats))
+                else:
+                    # Not in the database: only the playtime columns can be filled in
+                    try:
+                        self.verify_results.put((folder.name, None, None, self.compute_folder_stats(folder)))
+                    except OSError:
+                        continue
+            self.verify_results.put((None, None, time.monotonic() - start_time, None))
+        
+        self.verify_thread = threading.Thread(target=worker, daemon=True)
+        self.verify_thread.start()
+        self.root.after(50, self.poll_verify_results)
+    
+    def poll_verify_results(self):
+        """Apply background verification results to the database and the content list"""
+        try:
+            while True:
+                folder_num, snapshot_hash, result, stats = self.verify_results.get_nowait()
+                if folder_num is None:
+                    self.save_database()
+                    self.log(f"Background verification finished in {result:.1f}s")
+                    if self.verify_again:
+                        self.verify_again = False
+                        self.verify_sync_silent()
+                    return
+                if result is None:
+                    self.folder_stats[folder_num] = stats
+                    row = self.displayed_rows.get(folder_num)
+                    if row is not None and folder_num not in self.audio_database:
+                        name, values, tag = row
+                        self.update_row(folder_num, (name, self.row_values(folder_num, values[1], values[2], values[-1]), tag))
+                        self.update_card_totals()
+                    continue
+                # Folders that were changed (e.g. re-added or deleted) in the meantime are checked again
+                db_info = self.audio_database.get(folder_num)
+                if db_info is None or db_info.get('hash') != snapshot_hash:
+                    self.verify_again = True
+                    continue
+                if result[0] == 'error':
+                    self.log(f"Folder {folder_num} could not be verified: {result[1]}", "WARNING")
+                    status, tag, diff = "❓ Unknown", 'error', None
+                else:
+                    diff = self.apply_folder_sync(folder_num, result)
+                    self.folder_stats[folder_num] = stats
+                    if diff is not None and not content_database.is_clean(diff):
+                        # The database now has the new fingerprints, the row shows what changed
+                        status, tag = "⚠️ Modified", 'modified'
+                    elif stats['tracks'] != db_info['track_count']:
+                        status, tag = "⚠️ Mismatch", 'mismatch'
+                    else:
+                        status, tag = "✅ Synced", 'synced'
+                self.folder_status[folder_num] = (db_info.get('hash'), status, tag, diff)
+                if folder_num in self.displayed_rows:
+                    self.update_row(folder_num, self.folder_row(folder_num, Path(self.sd_dir_path.get()) / folder_num))
+                    self.update_card_totals()
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_verify_results)
+    
+    def sync_selected_content(self):
+        """Accept the current files of the selected folder, updating only the changed tracks"""
+        folder_num = self.selected_folder()
+        if not folder_num:
+            messagebox.showwarning("No Selection", "Please select content to sync")
+            return
         
-        for folder in folders:
-            folder_num = folder.name
-            folder_hash = self.calculate_folder_hash(folder)
-            mp3_files = list(folder.glob("*.mp3"))
-            
-            # Update hash if folder is in database but hash is missing/wrong
-            if folder_num in self.audio_database:
-                db_info = self.audio_database[folder_num]
-                if db_info.get('hash') != folder_hash:
-                    db_info['hash'] = folder_hash
-                    db_info['track_count'] = len(mp3_files)
+        if folder_num not in self.audio_database:
+            self.log(f"Folder {folder_num} is not in the database - add it via 'Add Content'", "WARNING")
+            return
         
+        params = {
+            'folder': folder_num,
+            'sd_dir': self.sd_dir_path.get(),
+            'entry': copy.deepcopy(self.audio_database[folder_num]),
+            'media_store': self.media_store_path.get().strip(),
+        }
+        job_id = self.jobs.submit('sync', params, title=f"Sync {self.audio_database[folder_num]['name']} ({folder_num})")
+        self.job_runner.notify()
+        self.log(f"Sync of folder {folder_num} queued as job {job_id}")
+    
+    def run_sync_job(self, job: job_queue.JobContext) -> Dict:
+        """Fingerprint the changed tracks of a folder and move them into the media store (job worker thread)"""
+        params = job.params
+        folder = Path(params['sd_dir']) / params['folder']
+        kind, data = job.step('check', lambda: self.compute_folder_sync(params['entry'], folder), resource=job_queue.IO)
+        
+        def store():
+            self.store_folder(params['media_store'], folder, data if kind == 'attach' else data['added'] + data['changed'])
+            return data
+        if params.get('media_store'):
+            data = job.step('store', store, resource=job_queue.IO)
+        return {'folder': params['folder'], 'kind': kind, 'data': data}
+    
+    def apply_sync_result(self, job: Dict, result: Dict):
+        """Write the result of a completed sync job to the database"""
+        folder_num = result['folder']
+        self.jobs.finish(job['id'])
+        if folder_num not in self.audio_database:
+            self.log(f"Folder {folder_num} was removed from the database during the sync", "WARNING")
+            return
+        diff = self.apply_folder_sync(folder_num, (result['kind'], result['data']))
         self.save_database()
+        store = self.get_media_store(job['params'].get('media_store', ''))
+        if store is not None:
+            store.record_title(Path(job['params']['sd_dir']), folder_num, self.audio_database[folder_num])
+        if diff is None:
+            self.log(f"Folder {folder_num}: stored fingerprints for all tracks", "SUCCESS")
+        else:
+            self.log(f"Folder {folder_num}: {content_database.describe_diff(diff)}", "SUCCESS")
+        self.refresh_content_list()
+    
+    def show_duplicates(self):
+        """Log folders and files that are stored more than once on the card"""
+        self.duplicate_index.sync(self.audio_database)
+        folder_groups = self.duplicate_index.duplicate_folders()
+        file_groups = self.duplicate_index.duplicate_files()
+        
+        self.log("=" * 60)
+        self.log("Duplicate content report")
+        self.log("=" * 60)
+        wasted = 0
+        for group in folder_groups:
+            entry = self.audio_database[group[0]]
+            size = sum(t.get('size', 0) for t in entry.get('tracks', []))
+            wasted += size * (len(group) - 1)
+            self.log(f"Identical folders {', '.join(group)}: {entry['name']} "
+                     f"({size / (1024 * 1024):.1f} MB each)", "WARNING")
+        for digest, locations in file_groups.items():
+            folder, name = locations[0]
+            size = next((t.get('size', 0) for t in self.audio_database[folder]['tracks'] if t['file'] == name), 0)
+            wasted += size * (len(locations) - 1)
+            self.log(f"Identical files: {', '.join(f'{f}/{n}' for f, n in locations)}", "WARNING")
+        if not folder_groups and not file_groups:
+            self.log("No duplicates found", "SUCCESS")
+        else:
+            self.log(f"{len(folder_groups)} duplicate folder group(s), {len(file_groups)} duplicate file group(s), "
+                     f"{wasted / (1024 * 1024):.1f} MB could be saved. A duplicate folder can be removed "
+                     f"and its RFID cards configured for the remaining folder instead.")
+        self.log("=" * 60)
+    
+    def ask_duplicates(self, job: Dict, digests: List[str]):
+        """Continue or cancel an import job that waits for the duplicate check"""
+        if self.check_duplicate_import(digests, job['params']['folder']):
+            self.jobs.update_params(job['id'], check_duplicates=False)
+            self.job_runner.notify()
+        else:
+            self.jobs.cancel(job['id'])
+    
+    def check_duplicate_import(self, digests: List[str], folder_num: int) -> bool:
+        """Warn if the files to import (their digests, computed by the import job) are already
+        on the card (or in the media store)
+        
+        Returns False if the import should not go ahead.
+        """
+        self.duplicate_index.sync(self.audio_database)
+        
+        existing = self.duplicate_index.find_folder(digests)
+        if existing is not None:
+            name = self.audio_database[existing]['name']
+            self.log(f"The same content is already in folder {existing} ({name})", "WARNING")
+            result = messagebox.askyesnocancel(
+                "Duplicate Content",
+                f"The same content is already on the card in folder {existing} ({name}).\n\n"
+                f"Yes: use folder {existing} (nothing is copied)\n"
+                f"No: import a second copy\n"
+                f"Cancel: cancel the import"
+            )
+            if result is None:
+                self.log("Operation cancelled by user", "WARNING")
+                return False
+            if result:
+                self.log(f"Nothing copied - configure the RFID card for folder {existing}", "SUCCESS")
+                return False
+            return True
+        
+        store = self.get_media_store()
+        title_id = store.find_title(digests) if store is not None else None
+        if title_id is not None:
+            title = store.catalogue['titles'][title_id]
+            if messagebox.askyesno(
+                    "Content in Media Store",
+                    f"The same content is already in the media store ({title['name']}).\n\n"
+                    f"Link it from the store instead of copying?"):
+                self.add_title_from_store(title_id, folder_num)
+                return False
+            return True
+        
+        on_card = [locations[0] for locations in map(self.duplicate_index.locations, digests) if locations]
+        if on_card:
+            self.log(f"{len(on_card)} of {len(digests)} file(s) are already on the card: "
+                     f"{', '.join(f'{f}/{n}' for f, n in on_card[:5])}{', ...' if len(on_card) > 5 else ''}",
+                     "WARNING")
+        return True
     
     def delete_selected_content(self):
         """Delete selected content from both filesystem and database"""
         self.log("Delete button clicked", "INFO")
         
-        selection = self.content_tree.selection()
-        if not selection:
+        folder_num = self.selected_folder()
+        if not folder_num:
             self.log("No item selected", "WARNING")
             messagebox.showwarning("No Selection", "Please select content to delete")
             return
         
-        self.log(f"Selection: {selection}", "INFO")
-        
-        item = self.content_tree.item(selection[0])
-        self.log(f"Item data: {item}", "INFO")
-        
-        folder_num = str(item['values'][0])  # Ensure it's a string
-        name = item['text']
+        name = self.content_tree.item(folder_num)['text']
         
         self.log(f"Folder: {folder_num}, Name: {name}", "INFO")
         
@@ -484,6 +976,8 @@ class TonUINOContentManager:
             if folder_num in self.audio_database:
                 del self.audio_database[folder_num]
                 self.save_database()
+                if self.get_media_store() is not None:
+                    self.get_media_store().forget_folder(sd_dir, folder_num)
                 self.log(f"Removed {folder_num} from database", "SUCCESS")
             else:
                 self.log(f"Folder {folder_num} not found in database", "WARNING")
@@ -540,6 +1034,112 @@ class TonUINOContentManager:
             self.sd_card_dir = Path(folder)
             self.update_next_folder()
             
+    def browse_media_store(self):
+        """Browse for the shared media store directory"""
+        folder = filedialog.askdirectory(title="Select Media Store Directory")
+        if folder:
+            self.media_store_path.set(folder)
+            
+    def get_media_store(self, path: Optional[str] = None) -> Optional[media_store.MediaStore]:
+        """The shared media store (the configured one unless path is given), or None if there is none"""
+        path = (self.media_store_path.get() if path is None else path).strip()
+        if not path:
+            return None
+        if self.store is None or self.store.root != Path(path):
+            self.store = media_store.MediaStore(Path(path))
+        return self.store
+    
+    def store_folder(self, store_path: str, folder: Path, fingerprints: List[Dict]) -> List[Dict]:
+        """Move files of a card folder into the media store (they become links to the blobs)
+        
+        Runs as a job step, since the files are copied when the store is on
+        another filesystem. Returns the fingerprints with updated mtimes.
+        """
+        store = media_store.MediaStore(Path(store_path))
+        for fingerprint in fingerprints:
+            path = folder / fingerprint['file']
+            store.adopt(path, fingerprint['md5'])
+            # The file may now be a link to an existing blob: same content, new mtime
+            stat = path.stat()
+            self.hash_cache.store(path, stat, md5=fingerprint['md5'], quick=fingerprint['quick'])
+            fingerprint['mtime'] = stat.st_mtime
+        self.hash_cache.save()
+        return fingerprints
+    
+    def add_from_store(self):
+        """Add a title from the media store (e.g. one that is already on another card)"""
+        store = self.get_media_store()
+        if store is None:
+            messagebox.showwarning("No Media Store", "Please select a media store directory first")
+            return
+        titles = store.titles()
+        if not titles:
+            messagebox.showinfo("Media Store", "The media store contains no titles yet")
+            return
+        
+        ordered = sorted(titles.items(), key=lambda item: item[1]['name'].lower())
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Add from Media Store")
+        dialog.transient(self.root)
+        listbox = tk.Listbox(dialog, width=70, height=15)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for title_id, title in ordered:
+            cards = ', '.join(f"{Path(loc['card']).name}/{loc['folder']}" for loc in store.title_locations(title_id))
+            listbox.insert(tk.END, f"{title['name']} ({title['type']}, {len(title['tracks'])} tracks)"
+                                   f"{' - on ' + cards if cards else ''}")
+        
+        def on_add():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            dialog.destroy()
+            self.add_title_from_store(ordered[selection[0]][0], int(self.folder_number.get()))
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=(0, 10))
+        ttk.Button(button_frame, text="Add", command=on_add).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def add_title_from_store(self, title_id: str, folder_num: int) -> bool:
+        """Create a card folder for a catalogued title by linking its blobs (no copying, no hashing)"""
+        store = self.get_media_store()
+        title = store.catalogue['titles'][title_id]
+        sd_dir = Path(self.sd_dir_path.get())
+        folder_str = f"{folder_num:02d}"
+        folder = sd_dir / folder_str
+        
+        if folder.exists():
+            if not messagebox.askyesno("Folder Exists",
+                                       f"Folder {folder_str} already exists. Do you want to overwrite it?"):
+                self.log("Operation cancelled by user", "WARNING")
+                return False
+            shutil.rmtree(folder)
+            self.log(f"Removed existing folder {folder_str}", "WARNING")
+        
+        try:
+            methods = store.materialize_title(title_id, folder)
+        except OSError as e:
+            self.log(f"Failed to add {title['name']} from media store: {e}", "ERROR")
+            return False
+        
+        # Digests are known from the catalogue, only the new mtimes are needed
+        fingerprints = []
+        for track in title['tracks']:
+            path = folder / track['file']
+            stat = path.stat()
+            self.hash_cache.store(path, stat, md5=track['md5'], quick=track['quick'])
+            fingerprints.append(dict(track, size=stat.st_size, mtime=stat.st_mtime))
+        self.hash_cache.save()
+        
+        self.update_database(folder_num, title['type'], title['name'], fingerprints)
+        store.record_title(sd_dir, folder_str, self.audio_database[folder_str])
+        self.log(f"Added {title['name']} to folder {folder_str} from media store "
+                 f"({', '.join(f'{count} {method}' for method, count in sorted(methods.items()))})", "SUCCESS")
+        self.refresh_content_list()
+        if self.auto_folder.get():
+            self.update_next_folder()
+        return True
+            
     def toggle_folder_entry(self):
         """Enable/disable folder number entry based on auto-detect"""
         if self.auto_folder.get():
@@ -565,41 +1165,64 @@ class TonUINOContentManager:
                     folder_num = int(item.name)
                     if folder_num > max_folder:
                         max_folder = folder_num
+        
+        # Folders that queued imports will use
+        for job in self.jobs.jobs([job_queue.PENDING, job_queue.RUNNING, job_queue.WAITING], kind='import'):
+            if Path(job['params']['sd_dir']) != sd_dir:
+                continue
+            done, plans = self.jobs.step_result(job['id'], 'plan')
+            if done:
+                last_folder = plans[-1][0]
+            else:
+                sources = len(job['params']['mp3_files']) + len(job['params']['aax_files'])
+                last_folder = job['params']['folder'] + layout_planner.folders_needed(sources) - 1
+            max_folder = max(max_folder, last_folder)
                         
         return max_folder + 1
     
     def log(self, message: str, level: str = "INFO"):
-        """Add a message to the log"""
+        """Add a message to the log (may be called from any thread)
+        
+        Messages are queued and written to the log window in batches. When
+        called on the UI thread during a long running operation, the window
+        is updated at most every LOG_FLUSH_INTERVAL seconds.
+        """
+        self.log_sink.write(message, level)
+        
+        if threading.current_thread() is threading.main_thread() and \
+           time.monotonic() - self.last_log_flush >= LOG_FLUSH_INTERVAL:
+            self.flush_log()
+            self.root.update()
+    
+    def flush_log(self):
+        """Write all queued log messages to the log window"""
+        self.last_log_flush = time.monotonic()
+        batch = self.log_sink.drain()
+        if not batch:
+            return
+        
         self.log_text.config(state='normal')
+        for message, level in batch:
+            tag, prefix = LOG_STYLES.get(level, LOG_STYLES["INFO"])
+            self.log_text.insert(tk.END, prefix + message + "\n", tag)
+        
+        # Only keep the last LOG_MAX_LINES lines
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            self.log_text.delete('1.0', f"{line_count - LOG_MAX_LINES + 1}.0")
         
-        # Color coding
-        if level == "ERROR":
-            tag = "error"
-            prefix = "❌ ERROR: "
-        elif level == "SUCCESS":
-            tag = "success"
-            prefix = "✅ SUCCESS: "
-        elif level == "WARNING":
-            tag = "warning"
-            prefix = "⚠️  WARNING: "
-        else:
-            tag = "info"
-            prefix = "ℹ️  INFO: "
-            
-        self.log_text.insert(tk.END, prefix + message + "\n", tag)
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
-        
-        # Configure tags
-        self.log_text.tag_config("error", foreground="red")
-        self.log_text.tag_config("success", foreground="green")
-        self.log_text.tag_config("warning", foreground="orange")
-        self.log_text.tag_config("info", foreground="black")
-        
-        self.root.update()
+    
+    def flush_log_timer(self):
+        """Periodically flush messages logged while the UI was idle or from other threads"""
+        self.flush_log()
+        self.root.after(int(LOG_FLUSH_INTERVAL * 1000), self.flush_log_timer)
         
     def clear_log(self):
         """Clear the log"""
+        self.log_sink.drain()
+        self.log_sink.clear()
         self.log_text.config(state='normal')
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state='disabled')
@@ -669,6 +1292,15 @@ class TonUINOContentManager:
             self.log("Invalid folder number", "ERROR")
             return False
             
+        # Check segment length
+        if self.split_long_files.get():
+            try:
+                if float(self.segment_minutes.get()) < 1:
+                    raise ValueError()
+            except ValueError:
+                self.log("Segment length must be a number of minutes (at least 1)", "ERROR")
+                return False
+            
         # Check SD card directory
         sd_dir = Path(self.sd_dir_path.get())
         if not sd_dir.exists():
@@ -677,93 +1309,154 @@ class TonUINOContentManager:
             
         return True
         
-    def copy_mp3_files(self, source: Path, dest_folder: Path) -> int:
-        """Copy or convert audio files to destination folder"""
+    def collect_sources(self, source: Path) -> Tuple[List[Path], List[Path]]:
+        """Return the MP3 and AAX files to import from source"""
+        if source.is_file():
+            if source.suffix.lower() == '.aax':
+                return [], [source]
+            return [source], []
+        
+        # Directory - handle both MP3 and AAX files
+        mp3_files = sorted(list(source.glob("*.mp3")) + list(source.glob("*.MP3")))
+        aax_files = sorted(list(source.glob("*.aax")) + list(source.glob("*.AAX")))
+        return mp3_files, aax_files
+    
+    def plan_tracks(self, mp3_files: List[Path], split: bool = False,
+                    segment_minutes: float = layout_planner.DEFAULT_SEGMENT_MINUTES) -> List[layout_planner.PlannedTrack]:
+        """The tracks of mp3 files, with long files split into segments (if enabled)"""
+        if split:
+            if self.tools.available('ffprobe') and self.tools.available('ffmpeg'):
+                return layout_planner.split_sources(mp3_files, segment_minutes, log=self.log)
+            self.log("ffmpeg/ffprobe not found - long files are not split", "WARNING")
+        return [layout_planner.PlannedTrack(f) for f in mp3_files]
+    
+    def plan_content_layout(self, mp3_files: List[Path], first_folder: int, split: bool = False,
+                            segment_minutes: float = layout_planner.DEFAULT_SEGMENT_MINUTES) -> List[layout_planner.FolderPlan]:
+        """Split long files (if enabled) and spread the tracks over as many folders as needed"""
+        tracks = self.plan_tracks(mp3_files, split, segment_minutes)
+        plans = layout_planner.plan_layout(tracks, first_folder)
+        if len(plans) > 1:
+            self.log(f"{len(tracks)} tracks exceed the limit of {layout_planner.MAX_TRACKS_IN_FOLDER} "
+                     f"per folder - using folders {plans[0].folder:02d}-{plans[-1].folder:02d}", "WARNING")
+        return plans
+        
+    def copy_mp3_files(self, tracks: List[layout_planner.PlannedTrack], dest_folder: Path,
+                       strip: bool = False, keep_basic: bool = True, numbers: Optional[List[int]] = None) -> int:
+        """Copy planned tracks (whole files or segments) to destination folder
+        
+        The tracks become 001.mp3, 002.mp3, ... unless their track numbers are given.
+        The DFPlayer numbers tracks by their position in the folder, so a track that
+        can't be written fails the folder (JobError) rather than leaving a gap.
+        """
         dest_folder.mkdir(parents=True, exist_ok=True)
         
-        track_num = 1
-        copied_count = 0
+        totals = {'before': 0, 'after': 0, 'latency_saved': 0.0}
+        totals_lock = threading.Lock()
         
-        if source.is_file():
-            # Single file
-            if source.suffix.lower() == '.aax':
-                # Convert AAX to MP3
-                self.log(f"Converting AAX file: {source.name}")
-                converted_files = self.convert_aax_to_mp3(source)
-                if not converted_files:
-                    self.log("AAX conversion failed", "ERROR")
-                    return 0
-                # Copy converted files
-                for mp3_file in converted_files:
-                    dest_file = dest_folder / f"{track_num:03d}.mp3"
-                    shutil.copy2(mp3_file, dest_file)
-                    self.log(f"Copied: {mp3_file.name} -> {dest_file.name}")
-                    track_num += 1
-                    copied_count += 1
+        def copy_track(item, block_size: int):
+            # Runs in the worker threads of the I/O tuner; returns (written, bytes copied)
+            track_num, track = item
+            dest_file = dest_folder / f"{track_num:03d}.mp3"
+            
+            def copy_file(source: Path, dest: Path):
+                if not strip:
+                    adaptive_io.copy_file(source, dest, block_size)
+                    return
+                stats = mp3_utils.strip_tags_copy(source, dest, keep_basic_tags=keep_basic, block_size=block_size)
+                with totals_lock:
+                    for key in totals:
+                        totals[key] += stats[key]
+                if stats['before'] != stats['after']:
+                    self.log(f"Stripped tags: {source.name} {stats['before'] / 1024:.0f} KB -> "
+                             f"{stats['after'] / 1024:.0f} KB")
+            
+            with profiling.span('copy_track', 'copy', file=track.source.name, segment=track.is_segment) as span:
+                written = layout_planner.write_track(track, dest_file, copy_file, keep_metadata=not strip)
+                size = dest_file.stat().st_size if written else 0
+                span.add_bytes(size)
+            if not written:
+                self.log(f"Failed to write segment of {track.source.name}", "ERROR")
+            elif track.is_segment:
+                self.log(f"Segment: {track.source.name} [{track.start or 0:.0f}s-"
+                         f"{'end' if track.end is None else f'{track.end:.0f}s'}] -> {dest_file.name}")
             else:
-                # Regular MP3 file
-                dest_file = dest_folder / f"{track_num:03d}.mp3"
-                shutil.copy2(source, dest_file)
-                self.log(f"Copied: {source.name} -> {dest_file.name}")
-                copied_count = 1
-        else:
-            # Directory - handle both MP3 and AAX files
-            mp3_files = sorted(list(source.glob("*.mp3")) + list(source.glob("*.MP3")))
-            aax_files = sorted(list(source.glob("*.aax")) + list(source.glob("*.AAX")))
-            
-            # Convert AAX files first
-            for aax_file in aax_files:
-                self.log(f"Converting AAX file: {aax_file.name}")
-                converted_files = self.convert_aax_to_mp3(aax_file)
-                if converted_files:
-                    mp3_files.extend(sorted(converted_files))
-            
-            # Copy all MP3 files in sorted order
-            for mp3_file in sorted(mp3_files):
-                dest_file = dest_folder / f"{track_num:03d}.mp3"
-                shutil.copy2(mp3_file, dest_file)
-                self.log(f"Copied: {mp3_file.name} -> {dest_file.name}")
-                track_num += 1
-                copied_count += 1
+                self.log(f"Copied: {track.source.name} -> {dest_file.name}")
+            # Segments are cut by ffmpeg, their block size isn't ours to tune
+            return written, 0 if track.is_segment else size
+        
+        # Tracks are copied in parallel, as many at a time as the destination device handles well
+        tuner = adaptive_io.tuner_for(dest_folder)
+        items = list(zip(numbers or range(1, len(tracks) + 1), tracks))
+        results = tuner.map(copy_track, items)
+        copied_count = sum(1 for written in results if written)
+        self.log(f"Copy settings: {tuner.describe()}")
+        failed = [f"{number:03d}.mp3" for (number, _), written in zip(items, results) if not written]
+        if failed:
+            raise job_queue.JobError(f"Failed to write {len(failed)} track(s) of folder {dest_folder.name} "
+                                     f"({', '.join(failed)})")
+        
+        if strip and totals['before']:
+            saved = totals['before'] - totals['after']
+            self.log(f"Tag stripping saved {saved / (1024 * 1024):.1f} MB "
+                     f"({totals['before'] / (1024 * 1024):.1f} MB -> {totals['after'] / (1024 * 1024):.1f} MB), "
+                     f"estimated start latency saved: {totals['latency_saved'] * 1000:.0f} ms in total", "SUCCESS")
                 
         return copied_count
         
+    def track_name(self, content_name: str, content_type: str, index: int, track_count: int) -> str:
+        """Default display name of a track"""
+        if track_count == 1:
+            return content_name
+        elif content_type == "audiobook":
+            return f"{content_name} - Chapter {index}"
+        else:
+            return f"{content_name} - Track {index}"
+        
     def update_database(self, folder_num: int, content_type: str, 
-                       content_name: str, track_count: int, folder_hash: str):
-        """Update the database with content information"""
+                       content_name: str, fingerprints: List[Dict], source: Optional[Dict] = None,
+                       origins: Optional[List] = None, names: Optional[Dict[int, str]] = None):
+        """Update the database with content information
+        
+        source is the source record of the folder and origins the (source file,
+        part) of each track, see content_database. names overrides the default
+        names of some tracks (by track number).
+        """
         folder_str = f"{folder_num:02d}"
+        track_count = len(fingerprints)
         
         # Build track list
         tracks = []
-        for i in range(1, track_count + 1):
-            index_str = f"{i:03d}"
-            
-            if track_count == 1:
-                track_name = content_name
-            elif content_type == "audiobook":
-                track_name = f"{content_name} - Chapter {i}"
-            else:
-                track_name = f"{content_name} - Track {i}"
-            
-            tracks.append({
-                'index': index_str,
-                'name': track_name
-            })
+        for i, fingerprint in enumerate(fingerprints, start=1):
+            track = {
+                'index': f"{i:03d}",
+                'name': (names or {}).get(i) or self.track_name(content_name, content_type, i, track_count),
+                **fingerprint
+            }
+            if origins and i <= len(origins) and origins[i - 1][0] is not None:
+                track['source'], track['part'] = origins[i - 1]
+            tracks.append(track)
         
         # Update database entry
         self.audio_database[folder_str] = {
             'name': content_name,
             'type': content_type,
             'track_count': track_count,
-            'hash': folder_hash,
+            'hash': content_database.folder_hash_from_tracks(fingerprints),
             'tracks': tracks
         }
+        if source:
+            self.audio_database[folder_str]['source'] = source
         
         self.save_database()
         self.log(f"Updated database with {track_count} track(s)", "SUCCESS")
         
     def add_content(self):
-        """Main function to add content"""
+        """Main function to add content
+        
+        The import (AAX conversion, splitting, copying, fingerprinting) runs as
+        a job in the background, see run_import_job. Jobs are checkpointed and
+        resumed after a restart.
+        """
         # Validate inputs
         if not self.validate_inputs():
             return
@@ -779,7 +1472,6 @@ class TonUINOContentManager:
         sd_dir = Path(self.sd_dir_path.get())
         
         folder_str = f"{folder_num:02d}"
-        dest_folder = sd_dir / folder_str
         
         self.log("=" * 60)
         self.log("Starting content addition process...")
@@ -788,75 +1480,398 @@ class TonUINOContentManager:
         self.log(f"Folder: {folder_str}")
         self.log("=" * 60)
         
-        # Check if folder exists
-        if dest_folder.exists():
-            result = messagebox.askyesno(
-                "Folder Exists",
-                f"Folder {folder_str} already exists. Do you want to overwrite it?"
-            )
-            if not result:
-                self.log("Operation cancelled by user", "WARNING")
-                return
-            shutil.rmtree(dest_folder)
-            self.log(f"Removed existing folder {folder_str}", "WARNING")
-            
-        try:
-            # Copy/convert files
-            if self.is_aax or any(f.lower().endswith('.aax') for f in [content_path.name] if content_path.is_file()) or \
-               (content_path.is_dir() and any(f.suffix.lower() == '.aax' for f in content_path.glob('*'))):
-                self.log("Processing AAX files (converting to MP3)...")
-            else:
-                self.log("Copying MP3 files...")
-            
-            track_count = self.copy_mp3_files(content_path, dest_folder)
-            
-            if track_count == 0:
-                self.log("No audio files were processed", "ERROR")
-                self.cleanup_temp_files()
-                return
-                
-            self.log(f"Successfully processed {track_count} track(s)", "SUCCESS")
-            
-            # Calculate hash and update database
-            self.log("Calculating hash and updating database...")
-            folder_hash = self.calculate_folder_hash(dest_folder)
-            self.update_database(folder_num, content_type, content_name, track_count, folder_hash)
-            
-            # Clean up temporary files after successful copy
-            self.cleanup_temp_files()
+        mp3_files, aax_files = self.collect_sources(content_path)
+        if aax_files:
+            self.log("Processing AAX files (converting to MP3)...")
+        
+        params = {
+            'mp3_files': [str(f) for f in mp3_files],
+            'aax_files': [str(f) for f in aax_files],
+            'name': content_name,
+            'type': content_type,
+            'folder': folder_num,
+            'sd_dir': str(sd_dir),
+            'split': self.split_long_files.get(),
+            'segment_minutes': float(self.segment_minutes.get()) if self.split_long_files.get() else None,
+            'strip': self.strip_tags.get(),
+            'keep_basic': self.keep_basic_tags.get(),
+            'source': str(content_path.absolute()),
+            'media_store': self.media_store_path.get().strip(),
+            # Split or stripped files differ from the sources, there is nothing to compare then
+            'check_duplicates': not aax_files and not self.split_long_files.get() and not self.strip_tags.get(),
+        }
+        job_id = self.jobs.submit('import', params, title=f"Import {content_name} -> {folder_str}")
+        self.job_runner.notify()
+        self.log(f"Import queued as job {job_id} - it continues after a restart if interrupted")
+        
+        # Update next folder if auto-detect is on
+        if self.auto_folder.get():
+            self.update_next_folder()
+    
+    def run_import_job(self, job: job_queue.JobContext) -> Dict:
+        """Import content (runs in a job worker thread, every stage is a checkpointed step)"""
+        params = job.params
+        sd_dir = Path(params['sd_dir'])
+        
+        mp3_files = [Path(f) for f in params['mp3_files']]
+        # Source file of every mp3 file (the AAX file for converted chapters)
+        origin_of = {f: f for f in mp3_files}
+        for aax in params['aax_files']:
+            aax_file = Path(aax)
+            converted = job.step(f"convert:{aax_file.name}", lambda: [
+                str(f) for f in self.convert_aax_to_mp3(aax_file, job.work_dir / aax_file.stem,
+                                                        self.job_activation(aax_file))],
+                resource=job_queue.CPU)
+            if not converted:
+                raise job_queue.JobError(f"AAX conversion of {aax_file.name} failed")
+            mp3_files.extend(Path(f) for f in converted)
+            origin_of.update((Path(f), aax_file) for f in converted)
+        mp3_files.sort()
+        
+        # Remember the source files, so that the content can be refreshed from them later
+        source_files = []
+        if params.get('source'):
+            source_files = job.step('source', lambda: content_database.fingerprint_files(
+                [Path(f) for f in params['mp3_files'] + params['aax_files']], self.hash_cache), resource=job_queue.IO)
+            self.hash_cache.save()
+        if params.get('check_duplicates'):
+            # Decided on the UI thread (see ask_duplicates), which continues or cancels the job
+            self.log("Checking for duplicate content...")
+            job.wait('duplicates', [f['md5'] for f in source_files])
+        
+        def plan():
+            plans = self.plan_content_layout(mp3_files, params['folder'], params['split'],
+                                             params['segment_minutes'] or layout_planner.DEFAULT_SEGMENT_MINUTES)
+            return [[p.folder, [[str(t.source), t.start, t.end] for t in p.tracks]] for p in plans]
+        plans = [layout_planner.FolderPlan(folder, [layout_planner.PlannedTrack(Path(source), start, end)
+                                                    for source, start, end in tracks])
+                 for folder, tracks in job.step('plan', plan, resource=job_queue.CPU)]
+        
+        parts = {}
+        
+        # Existing folders are checked once - later the job's own folders exist
+        existing = job.step('existing', lambda: [
+            f"{p.folder:02d}" for p in plans if (sd_dir / f"{p.folder:02d}").exists()])
+        if existing and not params.get('overwrite'):
+            job.wait('overwrite', existing)
+        
+        folders = []
+        for part, plan in enumerate(plans, start=1):
+            folder_str = f"{plan.folder:02d}"
+            plan_folder = sd_dir / folder_str
+            origins = []
+            for track in plan.tracks:
+                name = origin_of.get(track.source, track.source).name
+                origins.append([name, parts.get(name, 0)])
+                parts[name] = parts.get(name, 0) + 1
             
-            # Refresh display
-            self.refresh_content_list()
+            def copy_folder():
+                if plan_folder.exists():
+                    shutil.rmtree(plan_folder)
+                    self.log(f"Removed existing folder {folder_str}", "WARNING")
+                try:
+                    with profiling.span('copy_folder', 'copy', folder=folder_str):
+                        return self.copy_mp3_files(plan.tracks, plan_folder, params['strip'], params['keep_basic'])
+                except job_queue.JobError:
+                    # Don't leave a folder with missing tracks on the card
+                    shutil.rmtree(plan_folder, ignore_errors=True)
+                    raise
+            if job.step(f"copy:{folder_str}", copy_folder, resource=job_queue.IO) == 0:
+                continue
             
-            # Success message
-            self.log("=" * 60)
-            self.log("Content added successfully!", "SUCCESS")
-            self.log("=" * 60)
-            self.log(f"Folder: {folder_str} ({dest_folder})")
-            self.log(f"Tracks: {track_count}")
-            self.log(f"Type: {content_type}")
-            self.log("")
-            self.log("Next steps:")
-            self.log("1. Copy sd-card folder contents to your SD card")
-            self.log(f"2. Use Admin Menu to create RFID card for folder {folder_str}")
-            self.log(f"3. Select playback mode '{content_type}' when configuring")
-            
-            # Update next folder if auto-detect is on
-            if self.auto_folder.get():
-                self.update_next_folder()
-                
-            messagebox.showinfo(
-                "Success",
-                f"Content added successfully!\n\n"
-                f"Folder: {folder_str}\n"
-                f"Tracks: {track_count}\n"
-                f"Type: {content_type}"
-            )
+            self.log(f"Calculating hash for folder {folder_str}...")
+            fingerprints = job.step(f"fingerprint:{folder_str}", lambda: content_database.scan_tracks(
+                plan_folder, self.hash_cache), resource=job_queue.IO)
+            self.hash_cache.save()
+            if params.get('media_store'):
+                fingerprints = job.step(f"store:{folder_str}", lambda: self.store_folder(
+                    params['media_store'], plan_folder, fingerprints), resource=job_queue.IO)
+            folder = {
+                'folder': plan.folder,
+                'name': params['name'] if len(plans) == 1 else f"{params['name']} ({part}/{len(plans)})",
+                'fingerprints': fingerprints,
+            }
+            if source_files:
+                used = {name for name, _ in origins}
+                folder['source'] = content_database.source_record(
+                    Path(params['source']), [f for f in source_files if f['file'] in used],
+                    {key: params[key] for key in ('split', 'segment_minutes', 'strip', 'keep_basic')})
+                folder['origins'] = origins
+            folders.append(folder)
+        
+        if not folders:
+            raise job_queue.JobError("No audio files were processed")
+        return {'folders': folders}
+    
+    def on_job_event(self, job_id: int, event: str, payload):
+        """Called by the job runner (from worker threads)"""
+        self.job_events.put((job_id, event, payload))
+    
+    def poll_job_events(self):
+        """Handle job results on the UI thread"""
+        try:
+            while True:
+                job_id, event, payload = self.job_events.get_nowait()
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                if event == 'completed':
+                    if job['kind'] == 'refresh':
+                        self.apply_refresh_result(job, payload)
+                    elif job['kind'] == 'sync':
+                        self.apply_sync_result(job, payload)
+                    else:
+                        self.apply_import_result(job, payload)
+                elif event == 'waiting' and payload['reason'] == 'duplicates':
+                    self.ask_duplicates(job, payload['payload'])
+                elif event == 'waiting':
+                    self.ask_overwrite(job, payload['payload'])
+                elif event == 'failed':
+                    self.log(f"{job['title']} failed: {payload}", "ERROR")
+                    self.log(f"Retry with: python3 job_queue.py retry {job_id}", "INFO")
+                    messagebox.showerror("Error", f"{job['title']} failed:\n\n{payload}")
+        except queue.Empty:
+            pass
+        self.root.after(200, self.poll_job_events)
+    
+    def ask_overwrite(self, job: Dict, existing: List[str]):
+        """Ask whether a waiting import job may overwrite existing folders"""
+        if messagebox.askyesno(
+                "Folder Exists",
+                f"{job['title']}: Folder(s) {', '.join(existing)} already exist. Do you want to overwrite them?"):
+            self.jobs.update_params(job['id'], overwrite=True)
+            self.job_runner.notify()
+        else:
+            self.jobs.cancel(job['id'])
+            self.log("Operation cancelled by user", "WARNING")
+    
+    def apply_import_result(self, job: Dict, result: Dict):
+        """Write the folders of a completed import job to the database"""
+        params = job['params']
+        sd_dir = Path(params['sd_dir'])
+        store = self.get_media_store(params.get('media_store', ''))
+        track_count = 0
+        for folder in result['folders']:
+            folder_str = f"{folder['folder']:02d}"
+            self.log(f"Updating database for folder {folder_str}...")
+            self.update_database(folder['folder'], params['type'], folder['name'], folder['fingerprints'],
+                                 folder.get('source'), folder.get('origins'))
+            if store is not None:
+                store.record_title(sd_dir, folder_str, self.audio_database[folder_str])
+            track_count += len(folder['fingerprints'])
+        self.jobs.finish(job['id'])
+        
+        self.log(f"Successfully processed {track_count} track(s)", "SUCCESS")
+        
+        # Refresh display
+        self.refresh_content_list()
+        
+        folders_str = ", ".join(f"{folder['folder']:02d}" for folder in result['folders'])
+        content_type = params['type']
+        
+        # Success message
+        self.log("=" * 60)
+        self.log("Content added successfully!", "SUCCESS")
+        self.log("=" * 60)
+        self.log(f"Folder: {folders_str} ({sd_dir})")
+        self.log(f"Tracks: {track_count}")
+        self.log(f"Type: {content_type}")
+        self.log("")
+        self.log("Next steps:")
+        self.log("1. Copy sd-card folder contents to your SD card")
+        self.log(f"2. Use Admin Menu to create RFID card for folder {folders_str}")
+        self.log(f"3. Select playback mode '{content_type}' when configuring")
+        
+        # Update next folder if auto-detect is on
+        if self.auto_folder.get():
+            self.update_next_folder()
             
-        except Exception as e:
-            self.log(f"Error occurred: {str(e)}", "ERROR")
-            self.cleanup_temp_files()
-            messagebox.showerror("Error", f"An error occurred:\n\n{str(e)}")
+        messagebox.showinfo(
+            "Success",
+            f"Content added successfully!\n\n"
+            f"Folder: {folders_str}\n"
+            f"Tracks: {track_count}\n"
+            f"Type: {content_type}"
+        )
+    
+    def refresh_from_source(self):
+        """Update the selected folder from its source folder (e.g. a fixed or extended album)
+        
+        Only source files that were added, changed or removed since the import
+        are copied/converted again; see run_refresh_job.
+        """
+        folder_num = self.selected_folder()
+        if not folder_num:
+            messagebox.showwarning("No Selection", "Please select content to refresh")
+            return
+        
+        entry = self.audio_database.get(folder_num)
+        if entry is None:
+            self.log(f"Folder {folder_num} is not in the database - add it via 'Add Content'", "WARNING")
+            return
+        if 'source' not in entry:
+            self.log(f"Folder {folder_num} was imported before sources were recorded - "
+                     f"import it once more to enable refreshing", "WARNING")
+            return
+        source = Path(entry['source']['path'])
+        if not source.exists():
+            self.log(f"Source of folder {folder_num} not found: {source}", "ERROR")
+            return
+        
+        params = {
+            'folder': folder_num,
+            'sd_dir': self.sd_dir_path.get(),
+            'entry': copy.deepcopy(entry),
+            'claimed': sorted(content_database.claimed_sources(self.audio_database, folder_num)),
+            'media_store': self.media_store_path.get().strip(),
+        }
+        job_id = self.jobs.submit('refresh', params, title=f"Refresh {entry['name']} ({folder_num}) from source")
+        self.job_runner.notify()
+        self.log(f"Refresh of folder {folder_num} from {source} queued as job {job_id}")
+    
+    def run_refresh_job(self, job: job_queue.JobContext) -> Dict:
+        """Bring a folder up to date with its source (runs in a job worker thread)
+        
+        Tracks of unchanged source files keep their files and numbers, see
+        layout_planner.plan_refresh.
+        """
+        params = job.params
+        entry = params['entry']
+        folder_str = params['folder']
+        folder = Path(params['sd_dir']) / folder_str
+        options = entry['source'].get('options', {})
+        
+        # The tracks are planned from the database entry, so it has to match the card
+        card_diff = job.step('check', lambda: content_database.diff_tracks(
+            entry, folder, content_database.VERIFY_CACHED, self.hash_cache), resource=job_queue.IO)
+        if not content_database.is_clean(card_diff):
+            raise job_queue.JobError(f"Folder {folder_str} differs from the database "
+                                     f"({content_database.describe_diff(card_diff)}) - use 'Sync Selected' first")
+        
+        self.log(f"Comparing folder {folder_str} with {entry['source']['path']}...")
+        diff = job.step('diff', lambda: content_database.diff_source(
+            entry, hash_cache=self.hash_cache, claimed=params['claimed']), resource=job_queue.IO)
+        self.hash_cache.save()
+        result = {'folder': folder_str, 'diff': diff, 'source': content_database.update_source(entry['source'], diff)}
+        if content_database.is_clean(diff):
+            return result
+        
+        source_path = Path(entry['source']['path'])
+        source_dir = source_path if source_path.is_dir() else source_path.parent
+        mp3_files = {}
+        for fingerprint in diff['changed'] + diff['added']:
+            path = source_dir / fingerprint['file']
+            if path.suffix.lower() != '.aax':
+                mp3_files[path.name] = [path]
+                continue
+            converted = job.step(f"convert:{path.name}", lambda: [
+                str(f) for f in self.convert_aax_to_mp3(path, job.work_dir / path.stem, self.job_activation(path))],
+                resource=job_queue.CPU)
+            if not converted:
+                raise job_queue.JobError(f"AAX conversion of {path.name} failed")
+            mp3_files[path.name] = sorted(Path(f) for f in converted)
+        
+        def plan():
+            outputs = {name: self.plan_tracks(files, options.get('split', False),
+                                              options.get('segment_minutes') or layout_planner.DEFAULT_SEGMENT_MINUTES)
+                       for name, files in mp3_files.items()}
+            origins = [(track.get('source'), track.get('part', 0)) for track in entry['tracks']]
+            refresh = layout_planner.plan_refresh(origins, outputs, {f['file'] for f in diff['removed']})
+            return {'writes': [[number, str(t.source), t.start, t.end] for number, t in refresh.writes],
+                    'moves': refresh.moves, 'deletes': refresh.deletes, 'origins': refresh.origins}
+        plan = job.step('plan', plan, resource=job_queue.CPU)
+        
+        def stage_moves():
+            # Renamed in two steps, as tracks may move up and down: first out of the way ...
+            for source, target in plan['moves']:
+                source_file = folder / f"{source:03d}.mp3"
+                if source_file.exists():
+                    os.replace(source_file, folder / f"{target:03d}.mp3.moving")
+        job.step(f"stage:{folder_str}", stage_moves, resource=job_queue.IO)
+        
+        def update_folder():
+            # ... then to the new number
+            for source, target in plan['moves']:
+                staged = folder / f"{target:03d}.mp3.moving"
+                if staged.exists():
+                    os.replace(staged, folder / f"{target:03d}.mp3")
+                    self.log(f"Renumbered: {source:03d}.mp3 -> {target:03d}.mp3")
+            for number in plan['deletes']:
+                (folder / f"{number:03d}.mp3").unlink(missing_ok=True)
+                self.log(f"Removed: {number:03d}.mp3")
+            writes = plan['writes']
+            with profiling.span('copy_folder', 'copy', folder=folder_str):
+                return self.copy_mp3_files([layout_planner.PlannedTrack(Path(source), start, end)
+                                            for _, source, start, end in writes],
+                                           folder, options.get('strip', False), options.get('keep_basic', True),
+                                           numbers=[number for number, *_ in writes])
+        job.step(f"update:{folder_str}", update_folder, resource=job_queue.IO)
+        
+        fingerprints = job.step(f"fingerprint:{folder_str}", lambda: content_database.scan_tracks(
+            folder, self.hash_cache), resource=job_queue.IO)
+        self.hash_cache.save()
+        if params.get('media_store'):
+            fingerprints = job.step(f"store:{folder_str}", lambda: self.store_folder(
+                params['media_store'], folder, fingerprints), resource=job_queue.IO)
+        return dict(result, fingerprints=fingerprints, origins=plan['origins'], moves=plan['moves'])
+    
+    def apply_refresh_result(self, job: Dict, result: Dict):
+        """Write the result of a completed refresh job to the database"""
+        folder_str = result['folder']
+        self.jobs.finish(job['id'])
+        entry = self.audio_database.get(folder_str)
+        if entry is None:
+            self.log(f"Folder {folder_str} was removed from the database during the refresh", "WARNING")
+            return
+        
+        self.log(f"Folder {folder_str} source: {content_database.describe_diff(result['diff'])}")
+        if 'fingerprints' not in result:
+            entry['source'] = result['source']
+            self.save_database()
+            self.log(f"Folder {folder_str} is up to date with its source", "SUCCESS")
+            return
+        
+        # Tracks made from the same part of the same source file keep their names (unless it's the default name)
+        names_by_origin = {(t.get('source'), t.get('part', 0)): t['name'] for t in entry['tracks'] if t.get('source') and
+                           t['name'] != self.track_name(entry['name'], entry['type'], int(t['index']), entry['track_count'])}
+        names = {i: names_by_origin.get(tuple(origin)) for i, origin in enumerate(result['origins'], start=1)}
+        self.update_database(int(folder_str), entry['type'], entry['name'], result['fingerprints'],
+                             result['source'], result['origins'], names)
+        store = self.get_media_store(job['params'].get('media_store', ''))
+        if store is not None:
+            store.record_title(Path(job['params']['sd_dir']), folder_str, self.audio_database[folder_str])
+        if result['moves']:
+            first = min(source for source, _ in result['moves'])
+            self.log(f"{len(result['moves'])} track(s) of folder {folder_str} from track {first} on got a new number - "
+                     f"check cards programmed for single tracks", "WARNING")
+        self.refresh_content_list()
+        self.log(f"Folder {folder_str} refreshed from source", "SUCCESS")
+    
+    def job_activation(self, aax_file: Path) -> str:
+        """Activation bytes for a job converting an AAX file, as currently entered
+        
+        Jobs don't keep them in their parameters (the job database is not a place for secrets),
+        so a job resumed after a restart needs them entered again.
+        """
+        if not self.activation_secret:
+            raise job_queue.JobError(f"Activation bytes required to convert {aax_file.name} - "
+                                     f"enter them and retry the job")
+        return self.activation_secret
+    
+    def resume_jobs(self):
+        """Pick up jobs of an earlier session (the runner resumes interrupted ones by itself)"""
+        for kind in ('import', 'refresh', 'sync'):
+            pending = self.jobs.jobs([job_queue.PENDING, job_queue.RUNNING], kind=kind)
+            if pending:
+                self.log(f"Resuming {len(pending)} interrupted {kind} job(s): "
+                         f"{', '.join(job['title'] for job in pending)}", "WARNING")
+            for job in self.jobs.jobs([job_queue.COMPLETED], kind=kind):
+                self.job_events.put((job['id'], 'completed', job['result']))
+            failed = self.jobs.jobs([job_queue.FAILED], kind=kind)
+            if failed:
+                self.log(f"{len(failed)} {kind} job(s) failed earlier - see 'python3 job_queue.py list'", "WARNING")
+        for job in self.jobs.jobs([job_queue.WAITING], kind='import'):
+            self.job_events.put((job['id'], 'waiting', job['waiting']))
     
     def check_aax_file(self, filepath: str):
         """Check if file is AAX and show activation bytes field"""
@@ -882,27 +1897,16 @@ class TonUINOContentManager:
     
     def check_aax_converter(self) -> Optional[str]:
         """Check if AAX converter is available and return the command"""
-        converters = [
-            'AAXtoMP3',
-            'ffmpeg'
-        ]
-        
-        for converter in converters:
-            try:
-                result = subprocess.run([converter, '-version'], 
-                                       capture_output=True, 
-                                       text=True, 
-                                       timeout=5)
-                if result.returncode == 0 or converter == 'ffmpeg':
-                    self.log(f"Found converter: {converter}")
-                    return converter
-            except (FileNotFoundError, subprocess.TimeoutExpired):
-                continue
+        for converter in ('AAXtoMP3', 'ffmpeg'):
+            if self.tools.available(converter):
+                self.log(f"Found converter: {converter} ({self.tools.version(converter)})")
+                return converter
         
         return None
     
-    def convert_aax_to_mp3(self, aax_file: Path) -> List[Path]:
-        """Convert AAX file to MP3 using available converter"""
+    def convert_aax_to_mp3(self, aax_file: Path, output_dir: Optional[Path] = None,
+                           activation: Optional[str] = None) -> List[Path]:
+        """Convert AAX file to MP3 using available converter (into output_dir, default: a temporary directory)"""
         converter = self.check_aax_converter()
         
         if not converter:
@@ -911,12 +1915,16 @@ class TonUINOContentManager:
             self.log("FFmpeg: https://ffmpeg.org/download.html", "INFO")
             return []
         
-        # Create temporary directory for conversion
-        if not self.temp_dir:
-            self.temp_dir = tempfile.mkdtemp(prefix="tonuino_aax_")
+        if output_dir is None:
+            # Create temporary directory for conversion
+            if not self.temp_dir:
+                self.temp_dir = tempfile.mkdtemp(prefix="tonuino_aax_")
+            output_dir = Path(self.temp_dir)
         
-        temp_path = Path(self.temp_dir)
-        activation = self.activation_bytes.get().strip()
+        temp_path = Path(output_dir)
+        temp_path.mkdir(parents=True, exist_ok=True)
+        if activation is None:
+            activation = self.activation_bytes.get().strip()
         
         self.log(f"Converting {aax_file.name} with {converter}...")
         self.log("This may take several minutes depending on file size...")
@@ -925,7 +1933,7 @@ class TonUINOContentManager:
             if converter == 'AAXtoMP3':
                 # Use AAXtoMP3 converter
                 cmd = [
-                    'AAXtoMP3',
+                    self.tools.path('AAXtoMP3'),
                     '-A', activation,
                     '-e:mp3',
                     '-o', str(temp_path),
@@ -935,7 +1943,7 @@ class TonUINOContentManager:
                 # Use ffmpeg for conversion
                 output_file = temp_path / f"{aax_file.stem}.mp3"
                 cmd = [
-                    'ffmpeg',
+                    self.tools.path('ffmpeg'),
                     '-activation_bytes', activation,
                     '-i', str(aax_file),
                     '-vn',  # No video
@@ -945,10 +1953,12 @@ class TonUINOContentManager:
                 ]
             
             # Run conversion
-            result = subprocess.run(cmd, 
-                                   capture_output=True, 
-                                   text=True, 
-                                   timeout=3600)  # 1 hour timeout
+            with profiling.span('aax_convert', converter, file=aax_file.name) as span:
+                span.add_bytes(aax_file.stat().st_size)
+                result = subprocess.run(cmd, 
+                                       capture_output=True, 
+                                       text=True, 
+                                       timeout=3600)  # 1 hour timeout
             
             if result.returncode != 0:
                 self.log(f"Conversion failed: {result.stderr}", "ERROR")
@@ -984,11 +1994,16 @@ class TonUINOContentManager:
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="TonUINO Audio Content Manager")
+    profiling.add_profile_argument(parser)
+    profiling.enable_from_args(parser.parse_args())
+    
     root = tk.Tk()
     app = TonUINOContentManager(root)
     
     # Cleanup on exit
     def on_closing():
+        app.job_runner.stop()
         app.cleanup_temp_files()
         root.destroy()
     
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Post-processing of generated voice prompts
+Trims leading/trailing silence and normalizes the loudness of mp3 files
+created by the text-to-speech engines, so that every prompt starts right
+away and all engines sound equally loud.
+
+Uses ffmpeg (silenceremove + two-pass loudnorm). The loudness measurement of
+each input file is cached by content digest, and processed outputs are
+remembered as well, so re-running a generation skips files that are
+already done.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+import profiling
+import prompt_encoding
+import run_planner
+import tool_registry
+from tonuino_cache import JsonCache
+
+
+DEFAULT_TARGET_LUFS = -16.0
+DEFAULT_TRUE_PEAK = -1.5
+DEFAULT_LRA = 11.0
+DEFAULT_SILENCE_THRESHOLD = -50.0
+# Silence kept at the start/end of a prompt (seconds)
+KEEP_SILENCE = 0.05
+
+_measurements = JsonCache('audio_measurements')
+
+
+def addArgumentsToArgparser(argparser):
+    argparser.add_argument('--post-process', action='store_true', help='If set, leading/trailing silence is trimmed and the loudness is normalized (requires ffmpeg).')
+    argparser.add_argument('--target-lufs', type=float, default=DEFAULT_TARGET_LUFS, help='Target loudness for `--post-process` in LUFS (default: {})'.format(DEFAULT_TARGET_LUFS))
+    argparser.add_argument('--silence-threshold', type=float, default=DEFAULT_SILENCE_THRESHOLD, help='Level in dB below which audio counts as silence for `--post-process` (default: {})'.format(DEFAULT_SILENCE_THRESHOLD))
+
+
+def fileDigest(path) -> str:
+    """MD5 of the file content"""
+    hashMd5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            hashMd5.update(chunk)
+    return hashMd5.hexdigest()
+
+
+def isAvailable() -> bool:
+    """Whether the installed ffmpeg supports everything needed for post-processing"""
+    tools = tool_registry.get_registry()
+    return all(tools.has_filter('ffmpeg', name) for name in ('silenceremove', 'areverse', 'loudnorm'))
+
+
+def _trimFilter(threshold: float) -> str:
+    trim = 'silenceremove=start_periods=1:start_threshold={}dB:start_silence={}'.format(threshold, KEEP_SILENCE)
+    return ','.join([trim, 'areverse', trim, 'areverse'])
+
+
+def _paramsKey(targetLufs: float, threshold: float) -> str:
+    return '{}:{}:{}:{}'.format(targetLufs, DEFAULT_TRUE_PEAK, DEFAULT_LRA, threshold)
+
+
+def measure(path, targetLufs: float = DEFAULT_TARGET_LUFS,
+            threshold: float = DEFAULT_SILENCE_THRESHOLD, digest: Optional[str] = None) -> Optional[dict]:
+    """Run the loudnorm analysis pass on the trimmed audio (cached by content digest)"""
+    digest = digest or fileDigest(path)
+    key = 'measure:{}:{}'.format(digest, _paramsKey(targetLufs, threshold))
+    cached = _measurements.get(key)
+    if cached:
+        return cached
+
+    tools = tool_registry.get_registry()
+    audioFilter = '{},loudnorm=I={}:TP={}:LRA={}:print_format=json'.format(
+        _trimFilter(threshold), targetLufs, DEFAULT_TRUE_PEAK, DEFAULT_LRA)
+    try:
+        output = subprocess.run([ tools.path('ffmpeg'), '-hide_banner', '-nostats', '-i', str(path), '-af', audioFilter, '-f', 'null', '-' ],
+                                capture_output=True, text=True, timeout=300).stderr
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    jsonMatch = re.search(r'\{[^{}]*"input_i"[^{}]*\}', output, re.S)
+    if not jsonMatch:
+        return None
+    try:
+        loudness = json.loads(jsonMatch.group(0))
+    except ValueError:
+        return None
+
+    rateMatch = re.search(r'Stream #\d+:\d+.*: Audio: .*?, (\d+) Hz', output)
+    result = {
+        'input_i': loudness['input_i'],
+        'input_tp': loudness['input_tp'],
+        'input_lra': loudness['input_lra'],
+        'input_thresh': loudness['input_thresh'],
+        'target_offset': loudness['target_offset'],
+        'sample_rate': int(rateMatch.group(1)) if rateMatch else 44100,
+    }
+    _measurements.set(key, result)
+    _measurements.save()
+    return result
+
+
+def processFile(path, targetLufs: float = DEFAULT_TARGET_LUFS,
+                threshold: float = DEFAULT_SILENCE_THRESHOLD, channels: int = 1, bitrate: str = '128k',
+                sampleRate: Optional[int] = None) -> bool:
+    """Trims silence and normalizes the loudness of an mp3 file in place
+
+    The result is encoded with `channels`, `bitrate` and `sampleRate` (default:
+    the sample rate of the input). Returns True if the file was processed or
+    was already processed before.
+    """
+    path = Path(path)
+    if not isAvailable():
+        print('WARNING: ffmpeg with silenceremove/loudnorm filters not found -> Skipping post-processing of ' + str(path))
+        return False
+
+    params = '{}:{}:{}:{}'.format(_paramsKey(targetLufs, threshold), channels, bitrate, sampleRate or '')
+    digest = fileDigest(path)
+    if _measurements.get('done:{}:{}'.format(digest, params)):
+        return True
+
+    m = measure(path, targetLufs, threshold, digest=digest)
+    if m is None:
+        print('WARNING: Measuring loudness of {} failed -> Skipping post-processing'.format(path))
+        return False
+
+    audioFilter = ('{},loudnorm=I={}:TP={}:LRA={}:measured_I={}:measured_TP={}:measured_LRA={}'
+                   ':measured_thresh={}:offset={}:linear=true').format(
+        _trimFilter(threshold), targetLufs, DEFAULT_TRUE_PEAK, DEFAULT_LRA,
+        m['input_i'], m['input_tp'], m['input_lra'], m['input_thresh'], m['target_offset'])
+
+    tools = tool_registry.get_registry()
+    tempFile = path.with_name(path.stem + '.postprocess.mp3')
+    result = subprocess.run([ tools.path('ffmpeg'), '-hide_banner', '-loglevel', 'error', '-y', '-i', str(path),
+                              '-af', audioFilter, '-ar', str(sampleRate or m['sample_rate']), '-ac', str(channels),
+                              '-acodec', 'libmp3lame', '-ab', bitrate, str(tempFile) ],
+                            capture_output=True, text=True)
+    if result.returncode != 0 or not tempFile.exists():
+        print('WARNING: Post-processing of {} failed: {}'.format(path, result.stderr.strip()))
+        if tempFile.exists():
+            os.remove(tempFile)
+        return False
+
+    os.replace(tempFile, path)
+    _measurements.set('done:{}:{}'.format(fileDigest(path), params), True)
+    _measurements.save()
+    return True
+
+
+def processFileUsingArgs(path, args) -> bool:
+    """Post-processes a file if `--post-process` was given
+
+    The result gets the encoding of `--encoding-profile`; if post-processing
+    isn't possible, the file is only re-encoded (the text-to-speech step
+    leaves that to post-processing).
+    """
+    if not getattr(args, 'post_process', False):
+        return False
+    profile = prompt_encoding.profileUsingArgs(args)
+    with profiling.span('post_process', 'ffmpeg') as span, run_planner.timed('ffmpeg:post_process'):
+        span.add_bytes(os.path.getsize(path))
+        if processFile(path, targetLufs=args.target_lufs, threshold=args.silence_threshold, channels=profile.channels,
+                       bitrate='{}k'.format(profile.bitrate), sampleRate=profile.sampleRate):
+            return True
+    prompt_encoding.conform(str(path), profile)
+    return False
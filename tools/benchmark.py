@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Benchmarks
+Generates a synthetic SD card staging tree (numbered folders with mp3 files
+made of valid MPEG audio frames and an ID3v2 tag with a fake cover image)
+and times the hot paths of the tools on it:
+
+    hash_full      MD5 of every file (Verify Sync without cache)
+    hash_cached    fingerprints with a warm hash cache (Refresh)
+    refresh        cached verification of all database entries
+    verify_quick   verification with sampled fingerprints (Quick Verify)
+    verify_full    verification hashing every file (Verify Sync)
+    copy           copying all files (Add Content)
+    copy_strip     copying with tag stripping
+    header_parse   walking the audio frames of every file
+    leadin_plan    add_lead_in_messages.py --dry-run on one folder
+
+Results are printed as a table and can be written as JSON (--output) and
+compared with an earlier run (--compare), so regressions between versions
+are visible. Note that files are read from the page cache after the first
+repetition, so the numbers show CPU cost rather than SD card speed.
+
+Usage:
+    python3 benchmark.py --folders 10 --tracks 20 --size-kb 1024 --output results.json
+    python3 benchmark.py --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import content_database
+import mp3_utils
+from tonuino_cache import JsonCache
+
+
+RESULTS_FORMAT = 1
+DEFAULT_REGRESSION_THRESHOLD = 10.0
+
+# MPEG 1 layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames
+FRAME_HEADER = bytes([0xff, 0xfb, 0x90, 0x64])
+FRAME_LENGTH = 417
+
+
+def id3v2_tag(title: str, cover_size: int, rng: random.Random) -> bytes:
+    """An ID3v2.3 tag with a title and a fake cover image of cover_size bytes"""
+    def frame(frame_id: bytes, data: bytes) -> bytes:
+        return frame_id + struct.pack('>I', len(data)) + b'\0\0' + data
+
+    body = frame(b'TIT2', b'\0' + title.encode('latin-1'))
+    if cover_size:
+        body += frame(b'APIC', b'\0image/jpeg\0\x03\0' + rng.randbytes(cover_size))
+    size = len(body)
+    synchsafe = bytes([(size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f])
+    return b'ID3\x03\0\0' + synchsafe + body
+
+
+def mp3_data(size: int, rng: random.Random) -> bytes:
+    """About size bytes of valid MPEG audio frames with random payload"""
+    count = max(1, size // FRAME_LENGTH)
+    payload = rng.randbytes(count * (FRAME_LENGTH - 4))
+    step = FRAME_LENGTH - 4
+    return b''.join(FRAME_HEADER + payload[i * step:(i + 1) * step] for i in range(count))
+
+
+def generate_tree(root: Path, folders: int, tracks: int, size_kb: int, cover_kb: int,
+                  seed: int = 1) -> Dict[str, dict]:
+    """Create numbered folders with mp3 files below root; returns a database for them"""
+    rng = random.Random(seed)
+    database = {}
+    for folder_num in range(1, folders + 1):
+        folder = root / f"{folder_num:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for track in range(1, tracks + 1):
+            data = id3v2_tag(f"Track {track}", cover_kb * 1024, rng) + mp3_data(size_kb * 1024, rng)
+            (folder / f"{track:03d}.mp3").write_bytes(data)
+        entry = {'name': f"Benchmark {folder_num}", 'type': 'album'}
+        content_database.attach_fingerprints(entry, content_database.scan_tracks(folder))
+        database[folder.name] = entry
+    return database
+
+
+class Benchmark:
+    """Runs the benchmarks on a generated tree"""
+
+    def __init__(self, work_dir: Path, database: Dict[str, dict], repeat: int):
+        self.work_dir = work_dir
+        self.tree = work_dir / "sd-card"
+        self.database = database
+        self.repeat = repeat
+        self.files = sorted(self.tree.glob("*/*.mp3"))
+        self.bytes = sum(f.stat().st_size for f in self.files)
+        self.hash_cache = content_database.HashCache(JsonCache('file_hashes', path=work_dir / "file_hashes.json"))
+
+    def measure(self, name: str, run: Callable[[], None], setup: Optional[Callable[[], None]] = None,
+                files: Optional[int] = None, size: Optional[int] = None) -> dict:
+        """Time run() self.repeat times (setup() is not timed)"""
+        times = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        files = len(self.files) if files is None else files
+        size = self.bytes if size is None else size
+        best = min(times)
+        return {
+            'name': name,
+            'min': best,
+            'median': statistics.median(times),
+            'runs': times,
+            'files': files,
+            'bytes': size,
+            'mb_per_s': size / (1024 * 1024) / best if best > 0 else None,
+        }
+
+    def verify(self, level: str):
+        for folder_num, entry in self.database.items():
+            content_database.diff_tracks(entry, self.tree / folder_num, level, self.hash_cache)
+
+    def copy_all(self, copy: Callable[[Path, Path], None]):
+        dest = self.work_dir / "copy"
+        for source in self.files:
+            target = dest / source.parent.name
+            target.mkdir(parents=True, exist_ok=True)
+            copy(source, target / source.name)
+
+    def clear_copy(self):
+        shutil.rmtree(self.work_dir / "copy", ignore_errors=True)
+
+    def parse_headers(self):
+        for path in self.files:
+            mp3_utils.read_audio_frames(path)
+
+    def plan_lead_ins(self):
+        first = sorted(p for p in self.tree.iterdir() if p.is_dir())[0]
+        subprocess.run([sys.executable, str(Path(__file__).parent / "add_lead_in_messages.py"),
+                        '-i', str(first), '-o', str(self.work_dir / "lead-in"), '--dry-run', '--use-say'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    def run_all(self, selected: Optional[List[str]] = None) -> Dict[str, dict]:
+        first_folder = sorted(p for p in self.tree.iterdir() if p.is_dir())[0]
+        first_files = list(first_folder.glob("*.mp3"))
+        benchmarks = [
+            ('hash_full', lambda: [content_database.scan_tracks(self.tree / f, full=True) for f in self.database],
+             None, {}),
+            ('hash_cached', lambda: [content_database.scan_tracks(self.tree / f, self.hash_cache) for f in self.database],
+             lambda: [content_database.scan_tracks(self.tree / f, self.hash_cache) for f in self.database], {}),
+            ('refresh', lambda: self.verify(content_database.VERIFY_CACHED), None, {}),
+            ('verify_quick', lambda: self.verify(content_database.VERIFY_QUICK), None, {}),
+            ('verify_full', lambda: self.verify(content_database.VERIFY_FULL), None, {}),
+            ('copy', lambda: self.copy_all(shutil.copy2), self.clear_copy, {}),
+            ('copy_strip', lambda: self.copy_all(mp3_utils.strip_tags_copy), self.clear_copy, {}),
+            ('header_parse', self.parse_headers, None, {}),
+            ('leadin_plan', self.plan_lead_ins, None,
+             {'files': len(first_files), 'size': sum(f.stat().st_size for f in first_files)}),
+        ]
+        results = {}
+        for name, run, setup, counts in benchmarks:
+            if selected and name not in selected:
+                continue
+            try:
+                results[name] = self.measure(name, run, setup, **counts)
+            except (OSError, subprocess.CalledProcessError) as e:
+                results[name] = {'name': name, 'error': str(e)}
+        self.clear_copy()
+        return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[Tuple[str, float]]:
+    """Return (name, change in percent) of all benchmarks slower than the baseline by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name, {})
+        if 'min' in result and old.get('min'):
+            change = (result['min'] - old['min']) / old['min'] * 100
+            result['change_percent'] = change
+            if change > threshold:
+                regressions.append((name, change))
+    return regressions
+
+
+def print_table(results: Dict[str, dict], threshold: float):
+    print(f"{'benchmark':14} {'min [ms]':>10} {'median [ms]':>12} {'files':>7} {'MB/s':>9} {'change':>9}")
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"{name:14} failed: {result['error']}")
+            continue
+        rate = f"{result['mb_per_s']:.1f}" if result['mb_per_s'] else '-'
+        change = ''
+        if 'change_percent' in result:
+            change = f"{result['change_percent']:+.1f}%"
+            if result['change_percent'] > threshold:
+                change += ' !'
+        print(f"{name:14} {result['min'] * 1000:10.1f} {result['median'] * 1000:12.1f} "
+              f"{result['files']:7d} {rate:>9} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the TonUINO tools on a synthetic SD card tree')
+    parser.add_argument('--folders', type=int, default=5, help='Number of folders (default: 5)')
+    parser.add_argument('--tracks', type=int, default=20, help='Tracks per folder (default: 20)')
+    parser.add_argument('--size-kb', type=int, default=512, help='Audio size per track in KB (default: 512)')
+    parser.add_argument('--cover-kb', type=int, default=64, help='Size of the embedded cover image in KB (default: 64)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per benchmark (default: 3)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated files')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='Only run these benchmarks')
+    parser.add_argument('--work-dir', type=str, help='Directory for the generated tree (default: temporary, removed afterwards)')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+    parser.add_argument('--compare', type=str, help='Compare with the JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help=f'Slowdown in percent reported as regression (default: {DEFAULT_REGRESSION_THRESHOLD:.0f})')
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="tonuino-benchmark-"))
+    # Keep the benchmark's caches away from the user's cache
+    os.environ['TONUINO_CACHE_DIR'] = str(work_dir / "cache")
+    try:
+        start = time.perf_counter()
+        database = generate_tree(work_dir / "sd-card", args.folders, args.tracks, args.size_kb, args.cover_kb, args.seed)
+        print(f"Generated {args.folders} folders x {args.tracks} tracks in {work_dir} "
+              f"({time.perf_counter() - start:.1f}s)")
+        results = Benchmark(work_dir, database, args.repeat).run_all(args.only)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f).get('results', {}), args.threshold)
+    print_table(results, args.threshold)
+
+    if args.output:
+        report = {
+            'format': RESULTS_FORMAT,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: getattr(args, k) for k in ('folders', 'tracks', 'size_kb', 'cover_kb', 'repeat', 'seed')},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if regressions:
+        print(f"\nRegressions (> {args.threshold:.0f}% slower): " +
+              ', '.join(f"{name} {change:+.1f}%" for name, change in regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Content database helpers
+Per-track fingerprints for the entries of .tonuino_hash.json.
+
+Each track entry of a folder stores the file name, size, mtime and MD5
+digest of its mp3 file, e.g.:
+
+    {"index": "003", "name": "Book - Chapter 3", "file": "003.mp3",
+     "size": 4711, "mtime": 1700000000.0, "md5": "..."}
+
+With these, verification can tell exactly which tracks were added, removed
+or changed, and only those tracks need to be re-hashed or re-synced. The
+folder level "hash" is still computed the same way as before (MD5 over file
+names and file digests), so existing databases stay valid.
+
+Besides the full MD5, each track stores a "quick" fingerprint: the MD5 of
+the file size plus QUICK_SAMPLES sampled blocks (head, tail and evenly
+spaced blocks in between). It can be computed in a fraction of the time on
+slow SD card readers.
+
+Verification levels:
+- "cached": files whose size and mtime match the stored fingerprint are
+  trusted, only the others are hashed
+- "quick":  every file is checked with the quick fingerprint, the full MD5
+  is only computed for files whose quick fingerprint doesn't match
+- "full":   every file is hashed again
+
+Files are hashed through the adaptive I/O tuner of their device (see
+adaptive_io.py), which picks the number of parallel reads and the block size.
+
+Entries created by an import also remember where they came from, so that
+a fixed or extended album can be refreshed from the library without a full
+re-import:
+
+    "source": {"path": "/music/Album", "options": {"split": false, ...},
+               "files": [{"file": "01 Intro.mp3", "size": ..., "md5": ...}]}
+
+and each track records the source file and the part of it (segments of a
+split file, chapters of an AAX file) it was made from: "source", "part".
+diff_source() compares the recorded source files with the library.
+
+DuplicateIndex maps track digests and folder hashes to the folders holding
+them, so that the same content imported twice can be detected.
+
+Track metadata (duration, bitrate, sample rate, channels) is read from the
+first frames of a file and kept in the hash cache next to its digests, so
+folder and card totals only read files that are new or changed.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple
+
+import adaptive_io
+import mp3_utils
+import profiling
+from tonuino_cache import JsonCache
+
+
+HASH_BLOCK_SIZE = 64 * 1024
+QUICK_BLOCK_SIZE = 16 * 1024
+QUICK_SAMPLES = 8
+
+VERIFY_CACHED = 'cached'
+VERIFY_QUICK = 'quick'
+VERIFY_FULL = 'full'
+
+SOURCE_EXTENSIONS = ('.mp3', '.aax')
+
+
+def calculate_hash(filepath: Path, block_size: int = HASH_BLOCK_SIZE) -> str:
+    """Calculate MD5 hash of a file"""
+    hash_md5 = hashlib.md5()
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(block_size), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+    except Exception:
+        return ""
+
+
+def calculate_quick_hash(filepath: Path, size: Optional[int] = None) -> str:
+    """MD5 over the file size and QUICK_SAMPLES sampled blocks (head, tail, evenly spaced middle)"""
+    hash_md5 = hashlib.md5()
+    try:
+        if size is None:
+            size = os.path.getsize(filepath)
+        hash_md5.update(str(size).encode())
+        with open(filepath, "rb") as f:
+            if size <= QUICK_BLOCK_SIZE * QUICK_SAMPLES:
+                hash_md5.update(f.read())
+            else:
+                step = (size - QUICK_BLOCK_SIZE) / (QUICK_SAMPLES - 1)
+                for i in range(QUICK_SAMPLES):
+                    f.seek(int(i * step))
+                    hash_md5.update(f.read(QUICK_BLOCK_SIZE))
+        return hash_md5.hexdigest()
+    except Exception:
+        return ""
+
+
+class HashCache:
+    """Remembers file digests by path, valid as long as size and mtime don't change"""
+
+    def __init__(self, cache: Optional[JsonCache] = None):
+        self.cache = cache if cache is not None else JsonCache('file_hashes')
+
+    def lookup(self, path: Path, stat: os.stat_result) -> Optional[dict]:
+        entry = self.cache.get(str(Path(path).absolute()))
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def store(self, path: Path, stat: os.stat_result, **values):
+        key = str(Path(path).absolute())
+        entry = self.cache.get(key) or {}
+        if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            entry = {}
+        entry.update(values, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        self.cache.set(key, entry)
+
+    def save(self):
+        self.cache.save()
+
+
+def file_fingerprint(path: Path, hash_cache: Optional[HashCache] = None, full: bool = False) -> dict:
+    """Return {'file', 'size', 'mtime', 'md5', 'quick'} of a file, using the hash cache unless full is set"""
+    return _fingerprint(path, hash_cache, full)[0]
+
+
+def _fingerprint(path: Path, hash_cache: Optional[HashCache] = None, full: bool = False,
+                 block_size: int = HASH_BLOCK_SIZE) -> Tuple[dict, int]:
+    """file_fingerprint() and the number of bytes read for it"""
+    path = Path(path)
+    stat = path.stat()
+    entry = None if full or hash_cache is None else hash_cache.lookup(path, stat)
+    read = 0
+    if entry and entry.get('md5') and entry.get('quick'):
+        digest = entry['md5']
+        quick = entry['quick']
+    else:
+        with profiling.span('hash_file', 'hash', file=path.name) as span:
+            digest = calculate_hash(path, block_size)
+            quick = calculate_quick_hash(path, stat.st_size)
+            span.add_bytes(stat.st_size)
+        read = stat.st_size
+        if hash_cache is not None:
+            hash_cache.store(path, stat, md5=digest, quick=quick)
+    return {
+        'file': path.name,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'md5': digest,
+        'quick': quick,
+    }, read
+
+
+def list_tracks(folder: Path) -> List[Path]:
+    """The mp3 files of a folder in playback order"""
+    return sorted(folder.glob("*.mp3"))
+
+
+def scan_tracks(folder: Path, hash_cache: Optional[HashCache] = None, full: bool = False) -> List[dict]:
+    """Fingerprints of all mp3 files in a folder"""
+    return fingerprint_files(list_tracks(folder), hash_cache, full)
+
+
+def fingerprint_files(paths: List[Path], hash_cache: Optional[HashCache] = None, full: bool = False) -> List[dict]:
+    """Fingerprints of files (of one device), in the given order"""
+    if not paths:
+        return []
+    return adaptive_io.tuner_for(paths[0]).map(
+        lambda path, block_size: _fingerprint(path, hash_cache, full, block_size), paths)
+
+
+def list_sources(source: Path) -> List[Path]:
+    """The importable files (mp3 and AAX) of a source file or folder, sorted by name"""
+    source = Path(source)
+    if source.is_file():
+        return [source]
+    if not source.is_dir():
+        return []
+    return sorted(f for f in source.iterdir() if f.is_file() and f.suffix.lower() in SOURCE_EXTENSIONS)
+
+
+def track_metadata(path: Path, hash_cache: Optional[HashCache] = None) -> dict:
+    """Return {'duration', 'bitrate', 'sample_rate', 'channels', 'vbr', 'size'} of an mp3 file, using the hash cache"""
+    path = Path(path)
+    stat = path.stat()
+    entry = hash_cache.lookup(path, stat) if hash_cache is not None else None
+    if entry and 'meta' in entry:
+        return dict(entry['meta'], size=stat.st_size)
+    with profiling.span('read_metadata', 'io', file=path.name):
+        try:
+            info = mp3_utils.read_stream_info(path)
+        except OSError:
+            info = None
+    if info is None:
+        meta = {'duration': 0.0, 'bitrate': 0, 'sample_rate': 0, 'channels': 0, 'vbr': False}
+    else:
+        meta = {'duration': round(info.duration, 3), 'bitrate': info.bitrate, 'sample_rate': info.sample_rate,
+                'channels': info.channels, 'vbr': info.vbr}
+    if hash_cache is not None:
+        hash_cache.store(path, stat, meta=meta)
+    return dict(meta, size=stat.st_size)
+
+
+def folder_metadata(folder: Path, hash_cache: Optional[HashCache] = None) -> List[dict]:
+    """Metadata of all mp3 files in a folder (in playback order), with their 'file' name"""
+    return [dict(track_metadata(f, hash_cache), file=f.name) for f in list_tracks(folder)]
+
+
+def summarize_metadata(tracks: List[dict]) -> dict:
+    """Totals of track metadata: {'tracks', 'duration', 'size', 'bitrate', 'vbr', 'sample_rate', 'channels'}
+
+    The bitrate is weighted by duration; sample rate and channels are 0 if
+    the tracks differ.
+    """
+    duration = sum(t.get('duration', 0.0) for t in tracks)
+    weighted = sum(t.get('bitrate', 0) * t.get('duration', 0.0) for t in tracks)
+    sample_rates = {t.get('sample_rate', 0) for t in tracks}
+    channels = {t.get('channels', 0) for t in tracks}
+    return {
+        'tracks': len(tracks),
+        'duration': duration,
+        'size': sum(t.get('size', 0) for t in tracks),
+        'bitrate': round(weighted / duration) if duration else 0,
+        'vbr': any(t.get('vbr') for t in tracks) or len({t.get('bitrate', 0) for t in tracks}) > 1,
+        'sample_rate': sample_rates.pop() if len(sample_rates) == 1 else 0,
+        'channels': channels.pop() if len(channels) == 1 else 0,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    """h:mm:ss (or m:ss below an hour)"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def folder_hash_from_tracks(fingerprints: List[dict]) -> str:
+    """Combined folder hash (same value as hashing every file of the folder)"""
+    hash_md5 = hashlib.md5()
+    for fingerprint in sorted(fingerprints, key=lambda t: t['file']):
+        hash_md5.update(fingerprint['file'].encode())
+        hash_md5.update(fingerprint['md5'].encode())
+    return hash_md5.hexdigest()
+
+
+def has_fingerprints(entry: dict) -> bool:
+    """Whether a database entry stores per-track fingerprints"""
+    tracks = entry.get('tracks', [])
+    return bool(tracks) and all('file' in t and 'md5' in t and 'quick' in t for t in tracks)
+
+
+def _unchanged(stored: dict, stat: os.stat_result) -> bool:
+    return stored.get('size') == stat.st_size and stored.get('mtime') == stat.st_mtime
+
+
+def diff_tracks(entry: dict, folder: Path, level: str = VERIFY_CACHED,
+                hash_cache: Optional[HashCache] = None, files: Optional[List[Path]] = None) -> Dict[str, List[dict]]:
+    """Compare the stored track fingerprints of a database entry with the files of a folder
+
+    Returns {'added': [...], 'removed': [...], 'changed': [...], 'touched': [...]}:
+    added/changed/touched contain the current fingerprints, removed the stored
+    track entries. "touched" tracks have a new mtime but the same content.
+    Only files whose size/mtime differ from the stored fingerprint are hashed
+    with VERIFY_CACHED. With VERIFY_QUICK all files are checked with the quick
+    fingerprint and only mismatches are fully hashed. VERIFY_FULL hashes all.
+    files (if given) are compared instead of the mp3 files of the folder.
+    """
+    stored = {t['file']: t for t in entry.get('tracks', []) if 'file' in t}
+    result = {'added': [], 'removed': [], 'changed': [], 'touched': []}
+
+    if files is not None:
+        current_files = list(files)
+    else:
+        current_files = list_tracks(folder) if folder.exists() else []
+    current_names = {f.name for f in current_files}
+
+    def check(path: Path, block_size: int) -> Tuple[Optional[Tuple[str, dict]], int]:
+        # (result category and fingerprint or None, bytes read) of one file
+        track = stored.get(path.name)
+        if track is None:
+            fingerprint, read = _fingerprint(path, hash_cache, block_size=block_size)
+            return ('added', fingerprint), read
+        stat = path.stat()
+        if level == VERIFY_CACHED and _unchanged(track, stat):
+            return None, 0
+        if level == VERIFY_QUICK and track.get('quick'):
+            if stat.st_size == track.get('size') and calculate_quick_hash(path, stat.st_size) == track['quick']:
+                read = min(stat.st_size, QUICK_BLOCK_SIZE * QUICK_SAMPLES)
+                if stat.st_mtime != track.get('mtime'):
+                    return ('touched', dict(track, mtime=stat.st_mtime)), read
+                return None, read
+            # Quick fingerprint mismatch -> escalate to a full hash
+            level_full = True
+        else:
+            level_full = level == VERIFY_FULL
+        fingerprint, read = _fingerprint(path, hash_cache, full=level_full, block_size=block_size)
+        if fingerprint['md5'] != track.get('md5'):
+            return ('changed', fingerprint), read
+        if fingerprint['mtime'] != track.get('mtime'):
+            return ('touched', fingerprint), read
+        return None, read
+
+    for outcome in adaptive_io.tuner_for(folder).map(check, current_files):
+        if outcome is not None:
+            result[outcome[0]].append(outcome[1])
+
+    result['removed'] = [t for name, t in sorted(stored.items()) if name not in current_names]
+    return result
+
+
+def attach_fingerprints(entry: dict, fingerprints: List[dict], track_name=None):
+    """Store fingerprints in an entry that has none yet (tracks are matched by position)"""
+    tracks = entry.get('tracks', [])
+    ordered = []
+    for i, fingerprint in enumerate(fingerprints, start=1):
+        track = dict(tracks[i - 1]) if i <= len(tracks) else {}
+        track.update(fingerprint)
+        track['index'] = f"{i:03d}"
+        if 'name' not in track:
+            track['name'] = track_name(i, len(fingerprints)) if track_name else Path(track['file']).stem
+        ordered.append(track)
+    entry['tracks'] = ordered
+    entry['track_count'] = len(ordered)
+    entry['hash'] = folder_hash_from_tracks(ordered)
+
+
+def is_clean(diff: Dict[str, List[dict]]) -> bool:
+    """Whether a diff contains content changes (touched files don't count)"""
+    return not (diff['added'] or diff['removed'] or diff['changed'])
+
+
+def apply_diff(entry: dict, diff: Dict[str, List[dict]], track_name=None):
+    """Update the track entries of a database entry with a diff
+
+    Only the affected tracks are touched. New tracks get their name from
+    track_name(index, track_count) if given. track_count and hash are recomputed.
+    """
+    tracks = {t['file']: t for t in entry.get('tracks', []) if 'file' in t}
+    for removed in diff['removed']:
+        tracks.pop(removed['file'], None)
+    for fingerprint in diff['changed'] + diff['touched']:
+        tracks[fingerprint['file']].update(fingerprint)
+    for fingerprint in diff['added']:
+        tracks[fingerprint['file']] = dict(fingerprint)
+
+    ordered = [tracks[name] for name in sorted(tracks)]
+    for i, track in enumerate(ordered, start=1):
+        track['index'] = f"{i:03d}"
+        if 'name' not in track:
+            track['name'] = track_name(i, len(ordered)) if track_name else Path(track['file']).stem
+    entry['tracks'] = ordered
+    entry['track_count'] = len(ordered)
+    entry['hash'] = folder_hash_from_tracks(ordered)
+
+
+def source_record(source: Path, fingerprints: List[dict], options: dict) -> dict:
+    """The "source" of an entry: source path, import options and fingerprints of the source files"""
+    return {'path': str(Path(source).absolute()), 'options': options, 'files': fingerprints}
+
+
+def claimed_sources(database: Dict[str, dict], folder: str) -> set:
+    """Names of the source files that other entries with the same source path were made from
+
+    An import that needs several folders records the same source path in
+    each of them; refreshing one folder must not take over the others' files.
+    """
+    path = database[folder].get('source', {}).get('path')
+    return {f['file'] for other, entry in database.items()
+            if other != folder and entry.get('source', {}).get('path') == path
+            for f in entry['source'].get('files', [])}
+
+
+def diff_source(entry: dict, level: str = VERIFY_CACHED, hash_cache: Optional[HashCache] = None,
+                claimed: Collection[str] = ()) -> Dict[str, List[dict]]:
+    """Compare the recorded source files of an entry with the source library (see diff_tracks)
+
+    Files in claimed belong to other entries and are not reported as added.
+    """
+    source = entry['source']
+    path = Path(source['path'])
+    files = [f for f in list_sources(path) if f.name not in claimed]
+    return diff_tracks({'tracks': source.get('files', [])}, path if path.is_dir() else path.parent,
+                       level, hash_cache, files=files)
+
+
+def update_source(source: dict, diff: Dict[str, List[dict]]) -> dict:
+    """The source record after a refresh with diff"""
+    files = {f['file']: f for f in source.get('files', [])}
+    for removed in diff['removed']:
+        files.pop(removed['file'], None)
+    for fingerprint in diff['changed'] + diff['touched'] + diff['added']:
+        files[fingerprint['file']] = dict(fingerprint)
+    return dict(source, files=[files[name] for name in sorted(files)])
+
+
+def describe_diff(diff: Dict[str, List[dict]]) -> str:
+    """Short human readable summary of a diff, e.g. "2 changed (003.mp3, 007.mp3), 1 added (012.mp3)" """
+    parts = []
+    for kind in ('changed', 'added', 'removed'):
+        if diff[kind]:
+            names = ', '.join(t['file'] for t in diff[kind][:5])
+            more = ', ...' if len(diff[kind]) > 5 else ''
+            parts.append(f"{len(diff[kind])} {kind} ({names}{more})")
+    return ', '.join(parts) if parts else 'unchanged'
+
+
+class DuplicateIndex:
+    """Digest -> locations index over the entries of the database
+
+    The index is kept up to date incrementally: sync() only re-indexes entries
+    whose folder hash changed since the last call, and drops removed ones.
+    """
+
+    def __init__(self):
+        self.files = {}      # track digest -> {(folder, file)}
+        self.folders = {}    # folder hash -> {folder}
+        self.indexed = {}    # folder -> (folder hash, [(digest, file)])
+
+    def remove(self, folder: str):
+        folder_hash, tracks = self.indexed.pop(folder, (None, []))
+        for digest, name in tracks:
+            locations = self.files.get(digest, set())
+            locations.discard((folder, name))
+            if not locations:
+                self.files.pop(digest, None)
+        folders = self.folders.get(folder_hash, set())
+        folders.discard(folder)
+        if not folders:
+            self.folders.pop(folder_hash, None)
+
+    def add(self, folder: str, entry: dict):
+        self.remove(folder)
+        tracks = [(t['md5'], t['file']) for t in entry.get('tracks', []) if t.get('md5') and 'file' in t]
+        self.indexed[folder] = (entry.get('hash'), tracks)
+        for digest, name in tracks:
+            self.files.setdefault(digest, set()).add((folder, name))
+        if entry.get('hash'):
+            self.folders.setdefault(entry['hash'], set()).add(folder)
+
+    def sync(self, database: Dict[str, dict]):
+        """Bring the index up to date with the database (only changed entries are re-indexed)"""
+        for folder in [f for f in self.indexed if f not in database]:
+            self.remove(folder)
+        for folder, entry in database.items():
+            indexed = self.indexed.get(folder)
+            if indexed is None or indexed[0] != entry.get('hash'):
+                self.add(folder, entry)
+
+    def folders_with_hash(self, folder_hash: str) -> List[str]:
+        return sorted(self.folders.get(folder_hash, ()))
+
+    def locations(self, digest: str) -> List[tuple]:
+        return sorted(self.files.get(digest, ()))
+
+    def duplicate_folders(self) -> List[List[str]]:
+        """Groups of folders with identical content"""
+        return sorted(sorted(folders) for folders in self.folders.values() if len(folders) > 1)
+
+    def duplicate_files(self) -> Dict[str, List[tuple]]:
+        """Digest -> locations for files stored more than once (whole duplicate folders excluded)"""
+        in_duplicate_folders = {f for group in self.duplicate_folders() for f in group[1:]}
+        result = {}
+        for digest, locations in self.files.items():
+            remaining = sorted(loc for loc in locations if loc[0] not in in_duplicate_folders)
+            if len(remaining) > 1:
+                result[digest] = remaining
+        return dict(sorted(result.items(), key=lambda item: item[1]))
+
+    def find_folder(self, digests: List[str]) -> Optional[str]:
+        """A folder whose tracks have exactly these digests (in this order), if any"""
+        if not digests:
+            return None
+        candidates = {folder for folder, _ in self.files.get(digests[0], ())}
+        for folder in sorted(candidates):
+            tracks = [digest for digest, _ in sorted(self.indexed[folder][1], key=lambda t: t[1])]
+            if tracks == list(digests):
+                return folder
+        return None
@@ -1,9 +1,179 @@
 #!/usr/bin/env python3
 
 # Creates the audio messages needed by TonUINO.
+#
+# Several languages (`--lang de en` or `--lang all`) are generated in one run:
+# all their messages go into one shared work queue, so the run takes about as
+# long as the largest language instead of the sum of all.
 
 
-import argparse, os, re, shutil, sys, text_to_speech
+import argparse, concurrent.futures, os, re, shutil, sys, audio_postprocess, job_queue, number_prompts, polly_client, profiling, prompt_encoding, run_planner, text_to_speech, tts_quota
+
+
+# Longer messages are always synthesized with a request of their own
+batchMaxChars = 200
+
+
+def messagesFileOf(args, lang):
+    return '{}/audio_messages_{}.txt'.format(args.input, lang)
+
+
+def languagesUsingArgs(args):
+    if 'all' not in args.lang:
+        return list(dict.fromkeys(args.lang))
+    voices = text_to_speech.voicesUsingArgs(args)
+    allLanguages = set().union(text_to_speech.sayVoiceByLang, text_to_speech.googleVoiceByLang,
+                               text_to_speech.amazonVoiceByLang, text_to_speech.coquiVoiceByLang)
+    found = sorted(lang for lang in allLanguages if os.path.isfile(messagesFileOf(args, lang)))
+    unsupported = [lang for lang in found if lang not in voices]
+    if unsupported:
+        print('Skipping {} (not supported by the selected text-to-speech engine)'.format(', '.join(unsupported)))
+    return [lang for lang in found if lang in voices]
+
+
+def jobParamsOf(args, targetDir):
+    return {
+        'input': os.path.abspath(messagesFileOf(args, args.lang)),
+        'output': os.path.abspath(targetDir),
+        'lang': args.lang,
+        'engine': text_to_speech.engineNameUsingArgs(args),
+        'skip_numbers': args.skip_numbers,
+        'number_mode': args.number_mode,
+        'only_new': args.only_new,
+        'post_process': args.post_process,
+        'target_lufs': args.target_lufs,
+        'silence_threshold': args.silence_threshold,
+        'encoding_profile': prompt_encoding.profileUsingArgs(args).spec(),
+    }
+
+
+def listMessages(args, targetDir, numbers):
+    # (target file, text, is number) of all messages of a language
+    messages = [('{}/mp3/{:0>4}.mp3'.format(targetDir, i), '{}'.format(i), True) for i in numbers]
+    with open(messagesFileOf(args, args.lang)) as f:
+        lineRe = re.compile('^([^|]+)\\|(.*)$')
+        for line in f:
+            match = lineRe.match(line.strip())
+            if match:
+                messages.append((targetDir + "/" + match.group(1), match.group(2), False))
+    return messages
+
+
+def pendingMessages(args, messages, job):
+    # The messages still to create, and how many exist already / were done by an interrupted run
+    pending = []
+    existing = 0
+    done = 0
+    for message in messages:
+        targetFile, _, isNumber = message
+        partial = job is not None and job.is_partial(targetFile)
+        if args.only_new and not isNumber and os.path.isfile(targetFile) and not partial:
+            existing += 1
+        elif job is not None and job.is_done(targetFile):
+            done += 1
+        else:
+            pending.append(message)
+    return pending, existing, done
+
+
+def groupBatches(args, messages):
+    # Returns (batches, single messages): short messages are packed into batches of `--batch`
+    if args.batch <= 1 or not text_to_speech.supportsBatch(args):
+        return [], messages
+    short = [message for message in messages if len(message[1]) <= batchMaxChars]
+    return ([short[i:i + args.batch] for i in range(0, len(short), args.batch)],
+            [message for message in messages if len(message[1]) > batchMaxChars])
+
+
+def prepareLanguage(args, targetDir, jobQueue):
+    # Creates the output tree of one language and returns its job and the work items
+    # (step function, target file(s), function creating them) still to do
+    if os.path.isdir(targetDir):
+        print("Directory `" + targetDir + "` already exists.")
+    else:
+        os.makedirs(targetDir)
+        os.mkdir(targetDir + '/advert')
+        os.mkdir(targetDir + '/mp3')
+
+    # Every created file is checkpointed, so an interrupted run continues where it stopped
+    job = jobQueue.resume_or_submit('tts_batch', jobParamsOf(args, targetDir), title='Audio messages ({})'.format(args.lang))
+    if jobQueue.step_count(job.id):
+        print('Resuming interrupted run (job {}, {})'.format(job.id, args.lang))
+
+    numbers = []
+    if not args.skip_numbers:
+        numbers = range(1,256)
+        if args.number_mode == 'concat':
+            if number_prompts.isSupported(args.lang):
+                with profiling.span('number_prompts', lang=args.lang):
+                    numbers = job.step('number_prompts', lambda: number_prompts.createNumberPrompts(targetDir, args))
+            else:
+                print('Number fragments are not supported for language `{}` -> Synthesizing all numbers'.format(args.lang))
+
+    messages, existing, done = pendingMessages(args, listMessages(args, targetDir, numbers), job)
+    tts_quota.usage.addCacheHits('existing files', existing)
+    tts_quota.usage.addCacheHits('files of the interrupted run', done)
+
+    def finish(message):
+        targetFile, _, isNumber = message
+        audio_postprocess.processFileUsingArgs(targetFile, args)
+        if isNumber:
+            shutil.copy(targetFile, '{}/advert/{}'.format(targetDir, os.path.basename(targetFile)))
+
+    def createSingle(message):
+        targetFile, text, _ = message
+        text_to_speech.textToSpeechUsingArgs(text=text, targetFile=targetFile, args=args)
+        finish(message)
+
+    def createBatch(batch):
+        if not text_to_speech.textToSpeechBatchUsingArgs([(text, targetFile) for targetFile, text, _ in batch], args):
+            for targetFile, text, _ in batch:
+                text_to_speech.textToSpeechUsingArgs(text=text, targetFile=targetFile, args=args)
+        for message in batch:
+            finish(message)
+
+    batches, singles = groupBatches(args, messages)
+    if args.batch > 1 and not batches and singles:
+        print('Batching needs Amazon Polly (with readable AWS credentials) or Google -> Synthesizing the messages one by one')
+    work = [(job.files_step, [message[0] for message in batch], lambda batch=batch: createBatch(batch)) for batch in batches]
+    work += [(job.file_step, message[0], lambda message=message: createSingle(message)) for message in singles]
+    return job, work
+
+
+def planLanguage(args, targetDir, jobQueue, plan):
+    # Adds the work `prepareLanguage()` and the workers would do to a plan, without changing anything
+    unfinished = jobQueue.find_unfinished('tts_batch', jobParamsOf(args, targetDir))
+    job = job_queue.JobContext(jobQueue, unfinished) if unfinished else None
+
+    numbers = []
+    if not args.skip_numbers:
+        numbers = range(1,256)
+        if args.number_mode == 'concat' and number_prompts.isSupported(args.lang):
+            if job is not None and job.is_done('number_prompts'):
+                numbers = jobQueue.step_result(job.id, 'number_prompts')[1]
+            else:
+                missing = number_prompts.missingFragments(args)
+                plan.addCacheHits('cached number fragments', number_prompts.fragmentCount(args.lang) - len(missing))
+                for _, text in missing:
+                    plan.addSynthesis(text)
+                    if args.post_process:
+                        plan.add('ffmpeg:post_process')
+                plan.filesToWrite += 2 * number_prompts.MAX_NUMBER
+                numbers = []
+
+    messages, existing, done = pendingMessages(args, listMessages(args, targetDir, numbers), job)
+    plan.addCacheHits('existing files', existing)
+    plan.addCacheHits('files of an interrupted run', done)
+
+    batches, singles = groupBatches(args, messages)
+    for batch in batches:
+        plan.addBatch([text for _, text, _ in batch], text_to_speech.batchRequestCount(args))
+    for _, text, _ in singles:
+        plan.addSynthesis(text)
+    for _, _, isNumber in messages:
+        plan.filesToWrite += 2 if isNumber else 1
+        if args.post_process:
+            plan.add('ffmpeg:post_process')
 
 
 if __name__ == '__main__':
@@ -15,43 +185,75 @@ if __name__ == '__main__':
         usage='%(prog)s [optional arguments...]',
         formatter_class=argFormatter)
     argparser.add_argument('-i', '--input', type=str, default='.', help='The directory where `audio_messages_*.txt` files are located. (default: current directory)')
-    argparser.add_argument('-o', '--output', type=str, default='sd-card', help='The directory where to create the audio messages. (default: `sd-card`)')
-    text_to_speech.addArgumentsToArgparser(argparser)
+    argparser.add_argument('-o', '--output', type=str, default='sd-card', help='The directory where to create the audio messages. With several languages, one sub directory per language is created. (default: `sd-card`)')
+    text_to_speech.addArgumentsToArgparser(argparser, multipleLanguages=True)
     argparser.add_argument('--skip-numbers', action='store_true', help='If set, no number messages will be generated (`0001.mp3` - `0255.mp3`)')
+    argparser.add_argument('--number-mode', choices=['full', 'concat'], default='full', help='`full`: synthesize every number message. `concat`: synthesize only number fragments (units, tens, hundreds) and join them - much fewer TTS requests. Falls back to `full` for languages without fragment rules (default: full)')
     argparser.add_argument('--only-new', action='store_true', help='If set, only new messages will be created.')
+    argparser.add_argument('--batch', type=int, default=0, help='Synthesize up to this many short messages with one request and split the audio at SSML marks (Amazon and Google only). Falls back to single requests if the audio can\'t be split (default: off)')
+    argparser.add_argument('--dry-run', action='store_true', help='Only plan the run: print how many requests, ffmpeg invocations and bytes are needed and estimate time and cost from earlier runs')
+    run_planner.addArgumentsToArgparser(argparser)
+    argparser.add_argument('--workers', type=int, default=None, help='Number of messages generated at the same time, shared by all languages (default: 4 for Amazon and Google, 1 otherwise)')
+    audio_postprocess.addArgumentsToArgparser(argparser)
+    profiling.add_profile_argument(argparser)
     args = argparser.parse_args()
+    profiling.enable_from_args(args)
 
 
-    text_to_speech.checkArgs(argparser, args)
-
-    audioMessagesFile = '{}/audio_messages_{}.txt'.format(args.input, args.lang)
-    if not os.path.isfile(audioMessagesFile):
-        print('Input file does not exist: ' + os.path.abspath(audioMessagesFile))
+    languages = languagesUsingArgs(args)
+    if not languages:
+        print('No `audio_messages_*.txt` file found in ' + os.path.abspath(args.input))
         exit(1)
 
-    targetDir = args.output
-    if os.path.isdir(targetDir):
-        print("Directory `" + targetDir + "` already exists.")
-    else:
-        os.mkdir(targetDir)
-        os.mkdir(targetDir + '/advert')
-        os.mkdir(targetDir + '/mp3')
+    # One copy of the arguments per language; everything else (rate limiter, connections) is shared
+    argsByLang = {}
+    for lang in languages:
+        langArgs = argparse.Namespace(**vars(args))
+        langArgs.lang = lang
+        text_to_speech.checkArgs(argparser, langArgs)
+        if not os.path.isfile(messagesFileOf(args, lang)):
+            print('Input file does not exist: ' + os.path.abspath(messagesFileOf(args, lang)))
+            exit(1)
+        argsByLang[lang] = langArgs
 
+    jobQueue = job_queue.JobQueue()
+    workers = args.workers or (4 if args.use_amazon or args.use_google_key else 1)
+    targetDirByLang = {lang: args.output if len(languages) == 1 else os.path.join(args.output, lang) for lang in languages}
 
-    if not args.skip_numbers:
-        for i in range(1,256):
-            targetFile1 = '{}/mp3/{:0>4}.mp3'.format(targetDir, i)
-            targetFile2 = '{}/advert/{:0>4}.mp3'.format(targetDir, i)
-            text_to_speech.textToSpeechUsingArgs(text='{}'.format(i), targetFile=targetFile1, args=args)
-            shutil.copy(targetFile1, targetFile2)
+    if args.dry_run:
+        text_to_speech.configureUsingArgs(args)
+        plan = run_planner.RunPlan(text_to_speech.engineNameUsingArgs(args))
+        for lang, langArgs in argsByLang.items():
+            planLanguage(langArgs, targetDirByLang[lang], jobQueue, plan)
+        print(plan.report(sorted({1, 2, 4, 8, workers}), args.price_per_million_chars))
+        sys.exit(0)
 
-    with open(audioMessagesFile) as f:
-        lineRe = re.compile('^([^|]+)\\|(.*)$')
-        for line in f:
-            match = lineRe.match(line.strip())
-            if match:
-                fileName = match.group(1)
-                if args.only_new and os.path.isfile(targetDir + "/" + fileName):
-                    continue
-                text = match.group(2)
-                text_to_speech.textToSpeechUsingArgs(text=text, targetFile=targetDir + "/" + fileName, args=args)
+    jobs = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Languages are prepared in the pool as well (number fragments need requests), and
+        # their messages are queued as soon as a language is prepared
+        preparations = [executor.submit(prepareLanguage, langArgs, targetDirByLang[lang], jobQueue)
+                        for lang, langArgs in argsByLang.items()]
+        futures = list(preparations)
+        try:
+            for preparation in concurrent.futures.as_completed(preparations):
+                job, work = preparation.result()
+                jobs.append(job)
+                futures += [executor.submit(step, target, create) for step, target, create in work]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        except BaseException as e:
+            # Stop at the first error; finished files stay checkpointed for the next run
+            for future in futures:
+                future.cancel()
+            if not isinstance(e, (text_to_speech.TextToSpeechError, polly_client.PollyError)):
+                raise
+            tts_quota.printReport()
+            print('ERROR: {}\nRun the same command again to continue.'.format(e))
+            sys.exit(2)
+
+    for job in jobs:
+        jobQueue.finish(job.id)
+    run_planner.saveHistory()
+    tts_quota.printReport()
+    print('\n' + prompt_encoding.footprintReport(list(targetDirByLang.values()), prompt_encoding.profileUsingArgs(args)))
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Device log capture and latency analysis
+Records the log of a TonUINO and measures how fast it reacts: from a card
+being read to the start of playback, from a button press to the advert, from
+a play command to the DFPlayer reporting playback. Comparing the numbers of
+two captures shows the effect of e.g. a different card layout or encoding.
+
+Sources:
+    ws://host/ws_serial   the websocket of the ESP32 web serial page
+    /dev/ttyUSB0, COM3    a serial port (needs pyserial)
+    a file                a saved log (plain text or a capture of this tool)
+
+Every line is recorded with the time it arrived on the host and, where the
+firmware printed one (web serial: "[MMM SS.mmm] "), the device time. Device
+times are used for the analysis when all events have one, as they don't
+include network delays.
+
+Usage:
+    python3 device_log.py capture ws://tonuino.local/ws_serial -o before.jsonl
+    python3 device_log.py capture /dev/ttyUSB0 --baud 115200 -o before.jsonl
+    python3 device_log.py analyze before.jsonl after.jsonl
+    python3 device_log.py stub --port 8765          # local web serial stub
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import random
+import re
+import socket
+import socketserver
+import statistics
+import struct
+import sys
+import time
+import urllib.parse
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+DEFAULT_BAUD = 115200
+
+# "[MMM SS.mmm] " printed by the ESP32 logger (minutes wrap at 100)
+TIMESTAMP_RE = re.compile(r'^\[(\d{3}) (\d{2})\.(\d{3})\] ?(.*)$')
+TIMESTAMP_WRAP = 100 * 60.0
+
+# Log lines (info level) of the firmware -> event name
+EVENT_PATTERNS = [
+    ('card', re.compile(r'^CardData: (.*)$')),
+    ('button', re.compile(r'^btn/cmd: (.*)$')),
+    ('state', re.compile(r'^enter (\w+)')),
+    ('advert', re.compile(r'^play adv: (\d+)')),
+    ('play', re.compile(r'^play mp3 (\d+)')),
+    ('play', re.compile(r'^play (\d+-\d+)')),
+    ('playing', re.compile(r'^isPlaying: 1')),
+    ('stopped', re.compile(r'^isPlaying: 0')),
+    ('track_end', re.compile(r'^Track end: (\d+)')),
+    ('mp3_error', re.compile(r'^DfPl Err: (\d+)')),
+]
+
+# (name, start event, end event, max. seconds between them); a pairing also ends
+# at the next user action
+LATENCIES = [
+    ('card -> play command', 'card', 'play', 10.0),
+    ('card -> playback start', 'card', 'playing', 10.0),
+    ('button -> advert', 'button', 'advert', 5.0),
+    ('button -> state change', 'button', 'state', 5.0),
+    ('play command -> playing', 'play', 'playing', 5.0),
+    ('advert -> playing', 'advert', 'playing', 5.0),
+]
+TRIGGER_EVENTS = ('card', 'button')
+
+
+class LogLine(NamedTuple):
+    host_time: Optional[float]
+    device_time: Optional[float]
+    text: str
+
+
+class Event(NamedTuple):
+    time: float
+    name: str
+    value: str
+    text: str
+
+
+class DeviceClock:
+    """Turns the wrapping "[MMM SS.mmm]" timestamps into monotonic seconds"""
+
+    def __init__(self):
+        self.offset = 0.0
+        self.last = None
+
+    def parse(self, line: str) -> Tuple[Optional[float], str]:
+        match = TIMESTAMP_RE.match(line)
+        if not match:
+            return None, line
+        seconds = int(match.group(1)) * 60 + int(match.group(2)) + int(match.group(3)) / 1000
+        if self.last is not None and seconds + TIMESTAMP_WRAP / 2 < self.last:
+            self.offset += TIMESTAMP_WRAP
+        self.last = seconds
+        return seconds + self.offset, match.group(4)
+
+
+def split_webserial_message(message: str) -> List[str]:
+    """The log lines in a web serial message ("<pre>line</pre>", several on connect)"""
+    lines = []
+    for part in re.split(r'</pre>', message):
+        part = part.replace('<pre>', '')
+        lines += [html.unescape(line.rstrip('\r')) for line in part.split('\n') if line.strip()]
+    return lines
+
+
+# --- Sources -----------------------------------------------------------------
+
+class WebSocketClient:
+    """Minimal RFC 6455 client (text messages, ping/pong, close), standard library only"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ('ws', 'http'):
+            raise ValueError(f"Only ws:// URLs are supported: {url}")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = (parsed.path or '/') + (f"?{parsed.query}" if parsed.query else '')
+        self.sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        self.reader = self.sock.makefile('rb')
+        self._handshake()
+        self.sock.settimeout(None)
+
+    def _handshake(self):
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (f"GET {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\n"
+                   f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        self.sock.sendall(request.encode())
+        status = self.reader.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self.reader.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        if ' 101 ' not in status or headers.get('sec-websocket-accept') != expected:
+            raise ConnectionError(f"Websocket handshake failed: {status.strip()}")
+
+    def _read_exact(self, count: int) -> bytes:
+        data = self.reader.read(count)
+        if data is None or len(data) < count:
+            raise ConnectionError("Websocket closed")
+        return data
+
+    def _send(self, opcode: int, payload: bytes = b''):
+        # Frames from a client must be masked
+        mask = os.urandom(4)
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        else:
+            header += bytes([0x80 | 126]) + struct.pack('>H', len(payload))
+        self.sock.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    def messages(self) -> Iterator[str]:
+        """Yield the text messages until the connection is closed"""
+        fragments = []
+        while True:
+            try:
+                b1, b2 = self._read_exact(2)
+            except (ConnectionError, OSError):
+                return
+            opcode = b1 & 0x0f
+            length = b2 & 0x7f
+            if length == 126:
+                length = struct.unpack('>H', self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('>Q', self._read_exact(8))[0]
+            mask = self._read_exact(4) if b2 & 0x80 else None
+            payload = self._read_exact(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                self.close()
+                return
+            if opcode == 0x9:
+                self._send(0xa, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                fragments.append(payload)
+                if b1 & 0x80:
+                    yield b''.join(fragments).decode('utf-8', 'replace')
+                    fragments = []
+
+    def close(self):
+        try:
+            self._send(0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def read_websocket(url: str) -> Iterator[Tuple[float, str]]:
+    client = WebSocketClient(url)
+    try:
+        for message in client.messages():
+            now = time.time()
+            for line in split_webserial_message(message):
+                yield now, line
+    finally:
+        client.close()
+
+
+def read_serial(port: str, baud: int) -> Iterator[Tuple[float, str]]:
+    try:
+        import serial
+    except ImportError:
+        sys.exit("ERROR: Reading a serial port needs pyserial (pip install pyserial)")
+    with serial.Serial(port, baud, timeout=1) as connection:
+        while True:
+            raw = connection.readline()
+            if raw:
+                line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+                if line:
+                    yield time.time(), line
+
+
+def read_log_file(path: str) -> List[LogLine]:
+    """Lines of a capture (JSON lines) or a plain text log (e.g. copied from the web serial page)"""
+    clock = DeviceClock()
+    lines = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for raw in f:
+            raw = raw.rstrip('\r\n')
+            if not raw.strip():
+                continue
+            if raw.startswith('{'):
+                try:
+                    record = json.loads(raw)
+                    lines.append(LogLine(record.get('host_time'), record.get('device_time'), record['text']))
+                    continue
+                except (ValueError, KeyError):
+                    pass
+            device_time, text = clock.parse(raw)
+            lines.append(LogLine(None, device_time, text))
+    return lines
+
+
+def open_source(source: str, baud: int) -> Iterator[Tuple[float, str]]:
+    if source.startswith(('ws://', 'http://')):
+        return read_websocket(source)
+    if os.path.isfile(source):
+        return ((line.host_time or time.time(), line.text) for line in read_log_file(source))
+    return read_serial(source, baud)
+
+
+def capture(source: str, output: Optional[str], duration: Optional[float], baud: int, quiet: bool = False) -> int:
+    """Record a source as JSON lines (host time, device time, text); returns the number of lines"""
+    clock = DeviceClock()
+    out = open(output, 'a', encoding='utf-8') if output else None
+    end = time.time() + duration if duration else None
+    count = 0
+    try:
+        for host_time, line in open_source(source, baud):
+            device_time, text = clock.parse(line)
+            record = {'host_time': round(host_time, 4), 'device_time': device_time, 'text': text}
+            if out:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+            if not quiet:
+                print(line)
+            count += 1
+            if end and time.time() >= end:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out:
+            out.close()
+    return count
+
+
+# --- Analysis ----------------------------------------------------------------
+
+def parse_events(lines: Sequence[LogLine]) -> Tuple[List[Event], str]:
+    """Events of the log and the clock used ('device' or 'host')"""
+    use_device = bool(lines) and all(line.device_time is not None for line in lines)
+    clock = 'device' if use_device else 'host'
+    events = []
+    for line in lines:
+        timestamp = line.device_time if use_device else line.host_time
+        if timestamp is None:
+            continue
+        for name, pattern in EVENT_PATTERNS:
+            match = pattern.match(line.text.strip())
+            if match:
+                events.append(Event(timestamp, name, match.group(1) if match.groups() else '', line.text))
+                break
+    return events, clock
+
+
+def measure_latencies(events: Sequence[Event]) -> Dict[str, List[float]]:
+    """Seconds from each start event to the first following end event (per latency in LATENCIES)"""
+    results = {}
+    for name, start, end, window in LATENCIES:
+        values = []
+        for index, event in enumerate(events):
+            if event.name != start:
+                continue
+            for later in events[index + 1:]:
+                if later.time - event.time > window or later.name == start or later.name in TRIGGER_EVENTS:
+                    break
+                if later.name == end:
+                    values.append(later.time - event.time)
+                    break
+        results[name] = values
+    return results
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_stats(values: Sequence[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'min': min(values),
+        'median': statistics.median(values),
+        'p90': percentile(values, 0.9),
+        'p95': percentile(values, 0.95),
+        'max': max(values),
+    }
+
+
+def analyze(path: str) -> Dict:
+    lines = read_log_file(path)
+    events, clock = parse_events(lines)
+    counts = {}
+    for event in events:
+        counts[event.name] = counts.get(event.name, 0) + 1
+    return {
+        'file': path,
+        'clock': clock,
+        'lines': len(lines),
+        'events': counts,
+        'latencies': {name: latency_stats(values) for name, values in measure_latencies(events).items()},
+    }
+
+
+def print_report(report: Dict):
+    print(f"{report['file']}: {report['lines']} lines, {report['clock']} clock, events: " +
+          (', '.join(f"{name} {count}" for name, count in sorted(report['events'].items())) or 'none'))
+    print(f"  {'latency [ms]':26} {'count':>6} {'min':>7} {'median':>7} {'p90':>7} {'p95':>7} {'max':>7}")
+    for name, stats in report['latencies'].items():
+        if stats is None:
+            print(f"  {name:26} {0:6d}")
+            continue
+        print(f"  {name:26} {stats['count']:6d} " +
+              ' '.join(f"{stats[key] * 1000:7.0f}" for key in ('min', 'median', 'p90', 'p95', 'max')))
+
+
+def print_comparison(reports: Sequence[Dict]):
+    """Median latencies of several captures side by side (first one is the baseline)"""
+    base = reports[0]
+    print(f"\n{'median [ms]':26} " + ' '.join(f"{os.path.basename(r['file'])[:16]:>16}" for r in reports))
+    for name in base['latencies']:
+        cells = []
+        for report in reports:
+            stats = report['latencies'].get(name)
+            if stats is None:
+                cells.append(f"{'-':>16}")
+                continue
+            cell = f"{stats['median'] * 1000:.0f}"
+            base_stats = base['latencies'].get(name)
+            if report is not base and base_stats and base_stats['median'] > 0:
+                cell += f" ({(stats['median'] - base_stats['median']) / base_stats['median'] * 100:+.0f}%)"
+            cells.append(f"{cell:>16}")
+        print(f"{name:26} " + ' '.join(cells))
+
+
+# --- Stub server -------------------------------------------------------------
+
+def demo_session(rng: random.Random) -> Iterator[Tuple[float, str]]:
+    """(delay in seconds, log line) of a made-up session: cards, buttons and adverts"""
+    while True:
+        folder = rng.randint(1, 20)
+        yield rng.uniform(1.0, 2.0), f"CardData: 13 37 b3 47 02 {folder:02x} 02 00 00"
+        yield rng.uniform(0.01, 0.03), "enter StartPlay"
+        yield rng.uniform(0.05, 0.15), f"play {folder}-1"
+        yield rng.uniform(0.2, 0.6), "isPlaying: 1"
+        yield rng.uniform(0.01, 0.03), "enter Play"
+        for _ in range(rng.randint(0, 3)):
+            yield rng.uniform(1.0, 3.0), "btn/cmd: pause/pause"
+            yield rng.uniform(0.01, 0.03), "enter Pause"
+            yield rng.uniform(0.05, 0.2), "play adv: 1"
+            yield rng.uniform(0.2, 0.5), "isPlaying: 1"
+            yield rng.uniform(1.0, 3.0), "btn/cmd: pause/pause"
+            yield rng.uniform(0.01, 0.03), "enter Play"
+        yield rng.uniform(1.0, 3.0), "Track end: 1"
+
+
+def replay_session(path: str) -> Iterator[Tuple[float, str]]:
+    """(delay in seconds, log line) replaying a capture with its original timing"""
+    previous = None
+    for line in read_log_file(path):
+        timestamp = line.device_time if line.device_time is not None else line.host_time
+        delay = 0.0 if previous is None or timestamp is None else max(0.0, timestamp - previous)
+        previous = timestamp if timestamp is not None else previous
+        yield delay, line.text
+
+
+def format_device_time(seconds: float) -> str:
+    ms = int(seconds * 1000)
+    return f"[{ms // 60000 % 100:03d} {ms // 1000 % 60:02d}.{ms % 1000:03d}] "
+
+
+class WebSerialStub(socketserver.ThreadingTCPServer):
+    """Serves /ws_serial like the firmware: <pre>-wrapped, timestamped lines as websocket text messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, session_factory, speed: float = 1.0):
+        self.session_factory = session_factory
+        self.speed = speed
+        super().__init__(address, _WebSerialHandler)
+
+
+class _WebSerialHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = self.rfile.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'sec-websocket-key' not in headers or '/ws_serial' not in request:
+            self.wfile.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        device_time = 0.0
+        try:
+            for delay, text in self.server.session_factory():
+                time.sleep(delay / self.server.speed)
+                device_time += delay
+                self._send_text(f"<pre>{format_device_time(device_time)}{text}</pre>")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_text(self, text: str):
+        payload = text.encode('utf-8')
+        if len(payload) < 126:
+            header = bytes([0x81, len(payload)])
+        elif len(payload) < 65536:
+            header = bytes([0x81, 126]) + struct.pack('>H', len(payload))
+        else:
+            header = bytes([0x81, 127]) + struct.pack('>Q', len(payload))
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+
+def run_stub(port: int, replay: Optional[str], speed: float, seed: int):
+    if replay:
+        factory = lambda: replay_session(replay)
+    else:
+        factory = lambda: demo_session(random.Random(seed))
+    server = WebSerialStub(('127.0.0.1', port), factory, speed)
+    print(f"Web serial stub on ws://127.0.0.1:{port}/ws_serial ({'replaying ' + replay if replay else 'demo session'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Captures the TonUINO log and analyzes reaction latencies')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    capture_parser = commands.add_parser('capture', help='Record a web serial websocket, serial port or log file')
+    capture_parser.add_argument('source', help='ws://host/ws_serial, a serial port (e.g. /dev/ttyUSB0) or a log file')
+    capture_parser.add_argument('-o', '--output', help='Append the lines as JSON (host time, device time, text) to this file')
+    capture_parser.add_argument('--duration', type=float, help='Stop after this many seconds (default: until Ctrl+C)')
+    capture_parser.add_argument('--baud', type=int, default=DEFAULT_BAUD, help=f'Baud rate of a serial port (default: {DEFAULT_BAUD})')
+    capture_parser.add_argument('--quiet', action='store_true', help="Don't echo the lines")
+
+    analyze_parser = commands.add_parser('analyze', help='Latency distributions of one or more captures/logs')
+    analyze_parser.add_argument('files', nargs='+', help='Captures or plain text logs; the first is the baseline of the comparison')
+    analyze_parser.add_argument('--json', dest='json_file', help='Also write the results as JSON to this file')
+
+    stub_parser = commands.add_parser('stub', help='Serve a local web serial websocket for testing')
+    stub_parser.add_argument('--port', type=int, default=8765, help='Port (default: 8765)')
+    stub_parser.add_argument('--replay', help='Replay a capture or log instead of a made-up session')
+    stub_parser.add_argument('--speed', type=float, default=1.0, help='Replay speed factor (default: 1)')
+    stub_parser.add_argument('--seed', type=int, default=1, help='Random seed of the made-up session')
+
+    args = parser.parse_args()
+    if args.command == 'capture':
+        count = capture(args.source, args.output, args.duration, args.baud, args.quiet)
+        if args.output:
+            print(f"{count} lines written to {args.output}", file=sys.stderr)
+    elif args.command == 'analyze':
+        reports = [analyze(path) for path in args.files]
+        for report in reports:
+            print_report(report)
+        if len(reports) > 1:
+            print_comparison(reports)
+        if args.json_file:
+            with open(args.json_file, 'w', encoding='utf-8') as f:
+                json.dump(reports, f, indent=2)
+    else:
+        run_stub(args.port, args.replay, args.speed, args.seed)
+
+
+if __name__ == '__main__':
+    main()
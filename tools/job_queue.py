@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Durable job queue
+Long running work (AAX conversions, big imports, TTS batches) is recorded as
+jobs in a SQLite database in the cache directory. Every job consists of
+named steps, and the result of each finished step is stored as a
+checkpoint. When a run is interrupted (crash, closed window, Ctrl-C), the
+job is picked up again on the next start and only the unfinished steps are
+executed.
+
+Job states:
+    pending    waiting to be run (or interrupted and waiting to be resumed)
+    running    currently executed by a runner
+    waiting    needs a decision of the user (e.g. overwrite existing folders)
+    completed  all steps done, result waiting to be applied (e.g. to the
+               content database by the GUI)
+    done       finished
+    failed     a step raised an error (can be retried)
+    cancelled  cancelled by the user
+
+JobRunner executes pending jobs in worker threads. Steps declare whether
+they are CPU bound (ffmpeg, AAX conversion) or IO bound (copying, hashing),
+and the runner limits how many steps of each kind run at the same time, so
+the machine stays usable during overnight runs.
+
+Inspect the queue from the command line:
+    python3 job_queue.py list
+    python3 job_queue.py retry 12
+    python3 job_queue.py cancel 12
+    python3 job_queue.py purge
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import tonuino_cache
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+WAITING = 'waiting'
+COMPLETED = 'completed'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+UNFINISHED = (PENDING, RUNNING, WAITING, COMPLETED, FAILED)
+
+CPU = 'cpu'
+IO = 'io'
+
+POLL_INTERVAL = 0.5
+
+
+def default_limits() -> Dict[str, int]:
+    """Half of the CPU cores for CPU bound steps, one IO bound step at a time (SD cards don't like parallel writes)"""
+    return {CPU: max(1, (os.cpu_count() or 2) // 2), IO: 1}
+
+
+class JobError(Exception):
+    """Raised by a job step to fail the job with a message"""
+
+
+class JobWaiting(Exception):
+    """Raised by a job that needs a decision of the user before it can continue"""
+
+    def __init__(self, reason: str, payload: Any = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.payload = payload
+
+
+class JobInterrupted(Exception):
+    """Raised between steps when the runner is stopped; the job is resumed later"""
+
+
+def _params_key(params: Dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+class JobQueue:
+    """Jobs and step checkpoints in a SQLite database"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else tonuino_cache.cache_dir() / "jobs.sqlite3"
+        self.jobs_dir = self.path.parent / "jobs"
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        # Job parameters hold local paths and titles; secrets like activation bytes are never stored
+        os.chmod(self.path, 0o600)
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                error TEXT,
+                waiting TEXT,
+                result TEXT)''')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS steps (
+                job_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                result TEXT,
+                finished REAL NOT NULL,
+                PRIMARY KEY (job_id, name))''')
+
+    def _row(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['waiting'] = json.loads(job['waiting']) if job['waiting'] else None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def submit(self, kind: str, params: Dict, title: str = '') -> int:
+        """Add a job and return its id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO jobs (kind, title, params, status, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, title or kind, _params_key(params), PENDING, now, now))
+            return cursor.lastrowid
+
+    def find_unfinished(self, kind: str, params: Dict) -> Optional[Dict]:
+        """The newest unfinished job of a kind with exactly these parameters"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT * FROM jobs WHERE kind = ? AND params = ? AND status IN (?, ?, ?, ?, ?) ORDER BY id DESC',
+                (kind, _params_key(params)) + UNFINISHED).fetchone()
+        return self._row(row) if row else None
+
+    def resume_or_submit(self, kind: str, params: Dict, title: str = '') -> 'JobContext':
+        """Context of an unfinished job with the same parameters (to resume it), or of a new one
+
+        For command line tools that run their job themselves instead of using a JobRunner.
+        """
+        job = self.find_unfinished(kind, params)
+        job_id = job['id'] if job is not None else self.submit(kind, params, title)
+        self.set_status(job_id, RUNNING)
+        return JobContext(self, self.get(job_id))
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def jobs(self, statuses=None, kind: Optional[str] = None) -> List[Dict]:
+        query = 'SELECT * FROM jobs WHERE 1 = 1'
+        args = []
+        if statuses:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            args += list(statuses)
+        if kind:
+            query += ' AND kind = ?'
+            args.append(kind)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY id', args).fetchall()
+        return [self._row(row) for row in rows]
+
+    def set_status(self, job_id: int, status: str, error: Optional[str] = None,
+                   waiting: Any = None, result: Any = None):
+        with self._lock:
+            self._db.execute(
+                'UPDATE jobs SET status = ?, updated = ?, error = ?, waiting = ?, result = ? WHERE id = ?',
+                (status, time.time(), error, json.dumps(waiting) if waiting is not None else None,
+                 json.dumps(result) if result is not None else None, job_id))
+
+    def update_params(self, job_id: int, **params):
+        """Change parameters of a job (e.g. after the user made a decision) and queue it again"""
+        with self._lock:
+            job = self.get(job_id)
+            job['params'].update(params)
+            self._db.execute('UPDATE jobs SET params = ?, status = ?, waiting = NULL, updated = ? WHERE id = ?',
+                             (_params_key(job['params']), PENDING, time.time(), job_id))
+
+    def claim(self, kinds) -> Optional[Dict]:
+        """Mark the oldest pending job of one of the given kinds as running and return it"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND kind IN ({', '.join('?' * len(kinds))}) ORDER BY id",
+                (PENDING,) + tuple(kinds)).fetchone()
+            if row is None:
+                return None
+            self.set_status(row['id'], RUNNING)
+        return self._row(row)
+
+    def recover(self, kinds):
+        """Jobs of the given kinds left running by a crashed or closed process are queued again"""
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET status = ?, updated = ? WHERE status = ? AND kind IN ({', '.join('?' * len(kinds))})",
+                (PENDING, time.time(), RUNNING) + tuple(kinds))
+
+    def step_result(self, job_id: int, name: str):
+        """(True, result) if the step is checkpointed, otherwise (False, None)"""
+        with self._lock:
+            row = self._db.execute('SELECT result FROM steps WHERE job_id = ? AND name = ?', (job_id, name)).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row['result']) if row['result'] is not None else None
+
+    def save_step(self, job_id: int, name: str, result: Any = None):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO steps (job_id, name, result, finished) VALUES (?, ?, ?, ?)',
+                             (job_id, name, json.dumps(result), time.time()))
+            self._db.execute('UPDATE jobs SET updated = ? WHERE id = ?', (time.time(), job_id))
+
+    def step_count(self, job_id: int) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM steps WHERE job_id = ?', (job_id,)).fetchone()[0]
+
+    def work_dir(self, job_id: int) -> Path:
+        """A directory for intermediate files of a job (kept until the job is finished)"""
+        path = self.jobs_dir / str(job_id)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _cleanup(self, job_id: int):
+        with self._lock:
+            self._db.execute('DELETE FROM steps WHERE job_id = ?', (job_id,))
+        shutil.rmtree(self.jobs_dir / str(job_id), ignore_errors=True)
+
+    def finish(self, job_id: int):
+        """Mark a job as done and remove its checkpoints and intermediate files"""
+        self.set_status(job_id, DONE)
+        self._cleanup(job_id)
+
+    def cancel(self, job_id: int):
+        self.set_status(job_id, CANCELLED)
+        self._cleanup(job_id)
+
+    def retry(self, job_id: int):
+        """Queue a failed job again (finished steps are not repeated)"""
+        self.set_status(job_id, PENDING)
+
+    def purge(self):
+        """Forget done and cancelled jobs"""
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE status IN (?, ?)', (DONE, CANCELLED))
+
+
+class JobContext:
+    """Passed to job handlers: parameters, work directory and checkpointed steps"""
+
+    def __init__(self, queue: JobQueue, job: Dict, runner: Optional['JobRunner'] = None):
+        self.queue = queue
+        self.job = job
+        self.id = job['id']
+        self.params = job['params']
+        self.runner = runner
+
+    @property
+    def work_dir(self) -> Path:
+        return self.queue.work_dir(self.id)
+
+    def step(self, name: str, func: Callable[[], Any], resource: Optional[str] = None) -> Any:
+        """Run func unless the step was already done; returns its (JSON serializable) result"""
+        done, result = self.queue.step_result(self.id, name)
+        if done:
+            return result
+        if self.runner is not None and self.runner.stopping:
+            raise JobInterrupted()
+        if self.runner is not None and resource is not None:
+            with self.runner.slot(resource):
+                result = func()
+        else:
+            result = func()
+        self.queue.save_step(self.id, name, result)
+        return result
+
+    def file_step(self, path: str, func: Callable[[], Any], resource: Optional[str] = None) -> Any:
+        """A step writing the file path; a file left behind by an interrupted attempt is made again"""
+        if self.is_partial(path) and os.path.exists(path):
+            os.remove(path)
+        if not self.queue.step_result(self.id, path)[0]:
+            self.queue.save_step(self.id, 'started:' + path)
+        return self.step(path, func, resource)
+
+    def files_step(self, paths: List[str], func: Callable[[], Any], resource: Optional[str] = None):
+        """Like file_step() for a func writing several files at once (all are made again if interrupted)"""
+        for path in paths:
+            if self.is_partial(path) and os.path.exists(path):
+                os.remove(path)
+        if all(self.is_done(path) for path in paths):
+            return
+        if self.runner is not None and self.runner.stopping:
+            raise JobInterrupted()
+        for path in paths:
+            self.queue.save_step(self.id, 'started:' + path)
+        if self.runner is not None and resource is not None:
+            with self.runner.slot(resource):
+                func()
+        else:
+            func()
+        for path in paths:
+            self.queue.save_step(self.id, path)
+
+    def is_partial(self, path: str) -> bool:
+        """Whether writing the file path was started but not finished"""
+        return self.queue.step_result(self.id, 'started:' + path)[0] and not self.queue.step_result(self.id, path)[0]
+
+    def is_done(self, name: str) -> bool:
+        return self.queue.step_result(self.id, name)[0]
+
+    def wait(self, reason: str, payload: Any = None):
+        """Pause the job until the user decided (see JobQueue.update_params)"""
+        raise JobWaiting(reason, payload)
+
+
+class JobRunner:
+    """Runs pending jobs in worker threads, limiting concurrent CPU and IO bound steps
+
+    handlers maps job kinds to functions taking a JobContext and returning
+    the (JSON serializable) result. on_event(job_id, event, payload) is
+    called from the worker threads with the events 'completed' (payload:
+    result), 'waiting' (payload: {'reason', 'payload'}) and 'failed'
+    (payload: error message). With auto_finish, completed jobs are marked
+    done right away, otherwise the owner calls JobQueue.finish() after
+    applying the result.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[JobContext], Any]],
+                 limits: Optional[Dict[str, int]] = None, workers: Optional[int] = None,
+                 on_event: Optional[Callable[[int, str, Any], None]] = None, auto_finish: bool = False):
+        self.queue = queue
+        self.handlers = handlers
+        self.limits = dict(default_limits(), **(limits or {}))
+        self.slots = {name: threading.BoundedSemaphore(count) for name, count in self.limits.items()}
+        self.worker_count = workers or sum(self.limits.values())
+        self.on_event = on_event
+        self.auto_finish = auto_finish
+        self.stopping = False
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def slot(self, resource: str) -> threading.BoundedSemaphore:
+        return self.slots[resource]
+
+    def start(self):
+        """Resume interrupted jobs and start the workers"""
+        self.queue.recover(list(self.handlers))
+        self.stopping = False
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Let the workers stop after their current step (interrupted jobs are resumed on the next start)"""
+        self.stopping = True
+        self._wakeup.set()
+
+    def notify(self):
+        """Wake up the workers (after submitting a job)"""
+        self._wakeup.set()
+
+    def _emit(self, job_id: int, event: str, payload: Any):
+        if self.on_event is not None:
+            self.on_event(job_id, event, payload)
+
+    def _work(self):
+        while not self.stopping:
+            job = self.queue.claim(list(self.handlers))
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict):
+        context = JobContext(self.queue, job, self)
+        try:
+            result = self.handlers[job['kind']](context)
+        except JobInterrupted:
+            self.queue.set_status(job['id'], PENDING)
+        except JobWaiting as e:
+            waiting = {'reason': e.reason, 'payload': e.payload}
+            self.queue.set_status(job['id'], WAITING, waiting=waiting)
+            self._emit(job['id'], 'waiting', waiting)
+        except Exception as e:
+            self.queue.set_status(job['id'], FAILED, error=str(e))
+            self._emit(job['id'], 'failed', str(e))
+        else:
+            if self.auto_finish:
+                self.queue.finish(job['id'])
+            else:
+                self.queue.set_status(job['id'], COMPLETED, result=result)
+            self._emit(job['id'], 'completed', result)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Shows and manages the TonUINO tools job queue')
+    parser.add_argument('command', choices=['list', 'retry', 'cancel', 'purge'], nargs='?', default='list')
+    parser.add_argument('job_id', type=int, nargs='?', help='The job to retry or cancel')
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    if args.command in ('retry', 'cancel'):
+        if args.job_id is None or queue.get(args.job_id) is None:
+            parser.error('Please specify an existing job id')
+        (queue.retry if args.command == 'retry' else queue.cancel)(args.job_id)
+    elif args.command == 'purge':
+        queue.purge()
+
+    for job in queue.jobs():
+        updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['updated']))
+        detail = job['error'] or (job['waiting'] or {}).get('reason') or ''
+        print(f"{job['id']:5d}  {job['status']:10} {job['kind']:12} {updated}  "
+              f"{queue.step_count(job['id']):4d} steps  {job['title']}  {detail}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,4 +12,4 @@ if ! command -v python3 &> /dev/null; then
 fi
 
 # Launch the GUI
-python3 "$SCRIPT_DIR/audio_content_gui.py"
+python3 "$SCRIPT_DIR/audio_content_gui.py" "$@"
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - SD card layout planner
+Plans how imported audio files are laid out on the SD card so that the
+firmware limits are respected:
+
+- A folder holds at most MAX_TRACKS_IN_FOLDER tracks (`maxTracksInFolder` in
+  src/constants.hpp, the size of the firmware's track queue). Larger imports
+  spill over into consecutive folders.
+- Folders are numbered 01-99 (MAX_FOLDER).
+- Long single files (e.g. a whole audiobook in one mp3) can be split into
+  segments of roughly fixed duration. The cut points are moved to the
+  nearest silence, so that no word is cut in half. Segments are written
+  with stream copy (no re-encoding), and since the box remembers the
+  current track, resuming an audiobook only has to seek inside one segment.
+
+When the source files of a folder change (see "Refresh from Source" in the
+GUI), plan_refresh() keeps the playback order of the folder and only
+renumbers the tracks after the first change, since cards programmed for a
+single track and the saved position of an audiobook refer to track numbers.
+"""
+
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Callable, Collection, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import tool_registry
+
+
+MAX_TRACKS_IN_FOLDER = 255
+MAX_FOLDER = 99
+
+DEFAULT_SEGMENT_MINUTES = 20
+# A cut point may be moved this far (in seconds) to hit a silence
+SILENCE_SEARCH_WINDOW = 90
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_DURATION = 0.4
+
+
+class LayoutError(Exception):
+    """Raised when content can't be laid out within the firmware limits"""
+
+
+class PlannedTrack(NamedTuple):
+    """A track on the SD card: a source file or a time range of a source file"""
+    source: Path
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def is_segment(self) -> bool:
+        return self.start is not None or self.end is not None
+
+
+class FolderPlan(NamedTuple):
+    """The tracks that go into one SD card folder"""
+    folder: int
+    tracks: List[PlannedTrack]
+
+
+class RefreshPlan(NamedTuple):
+    """How the tracks of a folder change when its source files changed"""
+    writes: List[Tuple[int, PlannedTrack]]      # (track number, new track)
+    moves: List[Tuple[int, int]]                # (from, to) - unchanged tracks that get a new number
+    deletes: List[int]                          # old track numbers that are no longer used
+    origins: List[Tuple[Optional[str], int]]    # (source file name, part) of the tracks 1..n afterwards
+
+
+def probe_duration(path: Path) -> Optional[float]:
+    """Return the duration of an audio file in seconds (None if unknown)"""
+    tools = tool_registry.get_registry()
+    if not tools.available('ffprobe'):
+        return None
+    try:
+        output = subprocess.run(
+            [tools.path('ffprobe'), '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', str(path)],
+            capture_output=True, text=True, timeout=60).stdout
+        return float(output.strip())
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def detect_silences(path: Path, noise_db: float = SILENCE_NOISE_DB,
+                    min_duration: float = SILENCE_MIN_DURATION) -> List[Tuple[float, float]]:
+    """Return (start, end) of all silences in an audio file using ffmpeg's silencedetect"""
+    tools = tool_registry.get_registry()
+    if not tools.has_filter('ffmpeg', 'silencedetect'):
+        return []
+    try:
+        output = subprocess.run(
+            [tools.path('ffmpeg'), '-hide_banner', '-nostats', '-i', str(path),
+             '-af', f'silencedetect=noise={noise_db}dB:d={min_duration}', '-f', 'null', '-'],
+            capture_output=True, text=True, timeout=3600).stderr
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+
+    silences = []
+    start = None
+    for line in output.splitlines():
+        match = re.search(r'silence_start: (-?[\d.]+)', line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = re.search(r'silence_end: ([\d.]+)', line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def choose_split_points(duration: float, segment_seconds: float,
+                        silences: Sequence[Tuple[float, float]] = (),
+                        window: float = SILENCE_SEARCH_WINDOW) -> List[float]:
+    """Choose cut points roughly every segment_seconds, snapped to the nearest silence
+
+    Returns the cut points (not including 0 and duration). A remainder shorter
+    than half a segment is merged into the last segment.
+    """
+    points = []
+    last = 0.0
+    while duration - last > segment_seconds * 1.5:
+        target = last + segment_seconds
+        best = None
+        for start, end in silences:
+            middle = (start + end) / 2
+            if abs(middle - target) <= window and middle > last and \
+               (best is None or abs(middle - target) < abs(best - target)):
+                best = middle
+        point = round(best if best is not None else target, 3)
+        points.append(point)
+        last = point
+    return points
+
+
+def split_sources(sources: Sequence[Path], segment_minutes: float,
+                  log: Optional[Callable[[str], None]] = None) -> List[PlannedTrack]:
+    """Turn source files into planned tracks, splitting files longer than the segment length"""
+    segment_seconds = segment_minutes * 60
+    tracks = []
+    for source in sources:
+        duration = probe_duration(source)
+        if duration is None or duration <= segment_seconds * 1.5:
+            tracks.append(PlannedTrack(source))
+            continue
+
+        if log:
+            log(f"Looking for silences in {source.name} ({duration / 60:.0f} min)...")
+        points = choose_split_points(duration, segment_seconds, detect_silences(source))
+        bounds = [0.0] + points + [None]
+        for start, end in zip(bounds, bounds[1:]):
+            tracks.append(PlannedTrack(source, start, end))
+        if log:
+            log(f"Splitting {source.name} into {len(points) + 1} segments")
+    return tracks
+
+
+def folders_needed(track_count: int, max_tracks: int = MAX_TRACKS_IN_FOLDER) -> int:
+    """Number of folders needed for track_count tracks"""
+    return max(1, (track_count + max_tracks - 1) // max_tracks)
+
+
+def plan_layout(tracks: Sequence[PlannedTrack], first_folder: int,
+                max_tracks: int = MAX_TRACKS_IN_FOLDER) -> List[FolderPlan]:
+    """Distribute tracks over consecutive folders starting at first_folder"""
+    count = folders_needed(len(tracks), max_tracks)
+    last_folder = first_folder + count - 1
+    if first_folder < 1 or last_folder > MAX_FOLDER:
+        raise LayoutError(f"{len(tracks)} tracks need {count} folder(s) "
+                          f"({first_folder:02d}-{last_folder:02d}), but only folders 01-{MAX_FOLDER} exist")
+
+    # Spread the tracks evenly instead of leaving a tiny last folder
+    per_folder = (len(tracks) + count - 1) // count
+    return [FolderPlan(first_folder + i, list(tracks[i * per_folder:(i + 1) * per_folder]))
+            for i in range(count)]
+
+
+def write_track(track: PlannedTrack, dest_file: Path, copy: Callable[[Path, Path], None],
+                keep_metadata: bool = True) -> bool:
+    """Write a planned track: whole files are copied, segments are cut without re-encoding
+
+    The track is written to a temporary file next to dest_file, which then
+    replaces dest_file. An existing dest_file is never written into: it may
+    be a hardlink to a media store blob that other cards share (see
+    media_store.py), so every writer of card files has to go through here.
+    """
+    dest_file = Path(dest_file)
+    partial = dest_file.with_name(dest_file.name + '.partial')
+    try:
+        if track.is_segment:
+            if not _cut_segment(track, partial, keep_metadata):
+                return False
+        else:
+            copy(track.source, partial)
+        os.replace(partial, dest_file)
+        return True
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+def _cut_segment(track: PlannedTrack, dest_file: Path, keep_metadata: bool) -> bool:
+    tools = tool_registry.get_registry()
+    cmd = [tools.path('ffmpeg'), '-hide_banner', '-loglevel', 'error', '-y', '-i', str(track.source)]
+    if track.start:
+        cmd += ['-ss', str(track.start)]
+    if track.end is not None:
+        cmd += ['-to', str(track.end)]
+    if keep_metadata:
+        cmd += ['-map_metadata', '0']
+    else:
+        cmd += ['-map_metadata', '-1', '-id3v2_version', '0', '-write_id3v1', '0']
+    # The name of the temporary file doesn't tell ffmpeg the format
+    cmd += ['-map', '0:a', '-c', 'copy', '-f', 'mp3', str(dest_file)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode == 0
+
+
+def plan_refresh(origins: Sequence[Tuple[Optional[str], int]], outputs: Dict[str, List[PlannedTrack]],
+                 removed: Collection[str], max_tracks: int = MAX_TRACKS_IN_FOLDER) -> RefreshPlan:
+    """Plan the track numbers of a folder after some of its source files changed
+
+    origins are the (source file name, part) of the current tracks 1..n (name
+    None for tracks without a known source), outputs the new tracks of the
+    changed and added source files in order, removed the names of deleted
+    source files. The playback order is kept: the tracks of a changed file
+    take the place of its old tracks, tracks of removed files are dropped and
+    the following tracks move up, and the tracks of added files are appended
+    at the end. So every track before the first change keeps its number, and
+    unchanged files are only renamed, never copied again.
+    """
+    # (new track or None to keep the file, origin, current number of a kept file)
+    slots = []
+    placed = set()
+    for number, (name, part) in enumerate(origins, start=1):
+        if name in removed:
+            continue
+        if name in outputs:
+            if name not in placed:
+                placed.add(name)
+                slots += [(track, (name, i), None) for i, track in enumerate(outputs[name])]
+            continue
+        slots.append((None, (name, part), number))
+    for name in sorted(outputs):
+        if name not in placed:
+            slots += [(track, (name, i), None) for i, track in enumerate(outputs[name])]
+
+    if len(slots) > max_tracks:
+        raise LayoutError(f"{len(slots)} tracks don't fit into one folder (at most {max_tracks}) - "
+                          f"import the content again to spread it over several folders")
+    moves = [(current, number) for number, (track, _, current) in enumerate(slots, start=1)
+             if track is None and current != number]
+    moved = {current for current, _ in moves}
+    return RefreshPlan(
+        writes=[(number, track) for number, (track, _, _) in enumerate(slots, start=1) if track is not None],
+        moves=moves,
+        deletes=[number for number in range(len(slots) + 1, len(origins) + 1) if number not in moved],
+        origins=[origin for _, origin, _ in slots])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Buffered log sink
+Collects log messages from any thread in a queue so that a UI can insert
+them in batches (instead of one widget update per message), keeps only the
+most recent lines in a ring buffer and optionally mirrors everything to a
+rotating log file.
+"""
+
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+DEFAULT_MAX_LINES = 5000
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+_LEVELS = {
+    'ERROR': logging.ERROR,
+    'WARNING': logging.WARNING,
+    'SUCCESS': logging.INFO,
+    'INFO': logging.INFO,
+}
+
+
+class LogSink:
+    """Thread-safe, batched log pipeline"""
+
+    def __init__(self, max_lines: int = DEFAULT_MAX_LINES, log_file: Optional[Path] = None):
+        self.max_lines = max_lines
+        self.recent = collections.deque(maxlen=max_lines)
+        self._pending = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._logger = None
+        if log_file is not None:
+            self._logger = self._create_file_logger(Path(log_file))
+
+    def _create_file_logger(self, log_file: Path) -> Optional[logging.Logger]:
+        try:
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+        except OSError:
+            return None
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger = logging.getLogger(f'tonuino.{log_file}')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        return logger
+
+    def write(self, message: str, level: str = "INFO"):
+        """Queue a message (may be called from any thread)"""
+        self._pending.put((message, level))
+        if self._logger is not None:
+            self._logger.log(_LEVELS.get(level, logging.INFO), message)
+
+    def drain(self) -> List[Tuple[str, str]]:
+        """Return and remove all pending messages, remembering them in the ring buffer"""
+        batch = []
+        with self._lock:
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            self.recent.extend(batch)
+        return batch
+
+    def clear(self):
+        """Forget the retained lines (pending messages are kept)"""
+        with self._lock:
+            self.recent.clear()
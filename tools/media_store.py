@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Shared content-addressed media store
+Keeps one copy of every mp3 file used on any of your SD card staging trees
+(e.g. one sd-card-* directory per child or box), addressed by its MD5
+digest. The files of a card are reflinks (copy-on-write clones, on btrfs
+and xfs) or hardlinks (or copies where neither is possible) of these blobs,
+so a title that is put on a second card takes no extra disk space and no
+copying.
+
+A hardlinked card file *is* the blob: writing into it changes the blob and
+every other card holding the title. Card files must therefore never be
+written in place, only replaced. layout_planner.write_track() is the one
+writer of card tracks and writes a new file that replaces the old one;
+reflinks are preferred, since for them even an in-place write is harmless.
+
+Layout of the store directory:
+    objects/ab/abcdef....mp3   - blobs, named by MD5 digest
+    catalogue.json             - titles and which card folders hold them
+
+catalogue.json:
+    {
+      "titles": {
+        "<folder hash>": {"name": ..., "type": ...,
+                          "tracks": [{"file": "001.mp3", "md5": ..., "quick": ..., "size": ...}]}
+      },
+      "cards": {
+        "/path/to/sd-card-anna": {"03": "<folder hash>"}
+      }
+    }
+
+The title id is the folder hash as stored in .tonuino_hash.json, so the same
+album on two cards is one title.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import content_database
+
+
+# Linux ioctl to clone a file's extents (reflink) on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def _reflink(source: Path, dest: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if dest.exists():
+            dest.unlink()
+        return False
+
+
+def link_or_copy(source: Path, dest: Path) -> str:
+    """Make dest a reflink (or hardlink, or copy) of source; returns the method used"""
+    if dest.exists():
+        dest.unlink()
+    if _reflink(source, dest):
+        shutil.copystat(source, dest)
+        return 'reflink'
+    try:
+        os.link(source, dest)
+        return 'hardlink'
+    except OSError:
+        pass
+    shutil.copy2(source, dest)
+    return 'copy'
+
+
+class MediaStore:
+    """Content-addressed blob store with a cross-card title catalogue"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.catalogue_file = self.root / "catalogue.json"
+        self._lock = threading.RLock()
+        self.catalogue = {'titles': {}, 'cards': {}}
+        self.load()
+
+    def load(self):
+        """Load the catalogue"""
+        with self._lock:
+            if self.catalogue_file.exists():
+                try:
+                    with open(self.catalogue_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self.catalogue = {'titles': data.get('titles', {}), 'cards': data.get('cards', {})}
+                except Exception:
+                    pass
+
+    def save(self):
+        """Save the catalogue (atomically)"""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix="catalogue", dir=str(self.root))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.catalogue, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.catalogue_file)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / f"{digest}.mp3"
+
+    def has_blob(self, digest: str) -> bool:
+        return self.blob_path(digest).exists()
+
+    def adopt(self, path: Path, digest: Optional[str] = None) -> str:
+        """Put a file into the store and replace it by a link to the blob
+
+        If the blob doesn't exist yet, the file itself is linked into the store
+        (no copy on the same filesystem). If it exists, the file is replaced by
+        a link to it, so identical content is stored once. Returns the digest.
+        """
+        path = Path(path)
+        digest = digest or content_database.calculate_hash(path)
+        blob = self.blob_path(digest)
+        with self._lock:
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                link_or_copy(path, blob)
+            elif not os.path.samefile(blob, path):
+                link_or_copy(blob, path)
+        return digest
+
+    def materialize(self, digest: str, dest: Path) -> str:
+        """Create dest from a blob; returns the method used (reflink, hardlink or copy)"""
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            raise FileNotFoundError(f"Blob {digest} is missing in media store {self.root}")
+        return link_or_copy(blob, Path(dest))
+
+    @staticmethod
+    def card_key(card: Path) -> str:
+        return str(Path(card).absolute())
+
+    def record_title(self, card: Path, folder: str, entry: Dict):
+        """Remember that a card folder holds the title described by a database entry"""
+        tracks = [{k: t[k] for k in ('file', 'md5', 'quick', 'size') if k in t} for t in entry.get('tracks', [])]
+        with self._lock:
+            self.catalogue['titles'][entry['hash']] = {
+                'name': entry['name'],
+                'type': entry['type'],
+                'tracks': tracks,
+            }
+            self.catalogue['cards'].setdefault(self.card_key(card), {})[folder] = entry['hash']
+            self.save()
+
+    def forget_folder(self, card: Path, folder: str):
+        """Remove a card folder from the catalogue (titles and blobs are kept)"""
+        with self._lock:
+            folders = self.catalogue['cards'].get(self.card_key(card), {})
+            if folders.pop(folder, None) is not None:
+                self.save()
+
+    def title_locations(self, title_id: str) -> List[Dict[str, str]]:
+        """All card folders holding a title"""
+        return [{'card': card, 'folder': folder}
+                for card, folders in sorted(self.catalogue['cards'].items())
+                for folder, held in sorted(folders.items()) if held == title_id]
+
+    def titles(self) -> Dict[str, Dict]:
+        """All catalogued titles whose blobs are all present"""
+        return {title_id: title for title_id, title in self.catalogue['titles'].items()
+                if all(self.has_blob(t['md5']) for t in title['tracks'])}
+
+    def find_title(self, digests: List[str]) -> Optional[str]:
+        """A catalogued title whose tracks have exactly these digests (in this order), if any"""
+        for title_id, title in self.titles().items():
+            if [t['md5'] for t in title['tracks']] == list(digests):
+                return title_id
+        return None
+
+    def materialize_title(self, title_id: str, dest_folder: Path) -> Dict[str, int]:
+        """Create a card folder for a catalogued title; returns how many files used which method"""
+        title = self.catalogue['titles'][title_id]
+        dest_folder = Path(dest_folder)
+        dest_folder.mkdir(parents=True, exist_ok=True)
+        methods = {}
+        for track in title['tracks']:
+            method = self.materialize(track['md5'], dest_folder / track['file'])
+            methods[method] = methods.get(method, 0) + 1
+        return methods
+
+    def unreferenced_blobs(self) -> List[Path]:
+        """Blobs not used by any title that is on a card (candidates for cleanup)"""
+        used_titles = {held for folders in self.catalogue['cards'].values() for held in folders.values()}
+        used = {t['md5'] for title_id in used_titles
+                for t in self.catalogue['titles'].get(title_id, {}).get('tracks', [])}
+        if not self.objects.exists():
+            return []
+        return [blob for blob in sorted(self.objects.glob("*/*.mp3")) if blob.stem not in used]
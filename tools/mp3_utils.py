@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - MP3 file helpers
+Low level helpers working directly on the bytes of mp3 files, without
+decoding or re-encoding the audio.
+
+Tag stripping:
+    The DFPlayer has to read past all ID3v2 data (e.g. large APIC cover
+    images) before it can start decoding a track. strip_tags_copy() copies
+    only the audio frames (optionally with a minimal ID3v2 tag keeping the
+    basic text frames) in a single streaming pass.
+
+Frame level access:
+    parse_frame_header()/iter_frames() walk the MPEG audio frames of a file,
+    concat_mp3() joins files by appending their audio frames (skipping tags
+    and Xing/Info/VBRI header frames), which is lossless and needs no ffmpeg.
+    split_mp3() is the reverse: it cuts a file at frame boundaries.
+
+Stream info:
+    read_stream_info() returns duration, bitrate, sample rate and channels
+    from the first frames only (frame count of a Xing/Info/VBRI header, or
+    the constant bitrate), so long tracks don't have to be read completely.
+"""
+
+import bisect
+import shutil
+import struct
+from pathlib import Path
+from itertools import islice
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+APE_FOOTER_SIZE = 32
+COPY_BLOCK_SIZE = 1024 * 1024
+# Bytes read after the tags to find the first frames for read_stream_info()
+STREAM_INFO_READ_SIZE = 64 * 1024
+# Frames compared to tell CBR from VBR files without an info header
+STREAM_INFO_SAMPLE_FRAMES = 32
+
+# Text frames kept when stripping with keep_basic_tags (ID3v2.3/2.4 frame ids)
+BASIC_TAG_FRAMES = ('TIT2', 'TPE1', 'TALB', 'TRCK')
+
+# Rough estimate of how fast the DFPlayer reads data it has to skip on the SD card
+# (bytes per second). Only used to estimate start latency savings.
+DFPLAYER_SKIP_BYTES_PER_SEC = 200 * 1024
+
+
+# Bitrates in kbps by (MPEG version 1 or 2, layer)
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by MPEG version (2.5 is stored as 25)
+_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    25: (11025, 12000, 8000),
+}
+
+
+class FrameHeader(NamedTuple):
+    """A parsed MPEG audio frame header"""
+    version: int        # 1, 2 or 25 (MPEG 2.5)
+    layer: int          # 1, 2 or 3
+    bitrate: int        # kbps
+    sample_rate: int    # Hz
+    channels: int       # 1 or 2
+    length: int         # frame length in bytes
+    samples: int        # samples per frame
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+
+class StreamInfo(NamedTuple):
+    """Format and length of an mp3 file"""
+    duration: float     # seconds
+    bitrate: int        # kbps (average for VBR)
+    sample_rate: int    # Hz
+    channels: int       # 1 or 2
+    vbr: bool
+
+
+def parse_frame_header(data: bytes, offset: int = 0) -> Optional[FrameHeader]:
+    """Parse the 4 byte MPEG audio frame header at offset (None if there is no valid header)"""
+    if offset + 4 > len(data) or data[offset] != 0xff or (data[offset + 1] & 0xe0) != 0xe0:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = {0: 25, 2: 2, 3: 1}.get((b1 >> 3) & 0x03)
+    layer = {1: 3, 2: 2, 3: 1}.get((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples = 1152
+        length = 144 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate * 1000 // sample_rate + padding
+    return FrameHeader(version, layer, bitrate, sample_rate, channels, length, samples)
+
+
+def iter_frames(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, FrameHeader]]:
+    """Yield (offset, header) of all audio frames in data[start:end], skipping garbage between frames"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 4 <= end:
+        header = parse_frame_header(data, pos)
+        if header is None or pos + header.length > end:
+            pos += 1
+            continue
+        yield pos, header
+        pos += header.length
+
+
+def is_info_frame(data: bytes, offset: int, header: FrameHeader) -> bool:
+    """Whether the frame at offset is a Xing/Info/VBRI header frame (contains no audio)"""
+    if header.layer != 3:
+        return False
+    if header.version == 1:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    xing = offset + 4 + side_info
+    return data[xing:xing + 4] in (b'Xing', b'Info') or data[offset + 36:offset + 40] == b'VBRI'
+
+
+def _info_frame_count(data: bytes, offset: int, header: FrameHeader) -> Tuple[Optional[int], bool]:
+    """(frame count, VBR) from a Xing/Info or VBRI header frame at offset, (None, False) if there is none"""
+    if header.version == 1:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 12:
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 0x1:
+            return struct.unpack('>I', data[xing + 8:xing + 12])[0], data[xing:xing + 4] == b'Xing'
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI' and len(data) >= vbri + 18:
+        return struct.unpack('>I', data[vbri + 14:vbri + 18])[0], True
+    return None, False
+
+
+def read_stream_info(path: Path) -> Optional[StreamInfo]:
+    """Duration and format of an mp3 file, reading only its first frames (None if it has no audio frames)"""
+    path = Path(path)
+    file_size = path.stat().st_size
+    with open(path, 'rb') as f:
+        start, end, _ = find_audio_range(f, file_size)
+        f.seek(start)
+        data = f.read(min(STREAM_INFO_READ_SIZE, end - start))
+
+    # The first frame followed by another one (a single sync word may be garbage)
+    first = None
+    for offset, header in iter_frames(data):
+        following = offset + header.length
+        if following + 4 > len(data) or parse_frame_header(data, following) is not None:
+            first = (offset, header)
+            break
+    if first is None:
+        return None
+    offset, header = first
+    audio_bytes = end - start - offset
+
+    frame_count, vbr = _info_frame_count(data, offset, header)
+    if frame_count:
+        audio_bytes -= header.length
+        duration = frame_count * header.samples / header.sample_rate
+    else:
+        bitrates = [h.bitrate for _, h in islice(iter_frames(data, offset), STREAM_INFO_SAMPLE_FRAMES)]
+        vbr = len(set(bitrates)) > 1
+        # Without a frame count the duration of a VBR file is estimated from the sampled frames
+        duration = audio_bytes * 8 / (sum(bitrates) / len(bitrates) * 1000)
+    bitrate = round(audio_bytes * 8 / duration / 1000) if duration > 0 else header.bitrate
+    return StreamInfo(duration, bitrate, header.sample_rate, header.channels, vbr)
+
+
+def read_audio_frames(path: Path) -> Tuple[bytes, Optional[FrameHeader]]:
+    """Return the audio frames of an mp3 file (without tags and info frame) and the first frame header"""
+    data = Path(path).read_bytes()
+    with open(path, 'rb') as f:
+        start, end, _ = find_audio_range(f, len(data))
+
+    audio = bytearray()
+    first = None
+    for offset, header in iter_frames(data, start, end):
+        if first is None:
+            if is_info_frame(data, offset, header):
+                continue
+            first = header
+        audio += data[offset:offset + header.length]
+    return bytes(audio), first
+
+
+def concat_mp3(sources: Sequence[Path], dest: Path) -> bool:
+    """Join mp3 files at frame level without re-encoding
+
+    All sources must share MPEG version, layer, sample rate and channel count,
+    otherwise nothing is written and False is returned.
+    """
+    parts = []
+    reference = None
+    for source in sources:
+        audio, header = read_audio_frames(source)
+        if header is None:
+            return False
+        signature = (header.version, header.layer, header.sample_rate, header.channels)
+        if reference is None:
+            reference = signature
+        elif signature != reference:
+            return False
+        parts.append(audio)
+
+    with open(dest, 'wb') as f:
+        for audio in parts:
+            f.write(audio)
+    return True
+
+
+def split_mp3(source: Path, cuts: Sequence[float], dests: Sequence[Path]) -> bool:
+    """Split an mp3 file at frame level without re-encoding
+
+    cuts are times in seconds (ascending), each snapped to the nearest frame
+    boundary; part i (from cut i-1 to cut i) is written to dests[i], so there
+    must be one more destination than cuts. If the file has no audio or a
+    part would be empty, nothing is written and False is returned.
+    """
+    if len(dests) != len(cuts) + 1:
+        raise ValueError("split_mp3 needs one destination more than cuts")
+    data = Path(source).read_bytes()
+    with open(source, 'rb') as f:
+        start, end, _ = find_audio_range(f, len(data))
+
+    frames = []
+    starts = []
+    time = 0.0
+    for offset, header in iter_frames(data, start, end):
+        if not frames and is_info_frame(data, offset, header):
+            continue
+        frames.append((offset, header.length))
+        starts.append(time)
+        time += header.duration
+    if not frames:
+        return False
+
+    boundaries = [0]
+    for cut in cuts:
+        index = bisect.bisect_left(starts, cut)
+        if index > 0 and (index == len(starts) or cut - starts[index - 1] < starts[index] - cut):
+            index -= 1
+        boundaries.append(index)
+    boundaries.append(len(frames))
+    if any(b <= a for a, b in zip(boundaries, boundaries[1:])):
+        return False
+
+    for dest, first, last in zip(dests, boundaries, boundaries[1:]):
+        with open(dest, 'wb') as f:
+            for offset, length in frames[first:last]:
+                f.write(data[offset:offset + length])
+    return True
+
+
+def _synchsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _to_synchsafe(value: int) -> bytes:
+    return bytes([(value >> 21) & 0x7f, (value >> 14) & 0x7f, (value >> 7) & 0x7f, value & 0x7f])
+
+
+def id3v2_size(header: bytes) -> int:
+    """Total size of an ID3v2 tag (including header and footer), 0 if header is no ID3v2 header"""
+    if len(header) < ID3V2_HEADER_SIZE or header[:3] != b'ID3' or any(b & 0x80 for b in header[6:10]):
+        return 0
+    size = ID3V2_HEADER_SIZE + _synchsafe(header[6:10])
+    if header[5] & 0x10:
+        size += ID3V2_HEADER_SIZE  # footer
+    return size
+
+
+def find_audio_range(f: BinaryIO, file_size: int) -> Tuple[int, int, List[Tuple[int, int]]]:
+    """Locate the audio data of an mp3 file
+
+    Returns (audio_start, audio_end, leading_tags) where leading_tags lists
+    (offset, size) of the ID3v2 tags in front of the audio.
+    """
+    start = 0
+    leading_tags = []
+    while True:
+        f.seek(start)
+        size = id3v2_size(f.read(ID3V2_HEADER_SIZE))
+        if size == 0 or start + size > file_size:
+            break
+        leading_tags.append((start, size))
+        start += size
+
+    end = file_size
+    if end - start >= ID3V1_SIZE:
+        f.seek(end - ID3V1_SIZE)
+        if f.read(3) == b'TAG':
+            end -= ID3V1_SIZE
+    if end - start >= APE_FOOTER_SIZE:
+        f.seek(end - APE_FOOTER_SIZE)
+        footer = f.read(APE_FOOTER_SIZE)
+        if footer[:8] == b'APETAGEX':
+            ape_size = struct.unpack('<I', footer[12:16])[0]
+            has_header = struct.unpack('<I', footer[20:24])[0] & 0x80000000
+            ape_total = ape_size + (APE_FOOTER_SIZE if has_header else 0)
+            if ape_total <= end - start:
+                end -= ape_total
+    return start, end, leading_tags
+
+
+def basic_tag(tag: bytes, keep_frames=BASIC_TAG_FRAMES) -> Optional[bytes]:
+    """Build a minimal ID3v2 tag containing only keep_frames from an existing tag
+
+    Returns None if nothing can be kept (no frames, ID3v2.2, unsynchronisation
+    or extended header - those are simply dropped).
+    """
+    major, flags = tag[3], tag[5]
+    if major not in (3, 4) or flags & 0xc0:
+        return None
+
+    frames = b''
+    pos = ID3V2_HEADER_SIZE
+    end = ID3V2_HEADER_SIZE + _synchsafe(tag[6:10])
+    while pos + 10 <= end:
+        frame_id = tag[pos:pos + 4]
+        if frame_id[0] == 0:
+            break  # padding
+        size = _synchsafe(tag[pos + 4:pos + 8]) if major == 4 else struct.unpack('>I', tag[pos + 4:pos + 8])[0]
+        if pos + 10 + size > end:
+            break
+        if frame_id.decode('latin-1') in keep_frames:
+            frames += tag[pos:pos + 10 + size]
+        pos += 10 + size
+
+    if not frames:
+        return None
+    return b'ID3' + bytes([major, 0, 0]) + _to_synchsafe(len(frames)) + frames
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, start: int, end: int, block_size: int = COPY_BLOCK_SIZE):
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = src.read(min(block_size, remaining))
+        if not chunk:
+            break
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def strip_tags_copy(source: Path, dest: Path, keep_basic_tags: bool = False,
+                    block_size: int = COPY_BLOCK_SIZE) -> dict:
+    """Copy an mp3 file without ID3v1/ID3v2/APE tags (no re-encoding)
+
+    With keep_basic_tags a minimal ID3v2 tag with title, artist, album and
+    track number is written. The file is copied in blocks of block_size.
+    Returns size statistics:
+    {'before', 'after', 'leading_removed', 'latency_saved'} (latency in seconds).
+    """
+    source = Path(source)
+    dest = Path(dest)
+    before = source.stat().st_size
+    with open(source, 'rb') as src:
+        audio_start, audio_end, leading_tags = find_audio_range(src, before)
+        if audio_start == 0 and audio_end == before:
+            shutil.copyfile(source, dest)
+        else:
+            header = b''
+            if keep_basic_tags and leading_tags:
+                offset, size = leading_tags[0]
+                src.seek(offset)
+                header = basic_tag(src.read(size)) or b''
+            with open(dest, 'wb') as dst:
+                dst.write(header)
+                _copy_range(src, dst, audio_start, audio_end, block_size)
+    shutil.copystat(source, dest)
+
+    after = dest.stat().st_size
+    leading_removed = max(0, audio_start - (after - (audio_end - audio_start)))
+    return {
+        'before': before,
+        'after': after,
+        'leading_removed': leading_removed,
+        'latency_saved': leading_removed / DFPLAYER_SKIP_BYTES_PER_SEC,
+    }
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Creates the number messages `0001.mp3` - `0255.mp3` by joining a small set of
+# synthesized number fragments (units, tens, hundreds, connectors) instead of
+# synthesizing all 255 numbers separately.
+#
+# The fragments are joined at mp3 frame level (no re-encoding, no crossfade).
+# Only languages where the joined numbers sound natural are supported (see
+# `fragmentsByLang`), all others fall back to full synthesis.
+
+
+import os, shutil, audio_postprocess, mp3_utils, prompt_encoding, text_to_speech, tonuino_cache, tts_quota
+
+
+# Fragment id -> text to synthesize
+fragmentsByLang = {
+    'en': dict(
+        [('u{}'.format(n), str(n)) for n in range(1, 20)] +
+        [('t{}'.format(n), str(n)) for n in range(20, 100, 10)] +
+        [('h100', 'one hundred'), ('h200', 'two hundred')]
+    ),
+    'de': dict(
+        [('u{}'.format(n), str(n)) for n in range(1, 20)] +
+        [('t{}'.format(n), str(n)) for n in range(20, 100, 10)] +
+        [('x1', 'einund'), ('x2', 'zweiund'), ('x3', 'dreiund'), ('x4', 'vierund'), ('x5', 'fünfund'),
+         ('x6', 'sechsund'), ('x7', 'siebenund'), ('x8', 'achtund'), ('x9', 'neunund')] +
+        [('h100', 'einhundert'), ('h200', 'zweihundert')]
+    ),
+}
+
+MAX_NUMBER = 255
+
+
+def decomposeEn(number):
+    # 121 -> one hundred | twenty | one
+    if number >= 100:
+        return ['h{}'.format(number // 100 * 100)] + (decomposeEn(number % 100) if number % 100 else [])
+    if number < 20:
+        return ['u{}'.format(number)]
+    return ['t{}'.format(number // 10 * 10)] + (['u{}'.format(number % 10)] if number % 10 else [])
+
+
+def decomposeDe(number):
+    # 121 -> einhundert | einund | zwanzig
+    if number >= 100:
+        return ['h{}'.format(number // 100 * 100)] + (decomposeDe(number % 100) if number % 100 else [])
+    if number < 20:
+        return ['u{}'.format(number)]
+    return (['x{}'.format(number % 10)] if number % 10 else []) + ['t{}'.format(number // 10 * 10)]
+
+
+decomposeByLang = {
+    'en': decomposeEn,
+    'de': decomposeDe,
+}
+
+
+def isSupported(lang):
+    return lang in decomposeByLang
+
+
+def fragmentCount(lang):
+    return len(fragmentsByLang[lang]) if isSupported(lang) else MAX_NUMBER
+
+
+def fragmentDirUsingArgs(args):
+    # Fragments are kept in the cache (not on the SD card), so re-runs don't synthesize them again
+    # Fragments of different encodings can't be joined, so every encoding profile has its own
+    return os.path.join(tonuino_cache.cache_dir(), 'number_fragments', '{}-{}-{}{}'.format(
+        text_to_speech.engineNameUsingArgs(args), args.lang, prompt_encoding.profileUsingArgs(args).spec().replace(':', '-'),
+        '-post-processed' if getattr(args, 'post_process', False) else ''))
+
+
+def missingFragments(args):
+    # (fragment id, text) of the fragments not in the cache yet
+    fragmentDir = fragmentDirUsingArgs(args)
+    return [(fragmentId, text) for fragmentId, text in fragmentsByLang[args.lang].items()
+            if not os.path.isfile(os.path.join(fragmentDir, fragmentId + '.mp3'))]
+
+
+def createNumberPrompts(targetDir, args, synthesize=None):
+    # Creates `mp3/0001.mp3` - `mp3/0255.mp3` (and copies them to `advert/`) from fragments.
+    # Returns the numbers that could not be joined and must be synthesized completely.
+    if synthesize is None:
+        synthesize = text_to_speech.textToSpeechUsingArgs
+
+    lang = args.lang
+    decompose = decomposeByLang[lang]
+    fragmentDir = fragmentDirUsingArgs(args)
+    os.makedirs(fragmentDir, exist_ok=True)
+
+    fragmentFiles = {}
+    for fragmentId, text in fragmentsByLang[lang].items():
+        fragmentFile = os.path.join(fragmentDir, fragmentId + '.mp3')
+        if not os.path.isfile(fragmentFile):
+            synthesize(text=text, targetFile=fragmentFile, args=args)
+            # Trimming the fragments is what makes the joined numbers sound fluent
+            audio_postprocess.processFileUsingArgs(fragmentFile, args)
+        else:
+            tts_quota.usage.addCacheHits('cached number fragments')
+        fragmentFiles[fragmentId] = fragmentFile
+
+    failed = []
+    for i in range(1, MAX_NUMBER + 1):
+        targetFile1 = '{}/mp3/{:0>4}.mp3'.format(targetDir, i)
+        targetFile2 = '{}/advert/{:0>4}.mp3'.format(targetDir, i)
+        parts = [fragmentFiles[fragmentId] for fragmentId in decompose(i)]
+        if len(parts) == 1:
+            shutil.copy(parts[0], targetFile1)
+        elif not mp3_utils.concat_mp3(parts, targetFile1):
+            failed.append(i)
+            continue
+        shutil.copy(targetFile1, targetFile2)
+
+    print('\nCreated {} number messages from {} fragments'.format(MAX_NUMBER - len(failed), len(fragmentFiles)))
+    tts_quota.usage.addSaved('number fragments', MAX_NUMBER - len(failed) - len(fragmentFiles))
+    return failed
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Amazon Polly client using only the Python standard library.
+#
+# Instead of starting the AWS CLI (a Python interpreter, credential lookup and
+# a new TLS connection) for every prompt, one client is kept for the whole run:
+# requests are signed with AWS Signature Version 4 and sent over pooled
+# keep-alive HTTPS connections, throttling and server errors are retried with
+# exponential backoff, and several prompts can be synthesized concurrently.
+# An optional limiter (see `tts_quota.py`) paces the requests and is told
+# about throttling.
+#
+# Credentials and region are read like the AWS CLI does for the common cases:
+# environment variables (`AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY`,
+# `AWS_SESSION_TOKEN`, `AWS_REGION`/`AWS_DEFAULT_REGION`, `AWS_PROFILE`) or
+# `~/.aws/credentials` and `~/.aws/config`. If no credentials are found (e.g.
+# SSO logins), `text_to_speech.py` falls back to the AWS CLI.
+#
+# The endpoint can be overridden (`--amazon-endpoint` or `TONUINO_POLLY_ENDPOINT`),
+# e.g. to run against a local stub server.
+
+
+import configparser, datetime, hashlib, hmac, http.client, json, os, queue, random, threading, time, urllib.parse
+
+
+SERVICE = 'polly'
+DEFAULT_REGION = 'us-east-1'
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+TIMEOUT = 60
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class PollyError(Exception):
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+    @property
+    def retryable(self):
+        return self.status in RETRYABLE_STATUS or (self.code or '').startswith('Throttl')
+
+
+def readCredentials():
+    # Returns (accessKey, secretKey, sessionToken) or None
+    if os.environ.get('AWS_ACCESS_KEY_ID') and os.environ.get('AWS_SECRET_ACCESS_KEY'):
+        return (os.environ['AWS_ACCESS_KEY_ID'], os.environ['AWS_SECRET_ACCESS_KEY'], os.environ.get('AWS_SESSION_TOKEN'))
+
+    profile = os.environ.get('AWS_PROFILE', 'default')
+    credentialsFile = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.expanduser('~/.aws/credentials'))
+    config = configparser.RawConfigParser()
+    config.read(credentialsFile)
+    if config.has_option(profile, 'aws_access_key_id') and config.has_option(profile, 'aws_secret_access_key'):
+        return (config.get(profile, 'aws_access_key_id'), config.get(profile, 'aws_secret_access_key'),
+                config.get(profile, 'aws_session_token', fallback=None))
+    return None
+
+
+def readRegion():
+    region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
+    if region:
+        return region
+    profile = os.environ.get('AWS_PROFILE', 'default')
+    config = configparser.RawConfigParser()
+    config.read(os.environ.get('AWS_CONFIG_FILE', os.path.expanduser('~/.aws/config')))
+    section = profile if profile == 'default' else 'profile ' + profile
+    return config.get(section, 'region', fallback=DEFAULT_REGION)
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def signRequest(method, url, headers, body, credentials, region, now=None):
+    # Adds the AWS Signature Version 4 headers to `headers` (a dict) and returns it
+    accessKey, secretKey, sessionToken = credentials
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amzDate = now.strftime('%Y%m%dT%H%M%SZ')
+    dateStamp = now.strftime('%Y%m%d')
+    parsed = urllib.parse.urlsplit(url)
+    payloadHash = hashlib.sha256(body).hexdigest()
+
+    headers['host'] = parsed.netloc
+    headers['x-amz-date'] = amzDate
+    if sessionToken:
+        headers['x-amz-security-token'] = sessionToken
+
+    signedHeaders = ';'.join(sorted(name.lower() for name in headers))
+    canonicalHeaders = ''.join('{}:{}\n'.format(name.lower(), ' '.join(str(headers[name]).split()))
+                               for name in sorted(headers, key=str.lower))
+    canonicalRequest = '\n'.join([method, urllib.parse.quote(parsed.path or '/'), parsed.query,
+                                  canonicalHeaders, signedHeaders, payloadHash])
+    scope = '{}/{}/{}/aws4_request'.format(dateStamp, region, SERVICE)
+    stringToSign = '\n'.join(['AWS4-HMAC-SHA256', amzDate, scope, hashlib.sha256(canonicalRequest.encode('utf-8')).hexdigest()])
+
+    signingKey = _hmac(_hmac(_hmac(_hmac(('AWS4' + secretKey).encode('utf-8'), dateStamp), region), SERVICE), 'aws4_request')
+    signature = hmac.new(signingKey, stringToSign.encode('utf-8'), hashlib.sha256).hexdigest()
+    headers['Authorization'] = 'AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}'.format(
+        accessKey, scope, signedHeaders, signature)
+    return headers
+
+
+class PollyClient:
+    # Thread-safe: connections are taken from a pool, so up to `maxConnections`
+    # requests can run at the same time.
+
+    def __init__(self, credentials=None, region=None, endpoint=None, maxConnections=8, limiter=None):
+        self.credentials = credentials if credentials is not None else readCredentials()
+        self.region = region or readRegion()
+        self.endpoint = (endpoint or os.environ.get('TONUINO_POLLY_ENDPOINT')
+                         or 'https://polly.{}.amazonaws.com'.format(self.region)).rstrip('/')
+        parsed = urllib.parse.urlsplit(self.endpoint)
+        self._connectionClass = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self._host = parsed.netloc
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxConnections)
+        self.requestCount = 0
+        self.retryCount = 0
+        self._statsLock = threading.Lock()
+        self.limiter = limiter
+
+    def isAvailable(self):
+        return self.credentials is not None
+
+    def _connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connectionClass(self._host, timeout=TIMEOUT)
+
+    def _request(self, path, payload):
+        body = json.dumps(payload).encode('utf-8')
+        headers = signRequest('POST', self.endpoint + path, {'content-type': 'application/json'}, body,
+                              self.credentials, self.region)
+        with self._slots:
+            connection = self._connection()
+            try:
+                connection.request('POST', path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                raise PollyError('Connection to {} failed: {}'.format(self.endpoint, e), status=503)
+            if response.getheader('connection', '').lower() == 'close':
+                connection.close()
+            else:
+                self._pool.put(connection)
+
+        with self._statsLock:
+            self.requestCount += 1
+        if response.status != 200:
+            code = (response.getheader('x-amzn-ErrorType') or '').split(':')[0]
+            message = data.decode('utf-8', 'replace')
+            try:
+                error = json.loads(message)
+                code = code or error.get('__type', '').split('#')[-1]
+                message = error.get('message') or error.get('Message') or message
+            except ValueError:
+                pass
+            raise PollyError('Polly request failed ({} {}): {}'.format(response.status, code, message),
+                             status=response.status, code=code)
+        return data
+
+    def requestWithRetries(self, path, payload, attempts=MAX_ATTEMPTS, chars=0):
+        for attempt in range(attempts):
+            if self.limiter is not None:
+                self.limiter.acquire(chars)
+            try:
+                data = self._request(path, payload)
+                if self.limiter is not None:
+                    self.limiter.succeeded()
+                return data
+            except PollyError as e:
+                if not e.retryable or attempt == attempts - 1:
+                    raise
+                if self.limiter is not None and (e.status == 429 or (e.code or '').startswith('Throttl')):
+                    self.limiter.throttled()
+                with self._statsLock:
+                    self.retryCount += 1
+                # Exponential backoff with full jitter
+                time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    def synthesizeSpeech(self, text, voiceId, targetFile=None, textType='ssml', engine='neural', outputFormat='mp3',
+                         speechMarkTypes=None, billedChars=0, sampleRate=None):
+        # Returns the audio (or speech marks) and writes it to `targetFile` if given
+        payload = {'Engine': engine, 'OutputFormat': outputFormat, 'Text': text, 'TextType': textType, 'VoiceId': voiceId}
+        if sampleRate:
+            payload['SampleRate'] = str(sampleRate)
+        if speechMarkTypes:
+            payload['SpeechMarkTypes'] = list(speechMarkTypes)
+        data = self.requestWithRetries('/v1/speech', payload, chars=billedChars)
+        if targetFile is not None:
+            with open(targetFile, 'wb') as f:
+                f.write(data)
+        return data
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_client = None
+_clientLock = threading.Lock()
+_endpoint = None
+_limiter = None
+
+
+def configure(endpoint=None, limiter=None):
+    # Sets the endpoint and limiter used by getClient() (must be called before the first request)
+    global _endpoint, _limiter, _client
+    with _clientLock:
+        if endpoint != _endpoint or limiter is not _limiter:
+            _endpoint = endpoint
+            _limiter = limiter
+            _client = None
+
+
+def getClient():
+    # The shared client of this run
+    global _client
+    with _clientLock:
+        if _client is None:
+            _client = PollyClient(endpoint=_endpoint, limiter=_limiter)
+        return _client
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Profiling
+Lightweight span timers for finding out where the time of a run goes (TTS,
+ffmpeg, hashing, copying). Instrumented code wraps its stages in spans:
+
+    with profiling.span('copy_track', file=dest.name) as s:
+        shutil.copy2(source, dest)
+        s.add_bytes(dest.stat().st_size)
+
+Spans record their duration, the bytes processed and the number of
+subprocesses started while they were active (counted with an audit hook, so
+every subprocess call is included without touching it). Spans nest per
+thread.
+
+Profiling is off by default and spans then cost next to nothing. With
+`--profile [FILE]` (see add_profile_argument()) the tools enable it and, at
+the end of the run, write a Chrome trace (open it in chrome://tracing or
+https://ui.perfetto.dev) and print a summary table per span name.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+
+DEFAULT_TRACE_FILE = 'tonuino-profile.json'
+
+
+class Span:
+    """An active span; add_bytes()/set() attach data to it"""
+
+    def __init__(self, profiler: 'Profiler', name: str, category: str, args: dict):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.bytes = 0
+        self.subprocesses = 0
+        self.start = 0.0
+
+    def add_bytes(self, count: int):
+        self.bytes += count
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self) -> 'Span':
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].subprocesses += self.subprocesses
+        self.profiler._record(self, duration, failed=exc_type is not None)
+        return False
+
+
+class _NullSpan:
+    """Returned by span() while profiling is disabled"""
+
+    def add_bytes(self, count: int):
+        pass
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """Collects spans as Chrome trace events and per-name totals"""
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.events = []
+        self.totals = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'bytes': 0, 'subprocesses': 0, 'failed': 0})
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hook_installed = False
+
+    def enable(self):
+        self.enabled = True
+        if not self._hook_installed:
+            # Audit hooks can't be removed again, so the hook checks self.enabled
+            sys.addaudithook(self._audit)
+            self._hook_installed = True
+
+    def _audit(self, event: str, args):
+        if event == 'subprocess.Popen' and self.enabled:
+            stack = self._stack()
+            if stack:
+                stack[-1].subprocesses += 1
+            else:
+                with self._lock:
+                    self.totals['(outside spans)']['subprocesses'] += 1
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, category: str = '', **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, args)
+
+    def _record(self, span: Span, duration: float, failed: bool):
+        args = dict(span.args)
+        if span.bytes:
+            args['bytes'] = span.bytes
+        if span.subprocesses:
+            args['subprocesses'] = span.subprocesses
+        if failed:
+            args['failed'] = True
+        event = {
+            'name': span.name,
+            'cat': span.category or 'tonuino',
+            'ph': 'X',
+            'ts': (span.start - self.origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in args.items()},
+        }
+        with self._lock:
+            self.events.append(event)
+            totals = self.totals[span.name]
+            totals['count'] += 1
+            totals['seconds'] += duration
+            totals['bytes'] += span.bytes
+            totals['subprocesses'] += span.subprocesses
+            totals['failed'] += int(failed)
+
+    def write_trace(self, path: str):
+        """Write all spans in Chrome trace format"""
+        with self._lock:
+            events = list(self.events)
+        threads = {e['tid'] for e in events}
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                     'args': {'name': 'main' if tid == threading.main_thread().ident else f'thread {tid}'}}
+                    for tid in threads]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: dict(totals) for name, totals in self.totals.items()}
+
+    def summary_table(self) -> str:
+        """Per span name: count, total/mean time, bytes, throughput and subprocesses (slowest first)"""
+        lines = [f"{'span':24} {'count':>7} {'total [s]':>10} {'mean [ms]':>10} {'MB':>9} {'MB/s':>8} {'subproc':>8}"]
+        for name, totals in sorted(self.summary().items(), key=lambda item: -item[1]['seconds']):
+            count = totals['count']
+            seconds = totals['seconds']
+            mb = totals['bytes'] / (1024 * 1024)
+            mean = f"{seconds / count * 1000:10.1f}" if count else f"{'-':>10}"
+            rate = f"{mb / seconds:8.1f}" if totals['bytes'] and seconds > 0 else f"{'-':>8}"
+            size = f"{mb:9.1f}" if totals['bytes'] else f"{'-':>9}"
+            failed = f"  ({totals['failed']} failed)" if totals['failed'] else ''
+            lines.append(f"{name:24} {count:7d} {seconds:10.2f} {mean} {size} {rate} {totals['subprocesses']:8d}{failed}")
+        return '\n'.join(lines)
+
+    def finish(self, trace_file: Optional[str]):
+        """Write the trace (if a file is given) and print the summary table"""
+        if not self.events and not self.totals:
+            return
+        print('\n' + self.summary_table())
+        if trace_file:
+            self.write_trace(trace_file)
+            print(f"Profile written to {os.path.abspath(trace_file)} (open in chrome://tracing or ui.perfetto.dev)")
+
+
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def span(name: str, category: str = '', **args):
+    """Context manager timing a stage (no-op unless profiling is enabled)"""
+    return _profiler.span(name, category, **args)
+
+
+def enable(trace_file: Optional[str] = DEFAULT_TRACE_FILE):
+    """Enable profiling and write the trace and summary when the process exits"""
+    if not _profiler.enabled:
+        _profiler.enable()
+        atexit.register(_profiler.finish, trace_file)
+
+
+def add_profile_argument(argparser):
+    argparser.add_argument('--profile', nargs='?', const=DEFAULT_TRACE_FILE, default=None, metavar='FILE',
+                           help=f'Record timings of all stages, write them as Chrome trace to FILE '
+                                f'(default: {DEFAULT_TRACE_FILE}) and print a summary at the end')
+
+
+def enable_from_args(args):
+    if getattr(args, 'profile', None):
+        enable(args.profile)
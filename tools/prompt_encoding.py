@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# Encoding profiles for the generated prompts.
+#
+# Prompts are short mono speech played through a small speaker, so they don't
+# need CD quality. A profile sets sample rate, constant bitrate and channels and
+# is applied to every engine: the cloud engines are asked for the sample rate
+# (Polly only offers up to 24 kHz) and `say`/Coqui output is encoded with it.
+# Engine output at or below the sample rate and bitrate of the profile is kept
+# as it is (re-encoding it would only lose quality); only output above it is
+# re-encoded once (or by `--post-process`, which encodes anyway). Smaller files
+# need less space on the SD card and less data the DFPlayer has to read before
+# it starts playing. The default `standard` profile creates what older versions
+# did; `dfplayer` and `small` are opt-in.
+#
+# `footprintReport()` sums up the `mp3/` and `advert/` folders of a card and
+# estimates their size for every profile (the current one is marked with `*`).
+# Run this file to print it for an existing card: `python3 prompt_encoding.py sd-card`
+
+
+import argparse, os, subprocess, sys, threading, mp3_utils, tool_registry
+
+
+class EncodingProfile:
+    def __init__(self, name, sampleRate, bitrate, channels=1):
+        self.name = name
+        self.sampleRate = sampleRate
+        self.bitrate = bitrate          # kbps, constant
+        self.channels = channels
+
+    def spec(self):
+        # Identifies the encoding (e.g. in cache directories and job parameters)
+        return '{}:{}:{}'.format(self.sampleRate, self.bitrate, 'mono' if self.channels == 1 else 'stereo')
+
+    def describe(self):
+        return '{} Hz, {} kbps, {}'.format(self.sampleRate, self.bitrate, 'mono' if self.channels == 1 else 'stereo')
+
+    def bytesFor(self, seconds):
+        return seconds * self.bitrate * 125
+
+    def ffmpegArgs(self):
+        return ['-ar', str(self.sampleRate), '-ac', str(self.channels), '-acodec', 'libmp3lame', '-b:a', '{}k'.format(self.bitrate)]
+
+    def lameArgs(self):
+        return ['-b', str(self.bitrate), '--cbr', '-m', 'm' if self.channels == 1 else 'j', '--resample', '{:g}'.format(self.sampleRate / 1000.0)]
+
+
+profiles = {
+    # Sample rate and bitrate the prompts had before there were profiles
+    'standard': EncodingProfile('standard', 44100, 128),
+    # Clear speech at a third of the size; MPEG-2 (22.05 kHz) is decoded by all DFPlayer clones
+    'dfplayer': EncodingProfile('dfplayer', 22050, 48),
+    # Smallest files, slightly muffled
+    'small': EncodingProfile('small', 16000, 32),
+}
+defaultProfileName = 'standard'
+
+# Sample rates Polly offers for mp3
+pollySampleRates = (8000, 16000, 22050, 24000)
+
+# Layer III bitrates (kbps) by sample rate: MPEG-1 and MPEG-2/2.5
+_mpeg1Bitrates = (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_mpeg2Bitrates = (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+bitratesBySampleRate = dict([(rate, _mpeg1Bitrates) for rate in (32000, 44100, 48000)] +
+                            [(rate, _mpeg2Bitrates) for rate in (8000, 11025, 12000, 16000, 22050, 24000)])
+
+_warnedAboutEncoder = False
+_warnLock = threading.Lock()
+
+
+def parseProfile(value):
+    # A profile name or `RATE:KBPS[:mono|stereo]`, e.g. `24000:64`
+    if value in profiles:
+        return profiles[value]
+    parts = value.split(':')
+    try:
+        sampleRate, bitrate = int(parts[0]), int(parts[1])
+        channels = {'mono': 1, 'stereo': 2}[parts[2] if len(parts) > 2 else 'mono']
+        if len(parts) > 3:
+            raise ValueError()
+    except (ValueError, IndexError, KeyError):
+        raise argparse.ArgumentTypeError('`{}` is neither a profile ({}) nor RATE:KBPS[:mono|stereo]'.format(value, ', '.join(profiles)))
+    if sampleRate not in bitratesBySampleRate:
+        raise argparse.ArgumentTypeError('Unsupported mp3 sample rate: {}'.format(sampleRate))
+    if bitrate not in bitratesBySampleRate[sampleRate]:
+        raise argparse.ArgumentTypeError('Bitrate {} kbps is not possible at {} Hz'.format(bitrate, sampleRate))
+    profile = EncodingProfile(value, sampleRate, bitrate, channels)
+    return next((named for named in profiles.values() if named.spec() == profile.spec()), profile)
+
+
+def addArgumentsToArgparser(argparser):
+    argparser.add_argument('--encoding-profile', type=parseProfile, default=profiles[defaultProfileName], help='Encoding of the prompts: {} or RATE:KBPS[:mono|stereo] (default: {})'.format(
+        ', '.join('`{}` ({})'.format(name, profile.describe()) for name, profile in profiles.items()), defaultProfileName))
+
+
+def profileUsingArgs(args):
+    return getattr(args, 'encoding_profile', None) or profiles[defaultProfileName]
+
+
+def pollySampleRate(profile):
+    # The highest rate Polly offers that doesn't exceed the profile (resampled afterwards if it differs)
+    return max([rate for rate in pollySampleRates if rate <= profile.sampleRate] or [min(pollySampleRates)])
+
+
+def readMp3Info(path):
+    # Returns (first audio frame header, set of bitrates, duration in seconds, size) or None
+    with open(path, 'rb') as f:
+        data = f.read()
+        start, end, _ = mp3_utils.find_audio_range(f, len(data))
+    first = None
+    bitrates = set()
+    duration = 0.0
+    for offset, header in mp3_utils.iter_frames(data, start, end):
+        if first is None:
+            if mp3_utils.is_info_frame(data, offset, header):
+                continue
+            first = header
+        bitrates.add(header.bitrate)
+        duration += header.duration
+    if first is None:
+        return None
+    return first, bitrates, duration, len(data)
+
+
+def matches(path, profile):
+    # Whether an mp3 file needs no re-encoding: sample rate, bitrate and channels don't exceed the profile
+    info = readMp3Info(path)
+    if info is None:
+        return False
+    first, bitrates, _, _ = info
+    return first.sample_rate <= profile.sampleRate and first.channels <= profile.channels and max(bitrates) <= profile.bitrate
+
+
+def encoderAvailable():
+    tools = tool_registry.get_registry()
+    return tools.has_encoder('ffmpeg', 'libmp3lame') or tools.available('lame')
+
+
+def encode(inputFile, targetFile, profile):
+    # Encodes any audio file ffmpeg (or lame) can read. Returns False if no encoder is installed
+    # or encoding failed (a partially written target file is removed then).
+    tools = tool_registry.get_registry()
+    if tools.has_encoder('ffmpeg', 'libmp3lame'):
+        returnCode = subprocess.call([ tools.path('ffmpeg'), '-hide_banner', '-loglevel', 'error', '-y', '-i', inputFile ] + profile.ffmpegArgs() + [ targetFile ])
+    elif tools.available('lame'):
+        mp3Input = ['--mp3input'] if inputFile.lower().endswith('.mp3') else []
+        returnCode = subprocess.call([ tools.path('lame'), '--quiet' ] + mp3Input + profile.lameArgs() + [ inputFile, targetFile ])
+    else:
+        return False
+    if returnCode != 0:
+        if os.path.isfile(targetFile):
+            os.remove(targetFile)
+        return False
+    return os.path.isfile(targetFile)
+
+
+def conform(path, profile):
+    # Re-encodes an mp3 file in place if it exceeds the encoding of the profile
+    global _warnedAboutEncoder
+    if matches(path, profile):
+        return True
+    if not encoderAvailable():
+        with _warnLock:
+            if not _warnedAboutEncoder:
+                _warnedAboutEncoder = True
+                print('WARNING: Neither ffmpeg (with libmp3lame) nor lame is installed -> Keeping prompts in the encoding of the engine instead of {}'.format(profile.describe()))
+        return False
+    tempFile = path + '.encoding.mp3'
+    if not encode(path, tempFile, profile):
+        print('WARNING: Encoding {} with {} failed -> Keeping the encoding of the engine'.format(path, profile.describe()))
+        return False
+    os.replace(tempFile, path)
+    return True
+
+
+def footprint(targetDirs):
+    # (number of files, bytes, seconds of audio, {encoding: number of files}) of the prompts
+    # in `mp3/` and `advert/` of the target dirs
+    count = 0
+    size = 0
+    duration = 0.0
+    encodings = {}
+    for targetDir in targetDirs:
+        for subDir in ('mp3', 'advert'):
+            folder = os.path.join(targetDir, subDir)
+            if not os.path.isdir(folder):
+                continue
+            for fileName in os.listdir(folder):
+                if not fileName.lower().endswith('.mp3'):
+                    continue
+                path = os.path.join(folder, fileName)
+                info = readMp3Info(path)
+                count += 1
+                size += os.path.getsize(path)
+                if info is not None:
+                    first, bitrates, seconds, _ = info
+                    duration += seconds
+                    encoding = '{} Hz, {}, {}'.format(first.sample_rate,
+                        '{} kbps'.format(first.bitrate) if len(bitrates) == 1 else 'VBR', 'mono' if first.channels == 1 else 'stereo')
+                    encodings[encoding] = encodings.get(encoding, 0) + 1
+    return count, size, duration, encodings
+
+
+def footprintReport(targetDirs, currentProfile=None):
+    # Sizes for the other profiles are estimated from the duration of the audio (CBR)
+    count, size, duration, encodings = footprint(targetDirs)
+    if not count:
+        return 'No prompts found in mp3/ or advert/ of ' + ', '.join(targetDirs)
+    lines = ['SD card footprint of mp3/ + advert/: {} files, {:.1f} minutes of audio, {:.2f} MB'.format(count, duration / 60, size / 1048576.0),
+             '  Encoded as: ' + ', '.join('{} ({} files)'.format(encoding, n) for encoding, n in sorted(encodings.items(), key=lambda item: -item[1]))]
+    candidates = list(profiles.values())
+    if currentProfile is not None and currentProfile not in candidates:
+        candidates.append(currentProfile)
+    for profile in candidates:
+        estimate = profile.bytesFor(duration)
+        lines.append('  {} {:10} {:26} about {:7.2f} MB ({:+.0f}%)'.format(
+            '*' if currentProfile is not None and profile.spec() == currentProfile.spec() else ' ',
+            profile.name, profile.describe(), estimate / 1048576.0, (estimate - size) / size * 100 if size else 0))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Prints the size of the prompts (`mp3/` + `advert/`) of SD card directories and estimates it for every encoding profile.')
+    argparser.add_argument('dirs', nargs='+', help='SD card directories (containing `mp3/` and `advert/`)')
+    args = argparser.parse_args()
+    for targetDir in args.dirs:
+        if not os.path.isdir(targetDir):
+            print('ERROR: Not a directory: ' + os.path.abspath(targetDir))
+            sys.exit(1)
+    print(footprintReport(args.dirs))
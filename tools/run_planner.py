@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Plans generation runs and estimates their duration and cost.
+#
+# While the tools run, they record how long each kind of work took (one TTS
+# request per engine, one post-processing, one lead-in) and how big the
+# generated prompts are. At the end of a run these numbers are merged into a
+# history in the cache directory (`run_history.json`, a moving average that
+# follows the latest runs).
+#
+# A dry run fills a `RunPlan` with the work that is still needed after looking
+# at existing files, checkpoints and caches, and `RunPlan.report()` turns it
+# into numbers of syntheses, ffmpeg invocations and bytes, and an estimate of
+# wall time (for several worker counts) and cost based on that history.
+
+
+import contextlib, math, threading, time, tonuino_cache, tts_quota
+
+
+# Weight of the latest run in the moving averages
+historySmoothing = 0.3
+
+# Seconds per unit (or bytes for `bytes:*`) used until a run recorded real numbers
+defaultValueByMetric = {
+    'tts:amazon': 0.5,
+    'tts:google': 0.5,
+    'tts:say': 1.0,
+    'tts:coqui': 3.0,
+    'tts_batch:amazon': 0.15,       # per prompt of a batch
+    'tts_batch:google': 0.1,
+    'ffmpeg:post_process': 0.6,     # measure + filter one file
+    'ffmpeg:lead_in': 0.5,          # detect, resample and concat one track
+    'bytes:prompt': 16 * 1024,      # size of one generated prompt
+}
+
+# USD per million characters (neural/WaveNet voices)
+defaultPricePerMillionCharsByEngine = {
+    'amazon': 16.0,
+    'google': 16.0,
+}
+
+# ffmpeg invocations per unit of work
+ffmpegCallsByMetric = {
+    'ffmpeg:post_process': 2,
+    'ffmpeg:lead_in': 3,
+}
+
+_recorded = {}
+_recordedLock = threading.Lock()
+
+
+def addArgumentsToArgparser(argparser):
+    argparser.add_argument('--price-per-million-chars', type=float, default=None, help='Price of the cloud engine for the cost estimate of `--dry-run` in USD (default: {})'.format(
+        ', '.join('{} {}'.format(engine, price) for engine, price in defaultPricePerMillionCharsByEngine.items())))
+
+
+def record(metric, value, units=1):
+    # Adds `value` (seconds or bytes) for `units` units of work of a kind
+    with _recordedLock:
+        total = _recorded.setdefault(metric, [0.0, 0])
+        total[0] += value
+        total[1] += units
+
+
+@contextlib.contextmanager
+def timed(metric, units=1):
+    start = time.perf_counter()
+    yield
+    record(metric, time.perf_counter() - start, units)
+
+
+def historyCache():
+    return tonuino_cache.JsonCache('run_history')
+
+
+def saveHistory():
+    # Merges the numbers recorded in this run into the history
+    with _recordedLock:
+        recorded = {metric: total for metric, total in _recorded.items() if total[1]}
+        _recorded.clear()
+    if not recorded:
+        return
+    history = historyCache()
+    for metric, (value, units) in recorded.items():
+        perUnit = value / units
+        old = history.get(metric)
+        if old is None:
+            history.set(metric, {'mean': perUnit, 'runs': 1, 'updated': time.time()})
+        else:
+            history.set(metric, {'mean': old['mean'] * (1 - historySmoothing) + perUnit * historySmoothing,
+                                 'runs': old['runs'] + 1, 'updated': time.time()})
+    history.save()
+
+
+class RunPlan:
+    def __init__(self, engine, history=None):
+        self.engine = engine
+        self.history = history if history is not None else historyCache()
+        self.work = {}          # metric -> units of work
+        self.requests = 0
+        self.prompts = 0
+        self.chars = 0
+        self.filesToWrite = 0
+        self.bytesToCopy = 0
+        self.cacheHits = {}
+
+    def add(self, metric, units=1):
+        self.work[metric] = self.work.get(metric, 0) + units
+
+    def addSynthesis(self, text):
+        self.add('tts:' + self.engine)
+        self.requests += 1
+        self.prompts += 1
+        self.chars += len(text)
+
+    def addBatch(self, texts, requests):
+        self.add('tts_batch:' + self.engine, len(texts))
+        self.requests += requests
+        self.prompts += len(texts)
+        self.chars += requests * sum(len(text) for text in texts)
+
+    def addCacheHits(self, kind, count=1):
+        if count:
+            self.cacheHits[kind] = self.cacheHits.get(kind, 0) + count
+
+    def value(self, metric):
+        # (value, whether it comes from recorded runs)
+        entry = self.history.get(metric)
+        if entry is not None:
+            return entry['mean'], True
+        return defaultValueByMetric.get(metric, 0.0), False
+
+    def ffmpegCalls(self):
+        calls = sum(units * ffmpegCallsByMetric.get(metric, 0) for metric, units in self.work.items())
+        if self.engine in ('say', 'coqui'):
+            calls += self.prompts  # encoding to mp3
+        return calls
+
+    def workSeconds(self):
+        return sum(units * self.value(metric)[0] for metric, units in self.work.items())
+
+    def wallSeconds(self, workers):
+        # The work spread over the workers, but not faster than the quota of a cloud engine
+        seconds = self.workSeconds() / max(1, workers)
+        limiter = tts_quota.getLimiter(self.engine)
+        if limiter is not None:
+            seconds = max(seconds, self.requests / limiter.requestsPerSecond,
+                          self.chars / limiter.charsPerMinute * 60 if limiter.charsPerMinute else 0)
+        return seconds
+
+    def cost(self, pricePerMillionChars=None):
+        if pricePerMillionChars is None:
+            pricePerMillionChars = defaultPricePerMillionCharsByEngine.get(self.engine, 0.0)
+        return self.chars / 1000000.0 * pricePerMillionChars
+
+    def report(self, workerCounts=(1,), pricePerMillionChars=None):
+        promptBytes = self.value('bytes:prompt')[0]
+        lines = [
+            'Plan ({}):'.format(self.engine),
+            '  {} prompts to synthesize with {} requests ({} characters)'.format(self.prompts, self.requests, self.chars),
+            '  {} ffmpeg invocations'.format(self.ffmpegCalls()),
+            '  {} files to write (about {:.1f} MB), {:.1f} MB to copy'.format(
+                self.filesToWrite, self.filesToWrite * promptBytes / 1048576.0, self.bytesToCopy / 1048576.0),
+        ]
+        if self.cacheHits:
+            lines.append('  Already done: ' + ', '.join('{} {}'.format(n, kind) for kind, n in sorted(self.cacheHits.items())))
+        for workers in workerCounts:
+            lines.append('  Estimated time with {} worker{}: {}'.format(workers, '' if workers == 1 else 's', formatDuration(self.wallSeconds(workers))))
+        cost = self.cost(pricePerMillionChars)
+        if cost:
+            lines.append('  Estimated cost: ${:.2f}'.format(cost))
+        guessed = sorted(metric for metric in self.work if not self.value(metric)[1])
+        if guessed:
+            lines.append('  (No recorded runs yet for {} - using default timings)'.format(', '.join(guessed)))
+        return '\n'.join(lines)
+
+
+def formatDuration(seconds):
+    seconds = int(math.ceil(seconds))
+    if seconds < 60:
+        return '{}s'.format(seconds)
+    if seconds < 3600:
+        return '{}m {:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}h {:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
@@ -4,27 +4,30 @@ Test script for AAX support in TonUINO GUI
 Verifies that AAX detection and converter checks work properly
 """
 
+import os
 import sys
-import subprocess
+import tempfile
 from pathlib import Path
 
+# Keep the tool registry cache written by the tests out of the real cache
+os.environ['TONUINO_CACHE_DIR'] = tempfile.mkdtemp(prefix='tonuino-test-cache-')
+
 def test_converter_check():
     """Test if we can detect AAX converters"""
     print("Testing AAX converter detection...")
     
+    import tool_registry
+    registry = tool_registry.get_registry()
+    registry.probe_all()
+    
     converters = ['AAXtoMP3', 'ffmpeg']
     found = []
     
     for converter in converters:
-        try:
-            result = subprocess.run([converter, '-version'], 
-                                   capture_output=True, 
-                                   text=True, 
-                                   timeout=5)
-            if result.returncode == 0 or converter == 'ffmpeg':
-                found.append(converter)
-                print(f"  ✅ Found: {converter}")
-        except (FileNotFoundError, subprocess.TimeoutExpired):
+        if registry.available(converter):
+            found.append(converter)
+            print(f"  ✅ Found: {converter} ({registry.version(converter)})")
+        else:
             print(f"  ❌ Not found: {converter}")
     
     if found:
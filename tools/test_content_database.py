@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-track fingerprints of the content database
+Run with `python3 test_content_database.py` or pytest
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+# Keep the test files out of the real caches
+os.environ['TONUINO_CACHE_DIR'] = tempfile.mkdtemp(prefix='tonuino-test-cache-')
+
+import content_database
+from content_database import VERIFY_CACHED, VERIFY_FULL, VERIFY_QUICK
+
+
+def write_tracks(folder: Path, contents: dict):
+    folder.mkdir(parents=True, exist_ok=True)
+    for name, data in contents.items():
+        (folder / name).write_bytes(data)
+
+
+def entry_of(folder: Path) -> dict:
+    entry = {}
+    content_database.attach_fingerprints(entry, content_database.scan_tracks(folder))
+    return entry
+
+
+def names(diff: dict) -> dict:
+    return {kind: [t['file'] for t in tracks] for kind, tracks in diff.items()}
+
+
+def rewrite_keeping_stat(path: Path, data: bytes):
+    """Change the content of a file without changing its size and mtime"""
+    stat = path.stat()
+    path.write_bytes(data)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_diff_unchanged_folder():
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / '01'
+        write_tracks(folder, {'001.mp3': b'one', '002.mp3': b'two'})
+        entry = entry_of(folder)
+        for level in (VERIFY_CACHED, VERIFY_QUICK, VERIFY_FULL):
+            assert content_database.is_clean(content_database.diff_tracks(entry, folder, level))
+    print("  ✅ unchanged folder")
+
+
+def test_diff_tracks():
+    """Added, removed, changed and touched tracks are told apart"""
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / '01'
+        write_tracks(folder, {'001.mp3': b'one', '002.mp3': b'two', '003.mp3': b'three'})
+        entry = entry_of(folder)
+        stat = (folder / '001.mp3').stat()
+        os.utime(folder / '001.mp3', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        (folder / '002.mp3').write_bytes(b'TWO!')
+        (folder / '003.mp3').unlink()
+        (folder / '004.mp3').write_bytes(b'four')
+
+        diff = content_database.diff_tracks(entry, folder)
+        assert names(diff) == {'added': ['004.mp3'], 'removed': ['003.mp3'],
+                               'changed': ['002.mp3'], 'touched': ['001.mp3']}
+        assert diff['removed'][0]['index'] == '003'
+        assert content_database.describe_diff(diff) == "1 changed (002.mp3), 1 added (004.mp3), 1 removed (003.mp3)"
+
+        content_database.apply_diff(entry, diff)
+        assert [(t['index'], t['file']) for t in entry['tracks']] == \
+            [('001', '001.mp3'), ('002', '002.mp3'), ('003', '004.mp3')]
+        assert entry['hash'] == content_database.folder_hash_from_tracks(content_database.scan_tracks(folder))
+        assert content_database.is_clean(content_database.diff_tracks(entry, folder, VERIFY_FULL))
+    print("  ✅ added/removed/changed/touched")
+
+
+def test_diff_levels():
+    """Only quick and full verification look into files whose size and mtime are unchanged"""
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / '01'
+        write_tracks(folder, {'001.mp3': b'one', '002.mp3': b'two'})
+        entry = entry_of(folder)
+        rewrite_keeping_stat(folder / '002.mp3', b'TWO')
+
+        assert content_database.is_clean(content_database.diff_tracks(entry, folder, VERIFY_CACHED))
+        for level in (VERIFY_QUICK, VERIFY_FULL):
+            assert names(content_database.diff_tracks(entry, folder, level))['changed'] == ['002.mp3']
+    print("  ✅ verification levels")
+
+
+def test_diff_missing_folder():
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / '01'
+        write_tracks(folder, {'001.mp3': b'one'})
+        entry = entry_of(folder)
+        diff = content_database.diff_tracks(entry, Path(tmp) / '02')
+    assert names(diff)['removed'] == ['001.mp3']
+    print("  ✅ missing folder")
+
+
+def test_duplicate_index():
+    """Whole duplicate folders and single duplicate files, kept up to date incrementally"""
+    def entry(*digests):
+        tracks = [{'file': f"{i:03d}.mp3", 'md5': digest} for i, digest in enumerate(digests, start=1)]
+        return {'tracks': tracks, 'hash': content_database.folder_hash_from_tracks(tracks)}
+
+    database = {'01': entry('a', 'b'), '02': entry('a', 'b'), '03': entry('c', 'a')}
+    index = content_database.DuplicateIndex()
+    index.sync(database)
+    assert index.duplicate_folders() == [['01', '02']]
+    assert index.duplicate_files() == {'a': [('01', '001.mp3'), ('03', '002.mp3')]}
+    assert index.find_folder(['a', 'b']) == '01'
+    assert index.find_folder(['b', 'a']) is None
+
+    database['02'] = entry('d')
+    del database['03']
+    index.sync(database)
+    assert index.duplicate_folders() == []
+    assert index.locations('a') == [('01', '001.mp3')]
+    assert index.locations('c') == []
+    print("  ✅ duplicate index")
+
+
+def test_track_metadata_cached():
+    """Metadata is read from the first frames once and then served from the hash cache"""
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / '01'
+        # 100 frames of MPEG 1 layer III, 128 kbps, 44.1 kHz
+        write_tracks(folder, {'001.mp3': (b'\xff\xfb\x90\x00' + bytes(413)) * 100})
+        hash_cache = content_database.HashCache()
+        tracks = content_database.folder_metadata(folder, hash_cache)
+        assert tracks[0]['file'] == '001.mp3'
+        assert (tracks[0]['bitrate'], tracks[0]['sample_rate'], tracks[0]['channels']) == (128, 44100, 2)
+        assert abs(tracks[0]['duration'] - 100 * 1152 / 44100) < 0.05
+        path = folder / '001.mp3'
+        assert hash_cache.lookup(path, path.stat())['meta']['bitrate'] == 128
+    print("  ✅ cached track metadata")
+
+
+def test_summarize_metadata():
+    summary = content_database.summarize_metadata([
+        {'duration': 60.0, 'bitrate': 128, 'sample_rate': 44100, 'channels': 2, 'size': 1000},
+        {'duration': 180.0, 'bitrate': 64, 'sample_rate': 44100, 'channels': 1, 'size': 2000},
+    ])
+    assert summary == {'tracks': 2, 'duration': 240.0, 'size': 3000, 'bitrate': 80, 'vbr': True,
+                       'sample_rate': 44100, 'channels': 0}
+    assert content_database.format_duration(summary['duration']) == '4:00'
+    assert content_database.format_duration(3725) == '1:02:05'
+    print("  ✅ metadata summary")
+
+
+def test_diff_source():
+    """Only mp3 and AAX files count, files claimed by other folders are not new"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'Album'
+        write_tracks(source, {'01 Intro.mp3': b'intro', '02 Song.mp3': b'song', 'Book.aax': b'book'})
+        files = content_database.fingerprint_files(content_database.list_sources(source))
+        entry = {'source': content_database.source_record(source, files, {'split': False})}
+        assert content_database.is_clean(content_database.diff_source(entry))
+
+        (source / '01 Intro.mp3').unlink()
+        (source / '02 Song.mp3').write_bytes(b'song, remastered')
+        write_tracks(source, {'03 Bonus.mp3': b'bonus', '04 Other.mp3': b'other', 'cover.jpg': b'jpeg'})
+        diff = content_database.diff_source(entry, claimed={'04 Other.mp3'})
+        assert names(diff) == {'added': ['03 Bonus.mp3'], 'removed': ['01 Intro.mp3'],
+                               'changed': ['02 Song.mp3'], 'touched': []}
+
+        updated = content_database.update_source(entry['source'], diff)
+        assert [f['file'] for f in updated['files']] == ['02 Song.mp3', '03 Bonus.mp3', 'Book.aax']
+        assert updated['options'] == {'split': False}
+        assert content_database.is_clean(content_database.diff_source({'source': updated}, claimed={'04 Other.mp3'}))
+    print("  ✅ source diff")
+
+
+def test_claimed_sources():
+    database = {
+        '01': {'source': {'path': '/music/Album', 'files': [{'file': 'a.mp3'}]}},
+        '02': {'source': {'path': '/music/Album', 'files': [{'file': 'b.mp3'}]}},
+        '03': {'source': {'path': '/music/Other', 'files': [{'file': 'c.mp3'}]}},
+        '04': {},
+    }
+    assert content_database.claimed_sources(database, '01') == {'b.mp3'}
+    assert content_database.claimed_sources(database, '03') == set()
+    print("  ✅ claimed sources")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO Content Database - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
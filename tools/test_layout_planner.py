@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the SD card layout planner
+Run with `python3 test_layout_planner.py` or pytest
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import layout_planner
+from layout_planner import PlannedTrack
+
+
+def tracks(*names):
+    return [PlannedTrack(Path(name)) for name in names]
+
+
+def origins_of(*names):
+    return [(name, 0) for name in names]
+
+
+def test_split_points_snap_to_silence():
+    """Cut points move to the middle of the nearest silence within the window"""
+    points = layout_planner.choose_split_points(3600, 1200, silences=[(1150, 1160), (2500, 2510)])
+    assert points == [1155.0, 2355.0]
+    print("  ✅ split points snap to silence")
+
+
+def test_split_points_merge_short_remainder():
+    """No cut for a file shorter than 1.5 segments, a short remainder joins the last segment"""
+    assert layout_planner.choose_split_points(1700, 1200) == []
+    assert layout_planner.choose_split_points(2500, 1000) == [1000.0]
+    print("  ✅ short remainder merged")
+
+
+def test_layout_spreads_tracks_evenly():
+    plans = layout_planner.plan_layout(tracks(*(f"{i}.mp3" for i in range(12))), 5, max_tracks=5)
+    assert [plan.folder for plan in plans] == [5, 6, 7]
+    assert [len(plan.tracks) for plan in plans] == [4, 4, 4]
+    assert plans[1].tracks[0] == PlannedTrack(Path('4.mp3'))
+    print("  ✅ layout over several folders")
+
+
+def test_layout_beyond_last_folder():
+    try:
+        layout_planner.plan_layout(tracks('a', 'b', 'c'), layout_planner.MAX_FOLDER, max_tracks=2)
+    except layout_planner.LayoutError:
+        print("  ✅ last folder limit")
+    else:
+        raise AssertionError("LayoutError expected")
+
+
+def test_refresh_removed_source():
+    """Tracks after a removed file move up, in order"""
+    names = [f"{i:02d}.mp3" for i in range(1, 11)]
+    plan = layout_planner.plan_refresh(origins_of(*names), {}, {'03.mp3'})
+    assert plan.origins == origins_of(*(names[:2] + names[3:]))
+    assert plan.moves == [(number, number - 1) for number in range(4, 11)]
+    assert plan.writes == []
+    assert plan.deletes == []
+    print("  ✅ removed source")
+
+
+def test_refresh_added_source():
+    """Tracks of added files are appended, nothing else changes"""
+    names = [f"{i:02d}.mp3" for i in range(1, 11)]
+    plan = layout_planner.plan_refresh(origins_of(*names), {'11.mp3': tracks('11.mp3')}, set())
+    assert plan.origins == origins_of(*names, '11.mp3')
+    assert plan.moves == []
+    assert plan.writes == [(11, PlannedTrack(Path('11.mp3')))]
+    assert plan.deletes == []
+    print("  ✅ added source")
+
+
+def test_refresh_changed_source():
+    """A changed file with as many parts as before is written in place"""
+    plan = layout_planner.plan_refresh(origins_of('a', 'b', 'c'), {'b': tracks('b')}, set())
+    assert plan.origins == origins_of('a', 'b', 'c')
+    assert plan.moves == []
+    assert plan.writes == [(2, PlannedTrack(Path('b')))]
+    print("  ✅ changed source")
+
+
+def test_refresh_shrunk_source():
+    """A changed file with fewer parts: the following tracks move up, the last numbers are deleted"""
+    origins = [('a', 0), ('b', 0), ('b', 1), ('b', 2), ('c', 0)]
+    plan = layout_planner.plan_refresh(origins, {'b': tracks('b0')}, set())
+    assert plan.origins == [('a', 0), ('b', 0), ('c', 0)]
+    assert plan.writes == [(2, PlannedTrack(Path('b0')))]
+    assert plan.moves == [(5, 3)]
+    assert plan.deletes == [4]
+    print("  ✅ shrunk source")
+
+
+def test_refresh_grown_source():
+    """A changed file with more parts keeps its place, the following tracks move down"""
+    plan = layout_planner.plan_refresh(origins_of('a', 'b', 'c'), {'b': tracks('b0', 'b1')}, set())
+    assert plan.origins == [('a', 0), ('b', 0), ('b', 1), ('c', 0)]
+    assert plan.writes == [(2, PlannedTrack(Path('b0'))), (3, PlannedTrack(Path('b1')))]
+    assert plan.moves == [(3, 4)]
+    print("  ✅ grown source")
+
+
+def test_refresh_too_many_tracks():
+    try:
+        layout_planner.plan_refresh(origins_of('a', 'b'), {'c': tracks('c0', 'c1')}, set(), max_tracks=3)
+    except layout_planner.LayoutError:
+        print("  ✅ folder limit")
+    else:
+        raise AssertionError("LayoutError expected")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO Layout Planner - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
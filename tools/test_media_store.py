@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for writing card folders, whose files may be links into the shared media store
+Run with `python3 test_media_store.py` or pytest
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+# Keep the test files out of the real caches
+os.environ['TONUINO_CACHE_DIR'] = tempfile.mkdtemp(prefix='tonuino-test-cache-')
+
+import audio_content_gui
+import content_database
+import job_queue
+import layout_planner
+import media_store
+import tool_registry
+
+
+def write_files(folder: Path, contents: dict):
+    folder.mkdir(parents=True, exist_ok=True)
+    for name, data in contents.items():
+        (folder / name).write_bytes(data)
+
+
+def assert_blobs_intact(store: media_store.MediaStore):
+    for blob in store.objects.glob("*/*.mp3"):
+        assert content_database.calculate_hash(blob) == blob.stem, f"blob {blob.name} was written into"
+
+
+def test_write_track_replaces_store_link():
+    """Writing a track over a store link replaces the link, the blob and other cards keep their content"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        store = media_store.MediaStore(tmp / 'store')
+        write_files(tmp / 'card-a' / '01', {'001.mp3': b'old content'})
+        digest = store.adopt(tmp / 'card-a' / '01' / '001.mp3')
+        (tmp / 'card-b' / '01').mkdir(parents=True)
+        store.materialize(digest, tmp / 'card-b' / '01' / '001.mp3')
+        write_files(tmp / 'library', {'new.mp3': b'new content'})
+
+        track = layout_planner.PlannedTrack(tmp / 'library' / 'new.mp3')
+        assert layout_planner.write_track(track, tmp / 'card-a' / '01' / '001.mp3', shutil.copyfile)
+        assert (tmp / 'card-a' / '01' / '001.mp3').read_bytes() == b'new content'
+        assert (tmp / 'card-b' / '01' / '001.mp3').read_bytes() == b'old content'
+        assert sorted(f.name for f in (tmp / 'card-a' / '01').iterdir()) == ['001.mp3']
+        assert_blobs_intact(store)
+    print("  ✅ write_track breaks store links")
+
+
+def test_failed_write_keeps_track():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_files(tmp / '01', {'001.mp3': b'old content'})
+
+        def failing_copy(source: Path, dest: Path):
+            dest.write_bytes(b'half')
+            raise OSError("card removed")
+
+        try:
+            layout_planner.write_track(layout_planner.PlannedTrack(tmp / 'missing.mp3'), tmp / '01' / '001.mp3',
+                                       failing_copy)
+        except OSError:
+            pass
+        else:
+            raise AssertionError("OSError expected")
+        assert (tmp / '01' / '001.mp3').read_bytes() == b'old content'
+        assert sorted(f.name for f in (tmp / '01').iterdir()) == ['001.mp3']
+    print("  ✅ failed write keeps the old track")
+
+
+def content_manager(tmp: Path) -> audio_content_gui.TonUINOContentManager:
+    """A content manager without a window, just enough to run jobs"""
+    app = object.__new__(audio_content_gui.TonUINOContentManager)
+    app.log = lambda message, level="INFO": None
+    app.hash_cache = content_database.HashCache()
+    app.jobs = job_queue.JobQueue(tmp / 'jobs.sqlite3')
+    app.activation_secret = ''
+    return app
+
+
+def test_refresh_folder_of_store_links():
+    """Refreshing a folder whose files are store links leaves the blobs and the other card alone"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        library = tmp / 'library'
+        write_files(library, {'a.mp3': b'track a', 'b.mp3': b'track b', 'c.mp3': b'track c'})
+        card_a, card_b = tmp / 'card-a', tmp / 'card-b'
+        write_files(card_a / '01', {'001.mp3': b'track a', '002.mp3': b'track b', '003.mp3': b'track c'})
+
+        store = media_store.MediaStore(tmp / 'store')
+        for path in content_database.list_tracks(card_a / '01'):
+            store.adopt(path)
+        entry = {'name': 'Album', 'type': 'music'}
+        content_database.attach_fingerprints(entry, content_database.scan_tracks(card_a / '01'))
+        for track, name in zip(entry['tracks'], ('a.mp3', 'b.mp3', 'c.mp3')):
+            track.update(source=name, part=0)
+        entry['source'] = content_database.source_record(
+            library, content_database.fingerprint_files(content_database.list_sources(library)), {'split': False})
+        store.record_title(card_a, '01', entry)
+        store.materialize_title(entry['hash'], card_b / '01')
+
+        (library / 'b.mp3').write_bytes(b'track b, fixed')
+        app = content_manager(tmp)
+        job_id = app.jobs.submit('refresh', {'folder': '01', 'sd_dir': str(card_a), 'entry': entry, 'claimed': []})
+        result = app.run_refresh_job(job_queue.JobContext(app.jobs, app.jobs.get(job_id)))
+
+        assert [f['file'] for f in result['diff']['changed']] == ['b.mp3']
+        assert (card_a / '01' / '002.mp3').read_bytes() == b'track b, fixed'
+        assert (card_b / '01' / '002.mp3').read_bytes() == b'track b'
+        assert sorted(f.name for f in (card_a / '01').iterdir()) == ['001.mp3', '002.mp3', '003.mp3']
+        assert_blobs_intact(store)
+    print("  ✅ refresh of store links")
+
+
+def test_sync_job_moves_files_into_store():
+    """The sync job fingerprints a folder and links its files to store blobs in its own steps"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        card = tmp / 'card'
+        write_files(card / '01', {'001.mp3': b'track a', '002.mp3': b'track b'})
+        app = content_manager(tmp)
+        params = {'folder': '01', 'sd_dir': str(card), 'entry': {'name': 'Album', 'type': 'music'},
+                  'media_store': str(tmp / 'store')}
+        job_id = app.jobs.submit('sync', params)
+        result = app.run_sync_job(job_queue.JobContext(app.jobs, app.jobs.get(job_id)))
+
+        assert result['kind'] == 'attach'
+        assert [f['file'] for f in result['data']] == ['001.mp3', '002.mp3']
+        store = media_store.MediaStore(tmp / 'store')
+        for fingerprint in result['data']:
+            assert store.blob_path(fingerprint['md5']).read_bytes() == (card / '01' / fingerprint['file']).read_bytes()
+            assert fingerprint['mtime'] == (card / '01' / fingerprint['file']).stat().st_mtime
+        assert app.jobs.step_result(job_id, 'store')[0]
+    print("  ✅ sync job stores files")
+
+
+def test_failed_segment_fails_folder():
+    """A segment that can't be cut fails the folder instead of leaving a gap in the track numbers"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # An ffmpeg that passes the probe but can't cut anything
+        ffmpeg = tmp / 'bin' / 'ffmpeg'
+        ffmpeg.parent.mkdir()
+        ffmpeg.write_text('#!/bin/sh\ncase "$*" in *-version*) echo "ffmpeg version 6.0";; *) exit 1;; esac\n')
+        ffmpeg.chmod(0o755)
+        write_files(tmp / 'library', {'a.mp3': b'track a', 'b.mp3': b'track b', 'c.mp3': b'track c'})
+        tracks = [layout_planner.PlannedTrack(tmp / 'library' / 'a.mp3'),
+                  layout_planner.PlannedTrack(tmp / 'library' / 'b.mp3', 0.0, 60.0),
+                  layout_planner.PlannedTrack(tmp / 'library' / 'c.mp3')]
+
+        path, registry = os.environ['PATH'], tool_registry._registry
+        os.environ['PATH'] = f"{ffmpeg.parent}{os.pathsep}{path}"
+        tool_registry._registry = tool_registry.ToolRegistry()
+        try:
+            content_manager(tmp).copy_mp3_files(tracks, tmp / 'card' / '01')
+        except job_queue.JobError as e:
+            assert '002.mp3' in str(e)
+        else:
+            raise AssertionError("JobError expected")
+        finally:
+            os.environ['PATH'], tool_registry._registry = path, registry
+        assert sorted(f.name for f in (tmp / 'card' / '01').iterdir()) == ['001.mp3', '003.mp3']
+    print("  ✅ failed segment fails the folder")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO Media Store - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests for the frame level mp3 helpers, on synthetic files (no encoder needed)
+Run with `python3 test_mp3_utils.py` or pytest
+"""
+
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import mp3_utils
+
+# MPEG 1 layer III, 128 kbps, 44.1 kHz: 417 byte frames of 1152 samples
+HEADER_STEREO = b'\xff\xfb\x90\x00'
+HEADER_MONO = b'\xff\xfb\x90\xc0'
+FRAME_LENGTH = 417
+FRAME_DURATION = 1152 / 44100
+
+
+def frame(fill: int = 0, header: bytes = HEADER_STEREO) -> bytes:
+    return header + bytes([fill]) * (FRAME_LENGTH - 4)
+
+
+def info_frame(frame_count: int, tag: bytes = b'Xing') -> bytes:
+    """A Xing/Info header frame of a stereo MPEG 1 file (side info is 32 bytes)"""
+    data = bytearray(frame())
+    data[36:48] = tag + struct.pack('>II', 1, frame_count)
+    return bytes(data)
+
+
+def id3v2(*frames) -> bytes:
+    body = b''.join(frame_id + struct.pack('>I', len(data)) + b'\x00\x00' + data for frame_id, data in frames)
+    return b'ID3\x03\x00\x00' + mp3_utils._to_synchsafe(len(body)) + body
+
+
+def id3v1() -> bytes:
+    return b'TAG' + b'\x00' * (mp3_utils.ID3V1_SIZE - 3)
+
+
+def test_parse_frame_header():
+    header = mp3_utils.parse_frame_header(HEADER_STEREO)
+    assert header == mp3_utils.FrameHeader(1, 3, 128, 44100, 2, FRAME_LENGTH, 1152)
+    assert mp3_utils.parse_frame_header(HEADER_MONO).channels == 1
+    assert mp3_utils.parse_frame_header(b'\xff\xfb\x92\x00').length == FRAME_LENGTH + 1  # padding
+    # MPEG 2 layer III, 64 kbps, 22.05 kHz: half the samples per frame
+    assert mp3_utils.parse_frame_header(b'\xff\xf3\x80\x00') == mp3_utils.FrameHeader(2, 3, 64, 22050, 2, 208, 576)
+    print("  ✅ frame header")
+
+
+def test_parse_invalid_header():
+    assert mp3_utils.parse_frame_header(b'\xff\xfb\xf0\x00') is None  # bitrate index 15
+    assert mp3_utils.parse_frame_header(b'\xff\xfb\x9c\x00') is None  # reserved sample rate
+    assert mp3_utils.parse_frame_header(b'ID3\x03') is None
+    assert mp3_utils.parse_frame_header(HEADER_STEREO[:3]) is None
+    print("  ✅ invalid headers rejected")
+
+
+def test_iter_frames_skips_garbage():
+    data = b'\x00\x01' + frame(1) + b'\xff\x00' + frame(2)
+    assert [offset for offset, _ in mp3_utils.iter_frames(data)] == [2, 2 + FRAME_LENGTH + 2]
+    print("  ✅ garbage between frames skipped")
+
+
+def test_stream_info_cbr():
+    """Duration of a CBR file without info frame follows from its size, tags are not counted"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'cbr.mp3'
+        path.write_bytes(id3v2((b'APIC', b'\x00' * 5000)) + frame() * 100 + id3v1())
+        info = mp3_utils.read_stream_info(path)
+    assert abs(info.duration - 100 * FRAME_DURATION) < 0.05
+    assert info.bitrate == 128
+    assert (info.sample_rate, info.channels, info.vbr) == (44100, 2, False)
+    print("  ✅ CBR stream info")
+
+
+def test_stream_info_xing():
+    """The frame count of a Xing header gives the duration without reading all frames"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'vbr.mp3'
+        path.write_bytes(info_frame(1000) + frame() * 10)
+        info = mp3_utils.read_stream_info(path)
+    assert abs(info.duration - 1000 * FRAME_DURATION) < 1e-6
+    assert info.vbr
+    print("  ✅ Xing stream info")
+
+
+def test_stream_info_no_audio():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'empty.mp3'
+        path.write_bytes(id3v2((b'TIT2', b'\x00Title')) + b'\x00' * 100)
+        assert mp3_utils.read_stream_info(path) is None
+    print("  ✅ no audio frames")
+
+
+def test_split_mp3():
+    """Cuts snap to the nearest frame boundary, tags and the info frame are dropped"""
+    frames = [frame(i) for i in range(1, 11)]
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'source.mp3'
+        source.write_bytes(id3v2((b'TIT2', b'\x00Title')) + info_frame(10) + b''.join(frames) + id3v1())
+        dests = [Path(tmp) / 'part1.mp3', Path(tmp) / 'part2.mp3', Path(tmp) / 'part3.mp3']
+        assert mp3_utils.split_mp3(source, [3.4 * FRAME_DURATION, 7.6 * FRAME_DURATION], dests)
+        assert dests[0].read_bytes() == b''.join(frames[:3])
+        assert dests[1].read_bytes() == b''.join(frames[3:8])
+        assert dests[2].read_bytes() == b''.join(frames[8:])
+    print("  ✅ split at frame boundaries")
+
+
+def test_split_mp3_empty_part():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'source.mp3'
+        source.write_bytes(frame() * 4)
+        dests = [Path(tmp) / 'part1.mp3', Path(tmp) / 'part2.mp3', Path(tmp) / 'part3.mp3']
+        # Both cuts snap to the start of the second frame
+        assert not mp3_utils.split_mp3(source, [1.1 * FRAME_DURATION, 1.2 * FRAME_DURATION], dests)
+        assert not any(dest.exists() for dest in dests)
+        try:
+            mp3_utils.split_mp3(source, [FRAME_DURATION], dests)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("ValueError expected")
+    print("  ✅ empty parts rejected")
+
+
+def test_concat_mp3():
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second, mono = (Path(tmp) / name for name in ('first.mp3', 'second.mp3', 'mono.mp3'))
+        first.write_bytes(id3v2((b'TIT2', b'\x00One')) + info_frame(2) + frame(1) * 2)
+        second.write_bytes(frame(2) * 3 + id3v1())
+        mono.write_bytes(frame(3, HEADER_MONO) * 2)
+        dest = Path(tmp) / 'joined.mp3'
+        assert mp3_utils.concat_mp3([first, second], dest)
+        assert dest.read_bytes() == frame(1) * 2 + frame(2) * 3
+        assert not mp3_utils.concat_mp3([first, mono], Path(tmp) / 'mixed.mp3')
+    print("  ✅ concat")
+
+
+def test_strip_tags_keeps_basic_frames():
+    with tempfile.TemporaryDirectory() as tmp:
+        source, dest = Path(tmp) / 'tagged.mp3', Path(tmp) / 'stripped.mp3'
+        tag = id3v2((b'TIT2', b'\x00Title'), (b'APIC', b'\x00' * 5000), (b'TPE1', b'\x00Artist'))
+        source.write_bytes(tag + frame() * 5 + id3v1())
+        stats = mp3_utils.strip_tags_copy(source, dest, keep_basic_tags=True)
+        expected_tag = id3v2((b'TIT2', b'\x00Title'), (b'TPE1', b'\x00Artist'))
+        assert dest.read_bytes() == expected_tag + frame() * 5
+        assert stats['leading_removed'] == len(tag) - len(expected_tag)
+    print("  ✅ strip tags")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO MP3 Helpers - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
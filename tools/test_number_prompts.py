@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the decomposition of number messages into synthesized fragments
+Run with `python3 test_number_prompts.py` or pytest
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+# The prompt modules open their caches on import, keep them out of the real cache
+os.environ['TONUINO_CACHE_DIR'] = tempfile.mkdtemp(prefix='tonuino-test-cache-')
+
+import number_prompts
+
+
+def test_decompose_en():
+    assert number_prompts.decomposeEn(7) == ['u7']
+    assert number_prompts.decomposeEn(15) == ['u15']
+    assert number_prompts.decomposeEn(40) == ['t40']
+    assert number_prompts.decomposeEn(121) == ['h100', 't20', 'u1']
+    assert number_prompts.decomposeEn(200) == ['h200']
+    assert number_prompts.decomposeEn(213) == ['h200', 'u13']
+    print("  ✅ English")
+
+
+def test_decompose_de():
+    """German puts the units first: 121 = einhundert | einund | zwanzig"""
+    assert number_prompts.decomposeDe(7) == ['u7']
+    assert number_prompts.decomposeDe(40) == ['t40']
+    assert number_prompts.decomposeDe(121) == ['h100', 'x1', 't20']
+    assert number_prompts.decomposeDe(255) == ['h200', 'x5', 't50']
+    assert number_prompts.decomposeDe(110) == ['h100', 'u10']
+    print("  ✅ German")
+
+
+def test_all_numbers_have_fragments():
+    """Every number message is made of existing fragments, and every fragment is used"""
+    for lang, decompose in number_prompts.decomposeByLang.items():
+        fragments = number_prompts.fragmentsByLang[lang]
+        used = set()
+        for number in range(1, number_prompts.MAX_NUMBER + 1):
+            parts = decompose(number)
+            assert parts and all(part in fragments for part in parts), (lang, number, parts)
+            used.update(parts)
+        assert used == set(fragments), (lang, set(fragments) - used)
+        assert number_prompts.fragmentCount(lang) == len(fragments) < number_prompts.MAX_NUMBER
+    print("  ✅ fragments cover 1-{}".format(number_prompts.MAX_NUMBER))
+
+
+def test_unsupported_language():
+    assert not number_prompts.isSupported('fr')
+    assert number_prompts.fragmentCount('fr') == number_prompts.MAX_NUMBER
+    print("  ✅ unsupported language")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO Number Prompts - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the request signing of the Amazon Polly client (no network access)
+Run with `python3 test_polly_client.py` or pytest
+"""
+
+import datetime
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import polly_client
+
+# Credentials, date and expected signatures of the AWS Signature Version 4 test suite
+# (get-vanilla and post-vanilla), which signs for the service name "service"
+EXAMPLE_CREDENTIALS = ('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', None)
+EXAMPLE_DATE = datetime.datetime(2015, 8, 30, 12, 36, 0, tzinfo=datetime.timezone.utc)
+
+
+def sign_example(method):
+    service = polly_client.SERVICE
+    polly_client.SERVICE = 'service'
+    try:
+        return polly_client.signRequest(method, 'https://example.amazonaws.com/', {}, b'',
+                                        EXAMPLE_CREDENTIALS, 'us-east-1', EXAMPLE_DATE)
+    finally:
+        polly_client.SERVICE = service
+
+
+def test_sigv4_get_vanilla():
+    headers = sign_example('GET')
+    assert headers['host'] == 'example.amazonaws.com'
+    assert headers['x-amz-date'] == '20150830T123600Z'
+    assert headers['Authorization'] == (
+        'AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20150830/us-east-1/service/aws4_request, '
+        'SignedHeaders=host;x-amz-date, '
+        'Signature=5fa00fa31553b73ebf1942676e86291e8372ff2a2260956d9b8aae1d763fbf31')
+    print("  ✅ SigV4 get-vanilla")
+
+
+def test_sigv4_post_vanilla():
+    assert sign_example('POST')['Authorization'].endswith(
+        'Signature=5da7c1a2acd57cee7505fc6676e4e544621c30862966e37dddb68e92efbe5d6b')
+    print("  ✅ SigV4 post-vanilla")
+
+
+def test_session_token_is_signed():
+    credentials = EXAMPLE_CREDENTIALS[:2] + ('TOKEN',)
+    headers = polly_client.signRequest('POST', 'https://polly.eu-central-1.amazonaws.com/v1/speech',
+                                       {'Content-Type': 'application/json'}, b'{}', credentials, 'eu-central-1',
+                                       EXAMPLE_DATE)
+    assert headers['x-amz-security-token'] == 'TOKEN'
+    assert 'Credential=AKIDEXAMPLE/20150830/eu-central-1/polly/aws4_request' in headers['Authorization']
+    assert 'SignedHeaders=content-type;host;x-amz-date;x-amz-security-token,' in headers['Authorization']
+    print("  ✅ session token")
+
+
+def test_retryable_errors():
+    assert polly_client.PollyError('busy', status=503).retryable
+    assert polly_client.PollyError('slow down', status=400, code='ThrottlingException').retryable
+    assert not polly_client.PollyError('bad voice', status=400, code='InvalidSsmlException').retryable
+    print("  ✅ retryable errors")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO Polly Client - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
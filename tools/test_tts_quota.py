@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the rate limiting of the text-to-speech engines, on a simulated clock
+Run with `python3 test_tts_quota.py` or pytest
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import tts_quota
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping advances the clock instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+def with_fake_clock(test):
+    def run():
+        real_time = tts_quota.time
+        tts_quota.time = FakeClock()
+        try:
+            test(tts_quota.time)
+        finally:
+            tts_quota.time = real_time
+    run.__name__ = test.__name__
+    run.__doc__ = test.__doc__
+    return run
+
+
+@with_fake_clock
+def test_bucket_paces_requests(clock):
+    """A full bucket grants its capacity at once, then tokens come at the rate"""
+    bucket = tts_quota.TokenBucket(2, 2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [0.5]
+    clock.now += 10
+    bucket.acquire()
+    assert clock.slept == [0.5]
+    print("  ✅ token bucket pacing")
+
+
+@with_fake_clock
+def test_bucket_debt(clock):
+    """More than the capacity is granted once the bucket is full, the debt is paid by waiting"""
+    bucket = tts_quota.TokenBucket(100, 100)
+    bucket.acquire(250)
+    assert clock.slept == []
+    bucket.acquire(50)
+    assert clock.slept == [2.0]
+    print("  ✅ token bucket debt")
+
+
+@with_fake_clock
+def test_bucket_unlimited(clock):
+    bucket = tts_quota.TokenBucket(0, 0)
+    for _ in range(1000):
+        bucket.acquire(1000)
+    assert clock.slept == []
+    print("  ✅ unlimited bucket")
+
+
+@with_fake_clock
+def test_limiter_backs_off_and_recovers(clock):
+    limiter = tts_quota.EngineLimiter('test', 10, 6000)
+    limiter.throttled()
+    assert limiter.factor == 0.5
+    assert (limiter.requests.rate, limiter.chars.rate) == (5, 50)
+    for _ in range(5):
+        limiter.throttled()
+    assert limiter.factor == tts_quota.minRateFactor
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.factor == 1.0
+    assert (limiter.requests.rate, limiter.chars.rate) == (10, 100)
+    print("  ✅ limiter backoff")
+
+
+def test_billed_chars():
+    ssml = '<speak>Hallo <mark name="1"/>Welt<break time="1s"/></speak>'
+    assert tts_quota.billedChars('amazon', ssml) == len('Hallo Welt')
+    assert tts_quota.billedChars('google', ssml) == len(ssml) - len('<mark name="1"/>')
+    print("  ✅ billed characters")
+
+
+def main():
+    print("=" * 60)
+    print("TonUINO TTS Quota - Test Suite")
+    print("=" * 60)
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print("✅ All tests passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,16 @@
 # Converts text into spoken language saved to an mp3 file.
 
 
-import argparse, base64, json, os, subprocess, sys
+import argparse, base64, json, os, random, subprocess, sys, tempfile, time, xml.sax.saxutils, mp3_utils, polly_client, profiling, prompt_encoding, run_planner, tts_quota
 try:
-    import urllib.request
+    import urllib.error, urllib.request
 except ImportError:
     print("WARNING: It looks like you are using an old version of Python. Please use Python 3 if you intend to use Google Text to Speech.")
 
+class TextToSpeechError(Exception):
+    pass
+
+
 class PatchedArgumentParser(argparse.ArgumentParser):
     def error(self, message):
         sys.stderr.write('ERROR: %s\n\n' % message)
@@ -50,24 +54,37 @@ coquiVoiceByLang = {
     'en': 'tts_models/en/ljspeech/vits'
 }
 
+# Batching: several prompts are synthesized in one request, separated by a pause
+# and enclosed by SSML marks, and the audio is split in the middle of the pauses
+batchPauseMs = 800
+batchMinPromptSeconds = 0.05
+
 textToSpeechDescription = """
 The following text-to-speech engines are supported:
 - With `--use-say` the text-to-speech engine of MacOS is used (command `say`).
-- With `--use-amazon` Amazon Polly is used. Requires the AWS CLI to be installed and configured. See: https://aws.amazon.com/cli/
+- With `--use-amazon` Amazon Polly is used. Requires AWS credentials (environment variables or `~/.aws/credentials`,
+  e.g. set up with the AWS CLI). See: https://aws.amazon.com/cli/
 - With `--use-google-key=ABCD` Google text-to-speech is used. See: https://cloud.google.com/text-to-speech/
 - With `--use-coqui` Coqui text-to-speech is used. See: https://pypi.org/project/TTS/
 Amazon Polly sounds best, Google text-to-speech is second, MacOS `say` sounds worst.'
 """.strip()
 
-def addArgumentsToArgparser(argparser):
+def addArgumentsToArgparser(argparser, multipleLanguages=False):
     # Create a list of supported languages directly from the say/Amazon/Google service configurations
     supported_languages = list({key for d in [sayVoiceByLang, googleVoiceByLang, amazonVoiceByLang] for key in d.keys()})
 
-    argparser.add_argument('--lang', choices=supported_languages, default='de', help='The language (default: de)')
+    if multipleLanguages:
+        argparser.add_argument('--lang', nargs='+', choices=supported_languages + ['all'], default=['de'], help='The language(s), e.g. `--lang de en`. `all`: every language with an input file (default: de)')
+    else:
+        argparser.add_argument('--lang', choices=supported_languages, default='de', help='The language (default: de)')
     argparser.add_argument('--use-say', action='store_true', default=None, help="If set, the MacOS tool `say` will be used.")
     argparser.add_argument('--use-amazon', action='store_true', default=None, help="If set, Amazon Polly is used. If missing the MacOS tool `say` will be used.")
     argparser.add_argument('--use-google-key', type=str, default=None, help="The API key of the Google text-to-speech account to use.")
     argparser.add_argument('--use-coqui', action='store_true', default=None, help="If set, Coqui text-to-speech will be used.")
+    argparser.add_argument('--max-requests-per-second', type=float, default=None, help="Request quota of the cloud engine (default: {})".format(', '.join('{} {}'.format(engine, limits['requestsPerSecond']) for engine, limits in tts_quota.defaultLimitsByEngine.items())))
+    argparser.add_argument('--max-chars-per-minute', type=int, default=None, help="Character quota of the cloud engine (default: {})".format(', '.join('{} {}'.format(engine, limits['charsPerMinute']) for engine, limits in tts_quota.defaultLimitsByEngine.items())))
+    argparser.add_argument('--amazon-endpoint', type=str, default=None, help="Use another Amazon Polly endpoint URL, e.g. a local stub server for testing (default: `TONUINO_POLLY_ENDPOINT` or the endpoint of your AWS region)")
+    prompt_encoding.addArgumentsToArgparser(argparser)
 
 def checkArgs(argparser, args):
     if not args.use_say and not args.use_amazon and args.use_google_key and not args.use_coqui is None:
@@ -83,6 +100,16 @@ def checkArgs(argparser, args):
     if args.use_coqui:
         checkLanguage(coquiVoiceByLang, args.lang, argparser)
 
+def voicesUsingArgs(args):
+    if args.use_amazon:
+        return amazonVoiceByLang
+    elif args.use_google_key:
+        return googleVoiceByLang
+    elif args.use_coqui:
+        return coquiVoiceByLang
+    else:
+        return sayVoiceByLang
+
 def checkLanguage(dictionary, lang, argparser):
     if lang not in dictionary:
         print('ERROR: Language is not supported by selected text-to-speech engine\n')
@@ -90,64 +117,268 @@ def checkLanguage(dictionary, lang, argparser):
         sys.exit(2)
 
 
+def engineNameUsingArgs(args):
+    if args.use_amazon:
+        return 'amazon'
+    elif args.use_google_key:
+        return 'google'
+    elif args.use_coqui:
+        return 'coqui'
+    else:
+        return 'say'
+
+
+def configureUsingArgs(args):
+    # Sets up the rate limiter (and the Polly client) of the selected engine; cheap if nothing changed
+    engine = engineNameUsingArgs(args)
+    tts_quota.configure(engine, getattr(args, 'max_requests_per_second', None), getattr(args, 'max_chars_per_minute', None))
+    if args.use_amazon:
+        polly_client.configure(endpoint=getattr(args, 'amazon_endpoint', None), limiter=tts_quota.getLimiter('amazon'))
+
+
 def textToSpeechUsingArgs(text, targetFile, args):
-    textToSpeech(text, targetFile, lang=args.lang, useAmazon=args.use_amazon, useGoogleKey=args.use_google_key, useCoqui=args.use_coqui)
+    configureUsingArgs(args)
+    # With `--post-process` the file is encoded with the profile there, no need to do it twice
+    textToSpeech(text, targetFile, lang=args.lang, useAmazon=args.use_amazon, useGoogleKey=args.use_google_key, useCoqui=args.use_coqui,
+                 encodingProfile=prompt_encoding.profileUsingArgs(args), conform=not getattr(args, 'post_process', False))
 
 
-def textToSpeech(text, targetFile, lang='de', useAmazon=False, useGoogleKey=None, useCoqui=False):
+def textToSpeech(text, targetFile, lang='de', useAmazon=False, useGoogleKey=None, useCoqui=False, encodingProfile=None, conform=True):
     print('\nGenerating: ' + targetFile + ' - ' + text)
-    if useAmazon:
-        response = subprocess.check_output(['aws', 'polly', 'synthesize-speech', '--output-format', 'mp3',
-            '--engine','neural',
-            '--voice-id', amazonVoiceByLang[lang], '--text-type', 'ssml',
-            '--text', '<speak><amazon:effect name="drc"><prosody rate=\"+10%\">' + text + '</prosody></amazon:effect></speak>',
-            targetFile])
-    elif useGoogleKey:
-        responseJson = postJson(
-            'https://texttospeech.googleapis.com/v1/text:synthesize?key=' + useGoogleKey,
-            {
-                'audioConfig': {
-                    'audioEncoding': 'MP3',
-                    'speakingRate': 1.0,
-                    'pitch': 2.0,  # Default is 0.0
-                    'sampleRateHertz': 44100,
-                    'effectsProfileId': [ 'small-bluetooth-speaker-class-device' ]
+    engine = 'amazon' if useAmazon else 'google' if useGoogleKey else 'coqui' if useCoqui else 'say'
+    encodingProfile = encodingProfile or prompt_encoding.profiles[prompt_encoding.defaultProfileName]
+    with profiling.span('tts', engine, engine=engine, lang=lang, chars=len(text)) as span, run_planner.timed('tts:' + engine):
+        if useAmazon:
+            ssml = '<speak><amazon:effect name="drc"><prosody rate=\"+10%\">' + text + '</prosody></amazon:effect></speak>'
+            billedChars = tts_quota.billedChars('amazon', ssml)
+            client = polly_client.getClient()
+            if client.isAvailable():
+                client.synthesizeSpeech(ssml, amazonVoiceByLang[lang], targetFile, billedChars=billedChars,
+                                        sampleRate=prompt_encoding.pollySampleRate(encodingProfile))
+            else:
+                # No credentials we can read (e.g. SSO login) -> let the AWS CLI handle them
+                tts_quota.getLimiter('amazon').acquire(billedChars)
+                subprocess.check_output(['aws', 'polly', 'synthesize-speech', '--output-format', 'mp3',
+                    '--engine','neural',
+                    '--sample-rate', str(prompt_encoding.pollySampleRate(encodingProfile)),
+                    '--voice-id', amazonVoiceByLang[lang], '--text-type', 'ssml',
+                    '--text', ssml,
+                    targetFile])
+            tts_quota.usage.addRequest('amazon', billedChars)
+        elif useGoogleKey:
+            responseJson = postJson(
+                'https://texttospeech.googleapis.com/v1/text:synthesize?key=' + useGoogleKey,
+                {
+                    'audioConfig': {
+                        'audioEncoding': 'MP3',
+                        'speakingRate': 1.0,
+                        'pitch': 2.0,  # Default is 0.0
+                        'sampleRateHertz': encodingProfile.sampleRate,
+                        'effectsProfileId': [ 'small-bluetooth-speaker-class-device' ]
+                    },
+                    'voice': googleVoiceByLang[lang],
+                    'input': { 'text': text }
                 },
-                'voice': googleVoiceByLang[lang],
-                'input': { 'text': text }
-            }
-        )
+                limiter=tts_quota.getLimiter('google'), chars=len(text)
+            )
+            tts_quota.usage.addRequest('google', len(text))
 
-        mp3Data = base64.b64decode(responseJson['audioContent'])
+            mp3Data = base64.b64decode(responseJson['audioContent'])
 
-        with open(targetFile, 'wb') as f:
-            f.write(mp3Data)
+            with open(targetFile, 'wb') as f:
+                f.write(mp3Data)
             
-    elif useCoqui:
-        subprocess.call([ 'tts', '--model_name', coquiVoiceByLang[lang], '--out_path', 'temp.wav', '--text',text ])
-        subprocess.call([ 'ffmpeg', '-y', '-i', 'temp.wav', '-acodec', 'libmp3lame', '-ab', '128k', '-ac', '1', targetFile ])
-        os.remove('temp.wav')
-        # From version 0.10.0 there is also a python based API (https://www.youtube.com/watch?v=MYRgWwis1Jk)
+        elif useCoqui:
+            tempFile = makeTempFile(targetFile, '.wav')
+            subprocess.call([ 'tts', '--model_name', coquiVoiceByLang[lang], '--out_path', tempFile, '--text',text ])
+            encodeMp3(tempFile, targetFile, encodingProfile)
+            os.remove(tempFile)
+            tts_quota.usage.addRequest('coqui', 0)
+            # From version 0.10.0 there is also a python based API (https://www.youtube.com/watch?v=MYRgWwis1Jk)
 
-    else:
-        subprocess.call([ 'say', '-v', sayVoiceByLang[lang], '-o', 'temp.aiff', text ])
-        subprocess.call([ 'ffmpeg', '-y', '-i', 'temp.aiff', '-acodec', 'libmp3lame', '-ab', '128k', '-ac', '1', targetFile ])
-        os.remove('temp.aiff')
+        else:
+            tempFile = makeTempFile(targetFile, '.aiff')
+            subprocess.call([ 'say', '-v', sayVoiceByLang[lang], '-o', tempFile, text ])
+            encodeMp3(tempFile, targetFile, encodingProfile)
+            os.remove(tempFile)
+            tts_quota.usage.addRequest('say', 0)
+
+        if conform and os.path.isfile(targetFile):
+            prompt_encoding.conform(targetFile, encodingProfile)
+        if os.path.isfile(targetFile):
+            span.add_bytes(os.path.getsize(targetFile))
+            run_planner.record('bytes:prompt', os.path.getsize(targetFile))
+
+
+def batchRequestCount(args):
+    # Polly needs one request for the speech marks and one for the audio
+    return 2 if args.use_amazon else 1
+
+
+def supportsBatch(args):
+    # Needs marks with timestamps: Amazon Polly (via the HTTP client, not the CLI) or Google
+    configureUsingArgs(args)
+    if args.use_amazon:
+        return polly_client.getClient().isAvailable()
+    return bool(args.use_google_key)
 
 
-def postJson(url, postBody, headers = None):
+def textToSpeechBatchUsingArgs(items, args):
+    configureUsingArgs(args)
+    return textToSpeechBatch(items, lang=args.lang, useAmazon=args.use_amazon, useGoogleKey=args.use_google_key,
+                             encodingProfile=prompt_encoding.profileUsingArgs(args), conform=not getattr(args, 'post_process', False))
+
+
+def textToSpeechBatch(items, lang='de', useAmazon=False, useGoogleKey=None, encodingProfile=None, conform=True):
+    # Synthesizes several (text, targetFile) items with one request (Amazon and Google only).
+    # Returns False (without creating any target file) if the audio can't be split reliably,
+    # the caller should then synthesize the items one by one.
+    if not items:
+        return True
+    print('\nGenerating {} messages in one request: {} - {}'.format(len(items), items[0][1], items[-1][1]))
+    engine = 'amazon' if useAmazon else 'google'
+    encodingProfile = encodingProfile or prompt_encoding.profiles[prompt_encoding.defaultProfileName]
+    tempFile = makeTempFile(items[0][1], '.mp3')
+    try:
+        start = time.perf_counter()
+        with profiling.span('tts_batch', engine, engine=engine, lang=lang, prompts=len(items),
+                            chars=sum(len(text) for text, _ in items)) as span:
+            if useAmazon:
+                marks = synthesizeBatchAmazon([text for text, _ in items], lang, tempFile, encodingProfile)
+            else:
+                marks = synthesizeBatchGoogle([text for text, _ in items], lang, useGoogleKey, tempFile, encodingProfile)
+            # Encoding the whole batch once is cheaper than every prompt; the cuts are in the middle
+            # of long pauses, so the encoder delay doesn't matter
+            if conform:
+                prompt_encoding.conform(tempFile, encodingProfile)
+            cuts = batchCutTimes(marks, len(items))
+            if cuts is None or not mp3_utils.split_mp3(tempFile, cuts, [targetFile for _, targetFile in items]):
+                print('WARNING: Could not split the batched audio at the marks -> Synthesizing the messages one by one')
+                return False
+            span.add_bytes(os.path.getsize(tempFile))
+        run_planner.record('tts_batch:' + engine, time.perf_counter() - start, len(items))
+        run_planner.record('bytes:prompt', os.path.getsize(tempFile), len(items))
+        tts_quota.usage.addSaved('batching', len(items) - (2 if useAmazon else 1))
+        return True
+    finally:
+        os.remove(tempFile)
+
+
+def batchSsmlBody(texts, escape):
+    pause = '<break time="{}ms"/>'.format(batchPauseMs)
+    return pause.join('<mark name="s{0}"/>{1}<mark name="e{0}"/>'.format(i, xml.sax.saxutils.escape(text) if escape else text)
+                      for i, text in enumerate(texts))
+
+
+def synthesizeBatchAmazon(texts, lang, targetFile, encodingProfile):
+    # Returns {mark name: time in seconds}. Needs two requests: speech marks and audio
+    client = polly_client.getClient()
+    ssml = '<speak><amazon:effect name="drc"><prosody rate=\"+10%\">' + batchSsmlBody(texts, escape=False) + '</prosody></amazon:effect></speak>'
+    billedChars = tts_quota.billedChars('amazon', ssml)
+    speechMarks = client.synthesizeSpeech(ssml, amazonVoiceByLang[lang], outputFormat='json', speechMarkTypes=['ssml'], billedChars=billedChars)
+    tts_quota.usage.addRequest('amazon', billedChars)
+    client.synthesizeSpeech(ssml, amazonVoiceByLang[lang], targetFile, billedChars=billedChars,
+                            sampleRate=prompt_encoding.pollySampleRate(encodingProfile))
+    tts_quota.usage.addRequest('amazon', billedChars)
+    marks = {}
+    for line in speechMarks.decode('utf-8').splitlines():
+        if line.strip():
+            mark = json.loads(line)
+            marks[mark['value']] = mark['time'] / 1000.0
+    return marks
+
+
+def synthesizeBatchGoogle(texts, lang, googleKey, targetFile, encodingProfile):
+    # Returns {mark name: time in seconds}. Time pointing is only available in the v1beta1 API
+    ssml = '<speak>' + batchSsmlBody(texts, escape=True) + '</speak>'
+    billedChars = tts_quota.billedChars('google', ssml)
+    responseJson = postJson(
+        'https://texttospeech.googleapis.com/v1beta1/text:synthesize?key=' + googleKey,
+        {
+            'audioConfig': {
+                'audioEncoding': 'MP3',
+                'speakingRate': 1.0,
+                'pitch': 2.0,
+                'sampleRateHertz': encodingProfile.sampleRate,
+                'effectsProfileId': [ 'small-bluetooth-speaker-class-device' ]
+            },
+            'voice': googleVoiceByLang[lang],
+            'input': { 'ssml': ssml },
+            'enableTimePointing': [ 'SSML_MARK' ]
+        },
+        limiter=tts_quota.getLimiter('google'), chars=billedChars
+    )
+    tts_quota.usage.addRequest('google', billedChars)
+    with open(targetFile, 'wb') as f:
+        f.write(base64.b64decode(responseJson['audioContent']))
+    return {point['markName']: float(point['timeSeconds']) for point in responseJson.get('timepoints', [])}
+
+
+def batchCutTimes(marks, count):
+    # Returns the times to split the batched audio at (the middle of each pause),
+    # or None if the marks don't look like `count` prompts separated by pauses
+    if not marks:
+        return None
+    try:
+        starts = [marks['s{}'.format(i)] for i in range(count)]
+        ends = [marks['e{}'.format(i)] for i in range(count)]
+    except KeyError:
+        return None
+    for i in range(count):
+        if ends[i] - starts[i] < batchMinPromptSeconds:
+            return None
+        if i > 0 and starts[i] - ends[i - 1] < batchPauseMs / 1000.0 / 2:
+            return None
+    return [(ends[i] + starts[i + 1]) / 2 for i in range(count - 1)]
+
+
+def makeTempFile(targetFile, suffix):
+    # A temp file of its own for every message, so several messages can be generated at the same time
+    fd, tempFile = tempfile.mkstemp(prefix='temp-', suffix=suffix, dir=os.path.dirname(targetFile) or '.')
+    os.close(fd)
+    return tempFile
+
+
+def encodeMp3(inputFile, targetFile, encodingProfile=None):
+    # Uses ffmpeg if it was built with libmp3lame, otherwise falls back to the `lame` encoder
+    encodingProfile = encodingProfile or prompt_encoding.profiles[prompt_encoding.defaultProfileName]
+    with profiling.span('encode_mp3', 'ffmpeg') as span:
+        if not prompt_encoding.encoderAvailable():
+            print('ERROR: Neither ffmpeg (with libmp3lame) nor lame is installed. One of them is needed to encode mp3 files.')
+            sys.exit(2)
+        if not prompt_encoding.encode(inputFile, targetFile, encodingProfile):
+            raise TextToSpeechError('Encoding {} as mp3 failed'.format(inputFile))
+        if os.path.isfile(targetFile):
+            span.add_bytes(os.path.getsize(targetFile))
+
+
+def postJson(url, postBody, headers = None, limiter = None, chars = 0, attempts = polly_client.MAX_ATTEMPTS):
+    # Throttling (429) and server errors are retried with backoff, other errors raise TextToSpeechError
     if headers is None:
         headers = {}
     headers['Content-Type'] = 'application/json; charset=utf-8'
     data = json.dumps(postBody).encode('utf-8')
-    try:
-        request = urllib.request.Request(url, data, headers)
-        with urllib.request.urlopen(request) as req:
-            response_data=req.read()
-        return json.loads(response_data.decode())
-    except Exception as e:
-        print(e)
-        exit(2)
+    for attempt in range(attempts):
+        if limiter is not None:
+            limiter.acquire(chars)
+        try:
+            request = urllib.request.Request(url, data, headers)
+            with urllib.request.urlopen(request) as req:
+                response_data=req.read()
+            if limiter is not None:
+                limiter.succeeded()
+            return json.loads(response_data.decode())
+        except urllib.error.HTTPError as e:
+            error = 'HTTP {}: {}'.format(e.code, e.read().decode('utf-8', 'replace').strip())
+            if e.code not in polly_client.RETRYABLE_STATUS:
+                raise TextToSpeechError(error)
+            if e.code == 429 and limiter is not None:
+                limiter.throttled()
+        except (urllib.error.URLError, OSError) as e:
+            error = str(e)
+        if attempt < attempts - 1:
+            time.sleep(random.uniform(0, min(polly_client.BACKOFF_MAX, polly_client.BACKOFF_BASE * 2 ** attempt)))
+    raise TextToSpeechError('Request failed after {} attempts: {}'.format(attempts, error))
 
 if __name__ == '__main__':
     argFormatter = lambda prog: argparse.RawDescriptionHelpFormatter(prog, max_help_position=30, width=100)
@@ -160,7 +391,9 @@ if __name__ == '__main__':
     argparser.add_argument('-t', '--text', type=str, required=True, help='The text to convert into spoken language.')
     argparser.add_argument('-o', '--output', type=str, required=True, help='The output mp3 file to create')
     addArgumentsToArgparser(argparser)
+    profiling.add_profile_argument(argparser)
     args = argparser.parse_args()
+    profiling.enable_from_args(args)
 
 
     checkArgs(argparser, args)
@@ -170,4 +403,8 @@ if __name__ == '__main__':
         sys.exit(1)
 
 
-    textToSpeechUsingArgs(text=args.text, targetFile=args.output, args=args)
\ No newline at end of file
+    try:
+        textToSpeechUsingArgs(text=args.text, targetFile=args.output, args=args)
+    except (TextToSpeechError, polly_client.PollyError) as e:
+        print('ERROR: {}'.format(e))
+        sys.exit(2)
\ No newline at end of file
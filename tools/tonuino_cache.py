@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - Shared on-disk cache
+Small JSON key/value stores kept in the user's cache directory so that
+expensive results (tool probing, hashes, audio measurements) survive
+between runs of the GUI and the command line tools.
+
+The cache directory defaults to ~/.cache/tonuino (or $XDG_CACHE_HOME/tonuino)
+and can be overridden with the TONUINO_CACHE_DIR environment variable.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+def cache_dir() -> Path:
+    """Return (and create) the directory used for all TonUINO tool caches"""
+    override = os.environ.get('TONUINO_CACHE_DIR')
+    if override:
+        path = Path(override)
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(Path.home(), '.cache')
+        path = Path(base) / 'tonuino'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class JsonCache:
+    """Thread-safe JSON key/value store with optional per-entry TTL
+
+    Entries are stored as {"time": <epoch seconds>, "value": <value>}. Writes
+    go to a temporary file first and are then renamed, so a crash never
+    leaves a half written cache behind.
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = None, path: Optional[Path] = None):
+        self.path = Path(path) if path else cache_dir() / f"{name}.json"
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._entries = data
+            except Exception:
+                self._entries = {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if not isinstance(entry, dict) or 'value' not in entry:
+                return default
+            if self.ttl is not None and time.time() - entry.get('time', 0) > self.ttl:
+                return default
+            return entry['value']
+
+    def set(self, key: str, value: Any):
+        """Store value for key (call save() to persist)"""
+        with self._lock:
+            self._load()
+            self._entries[key] = {'time': time.time(), 'value': value}
+            self._dirty = True
+
+    def delete(self, key: str):
+        """Remove key from the cache (call save() to persist)"""
+        with self._lock:
+            self._load()
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def keys(self):
+        """Return all keys, including expired ones"""
+        with self._lock:
+            self._load()
+            return list(self._entries.keys())
+
+    def clear(self):
+        """Remove all entries (call save() to persist)"""
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
+
+    def save(self):
+        """Persist the cache if it was modified"""
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            tmp = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=self.path.name, dir=str(self.path.parent))
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f, indent=1, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except Exception:
+                # A cache that can't be written is not fatal - results just get recomputed
+                if tmp is not None:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+TonUINO Tools - External tool capability registry
+Probes the external command line tools used by the TonUINO tools
+(ffmpeg, ffprobe, AAXtoMP3, lame) once, and caches their location, version
+and supported encoders/decoders/filters on disk.
+
+The probe results are cached for one day (see DEFAULT_TTL) and invalidated
+as soon as the tool binary changes (different path, size or mtime), so
+installing or upgrading a tool is picked up automatically.
+
+Usage:
+    registry = tool_registry.get_registry()
+    registry.start_background_probe()   # optional, e.g. at GUI startup
+    if registry.available('ffmpeg') and registry.has_encoder('ffmpeg', 'libmp3lame'):
+        ...
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from tonuino_cache import JsonCache
+
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# Tool name -> arguments printing its version
+VERSION_ARGS = {
+    'ffmpeg': ['-hide_banner', '-version'],
+    'ffprobe': ['-hide_banner', '-version'],
+    'AAXtoMP3': ['--help'],
+    'lame': ['--version'],
+}
+
+
+def _run(cmd: List[str], timeout: float = 10) -> Optional[str]:
+    """Run a probe command and return its combined output (None if it could not be run)"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        return (result.stdout or '') + (result.stderr or '')
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def _parse_version(name: str, output: str) -> str:
+    """Extract a version string from the first line of a tool's version output"""
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    if not lines:
+        return ''
+    first = lines[0]
+    tokens = first.split()
+    if 'version' in tokens:
+        i = tokens.index('version')
+        if i + 1 < len(tokens):
+            return tokens[i + 1]
+    return first
+
+
+def _parse_codecs(output: str) -> List[str]:
+    """Parse the output of `ffmpeg -encoders` / `ffmpeg -decoders`"""
+    names = []
+    in_list = False
+    for line in output.splitlines():
+        if line.strip().startswith('------'):
+            in_list = True
+            continue
+        tokens = line.split()
+        if in_list and len(tokens) >= 2:
+            names.append(tokens[1])
+    return names
+
+
+def _parse_filters(output: str) -> List[str]:
+    """Parse the output of `ffmpeg -filters`"""
+    names = []
+    for line in output.splitlines():
+        tokens = line.split()
+        if len(tokens) >= 3 and '->' in tokens[2]:
+            names.append(tokens[1])
+    return names
+
+
+class ToolRegistry:
+    """Caches which external tools are installed and what they support"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, cache: Optional[JsonCache] = None):
+        self.cache = cache if cache is not None else JsonCache('tools', ttl=ttl)
+        self._tools: Dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _signature(self, path: str) -> str:
+        """Identify a tool binary so that upgrades invalidate the cache"""
+        try:
+            stat = os.stat(path)
+            return f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+        except OSError:
+            return path
+
+    def _probe(self, name: str) -> Optional[dict]:
+        """Probe a single tool (cached on disk)"""
+        path = shutil.which(name)
+        if not path:
+            return None
+
+        signature = self._signature(path)
+        cached = self.cache.get(name)
+        if cached and cached.get('signature') == signature:
+            return cached
+
+        output = _run([path] + VERSION_ARGS.get(name, ['-version']))
+        if output is None:
+            return None
+
+        info = {
+            'path': path,
+            'signature': signature,
+            'version': _parse_version(name, output),
+            'encoders': [],
+            'decoders': [],
+            'filters': [],
+        }
+        if name == 'ffmpeg':
+            info['encoders'] = _parse_codecs(_run([path, '-hide_banner', '-encoders']) or '')
+            info['decoders'] = _parse_codecs(_run([path, '-hide_banner', '-decoders']) or '')
+            info['filters'] = _parse_filters(_run([path, '-hide_banner', '-filters']) or '')
+
+        self.cache.set(name, info)
+        return info
+
+    def probe_all(self, force: bool = False):
+        """Probe all known tools, reusing cached results unless force is set"""
+        with self._lock:
+            if force:
+                self._tools = {}
+                self.cache.clear()
+            for name in VERSION_ARGS:
+                if name not in self._tools:
+                    self._tools[name] = self._probe(name)
+            self.cache.save()
+
+    def start_background_probe(self):
+        """Probe all tools in a daemon thread so that startup isn't blocked"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.probe_all, daemon=True)
+            self._thread.start()
+
+    def get(self, name: str) -> Optional[dict]:
+        """Return the probe info of a tool, or None if it is not installed"""
+        with self._lock:
+            if name not in self._tools:
+                self._tools[name] = self._probe(name)
+                self.cache.save()
+            return self._tools[name]
+
+    def available(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def path(self, name: str) -> Optional[str]:
+        info = self.get(name)
+        return info['path'] if info else None
+
+    def version(self, name: str) -> Optional[str]:
+        info = self.get(name)
+        return info['version'] if info else None
+
+    def has_encoder(self, tool: str, encoder: str) -> bool:
+        info = self.get(tool)
+        return bool(info) and encoder in info.get('encoders', [])
+
+    def has_decoder(self, tool: str, decoder: str) -> bool:
+        info = self.get(tool)
+        return bool(info) and decoder in info.get('decoders', [])
+
+    def has_filter(self, tool: str, filter_name: str) -> bool:
+        info = self.get(tool)
+        return bool(info) and filter_name in info.get('filters', [])
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ToolRegistry:
+    """Return the process wide tool registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ToolRegistry()
+        return _registry
+
+
+if __name__ == '__main__':
+    import sys
+    registry = get_registry()
+    registry.probe_all(force='--refresh' in sys.argv)
+    for tool_name in VERSION_ARGS:
+        tool_info = registry.get(tool_name)
+        if tool_info:
+            print(f"{tool_name:10} {tool_info['version']:20} {tool_info['path']}")
+        else:
+            print(f"{tool_name:10} not found")
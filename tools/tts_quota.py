@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Rate limiting and usage accounting for the text-to-speech engines.
+#
+# Every cloud request first takes tokens from two token buckets of its engine:
+# one for requests per second and one for characters per minute. The buckets
+# refill continuously, so parallel workers together stay at (not above) the
+# quota. When the service throttles anyway, the rate is halved and then slowly
+# raised again with every successful request (additive increase, multiplicative
+# decrease), so the run keeps going at the highest rate the service accepts.
+#
+# `usage` counts requests, billed characters, throttling, cache hits and the
+# requests saved by batching and number fragments; `printReport()` prints them
+# at the end of a run.
+
+
+import re, threading, time
+
+
+# Conservative defaults, raise them with `--max-requests-per-second` and
+# `--max-chars-per-minute` if your account has higher quotas
+defaultLimitsByEngine = {
+    'amazon': { 'requestsPerSecond': 8, 'charsPerMinute': 100000 },
+    'google': { 'requestsPerSecond': 15, 'charsPerMinute': 150000 },
+}
+
+minRateFactor = 0.1
+rateIncreaseStep = 0.05
+
+
+class TokenBucket:
+    # `rate` tokens per second, at most `capacity` tokens saved up (rate 0: unlimited)
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def setRate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+    def acquire(self, amount=1):
+        # Blocks until `amount` tokens are available. More than `capacity` tokens
+        # are granted once the bucket is full (the bucket then goes into debt).
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                self.refill()
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EngineLimiter:
+    def __init__(self, engine, requestsPerSecond, charsPerMinute):
+        self.engine = engine
+        self.requestsPerSecond = requestsPerSecond
+        self.charsPerMinute = charsPerMinute
+        self.factor = 1.0
+        self.requests = TokenBucket(requestsPerSecond, max(1, requestsPerSecond))
+        self.chars = TokenBucket(charsPerMinute / 60.0, charsPerMinute)
+        self.lock = threading.Lock()
+
+    def acquire(self, chars):
+        self.requests.acquire(1)
+        self.chars.acquire(chars)
+
+    def applyFactor(self):
+        self.requests.setRate(self.requestsPerSecond * self.factor)
+        self.chars.setRate(self.charsPerMinute / 60.0 * self.factor)
+
+    def throttled(self):
+        usage.addThrottled(self.engine)
+        with self.lock:
+            self.factor = max(minRateFactor, self.factor / 2)
+            self.applyFactor()
+
+    def succeeded(self):
+        with self.lock:
+            if self.factor < 1.0:
+                self.factor = min(1.0, self.factor + rateIncreaseStep)
+                self.applyFactor()
+
+
+class Usage:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.chars = {}
+        self.throttled = {}
+        self.cacheHits = {}
+        self.saved = {}
+
+    def count(self, counter, key, amount=1):
+        with self.lock:
+            counter[key] = counter.get(key, 0) + amount
+
+    def addRequest(self, engine, billedChars):
+        self.count(self.requests, engine)
+        self.count(self.chars, engine, billedChars)
+
+    def addThrottled(self, engine):
+        self.count(self.throttled, engine)
+
+    def addCacheHits(self, kind, amount=1):
+        if amount:
+            self.count(self.cacheHits, kind, amount)
+
+    def addSaved(self, kind, amount):
+        if amount > 0:
+            self.count(self.saved, kind, amount)
+
+    def report(self):
+        lines = []
+        with self.lock:
+            for engine in sorted(self.requests):
+                line = 'TTS {}: {} requests'.format(engine, self.requests[engine])
+                if engine in defaultLimitsByEngine:
+                    line += ', {} characters billed'.format(self.chars.get(engine, 0))
+                if self.throttled.get(engine):
+                    line += ', {} throttled and retried'.format(self.throttled[engine])
+                lines.append(line)
+            if self.cacheHits:
+                lines.append('Cache hits: ' + ', '.join('{} {}'.format(n, kind) for kind, n in sorted(self.cacheHits.items())))
+            if self.saved:
+                lines.append('Requests saved: ' + ', '.join('{} by {}'.format(n, kind) for kind, n in sorted(self.saved.items())))
+        return '\n'.join(lines)
+
+
+usage = Usage()
+
+_limiters = {}
+_limitersLock = threading.Lock()
+
+
+def getLimiter(engine):
+    # The shared limiter of a cloud engine (None for local engines)
+    with _limitersLock:
+        if engine not in _limiters and engine in defaultLimitsByEngine:
+            limits = defaultLimitsByEngine[engine]
+            _limiters[engine] = EngineLimiter(engine, limits['requestsPerSecond'], limits['charsPerMinute'])
+        return _limiters.get(engine)
+
+
+def configure(engine, requestsPerSecond=None, charsPerMinute=None):
+    limits = defaultLimitsByEngine.get(engine)
+    if limits is None:
+        return
+    requestsPerSecond = requestsPerSecond if requestsPerSecond is not None else limits['requestsPerSecond']
+    charsPerMinute = charsPerMinute if charsPerMinute is not None else limits['charsPerMinute']
+    with _limitersLock:
+        limiter = _limiters.get(engine)
+        if limiter is None or (limiter.requestsPerSecond, limiter.charsPerMinute) != (requestsPerSecond, charsPerMinute):
+            _limiters[engine] = EngineLimiter(engine, requestsPerSecond, charsPerMinute)
+
+
+def billedChars(engine, text):
+    # Polly doesn't bill SSML tags, Google bills them except for <mark>s
+    if engine == 'amazon':
+        return len(re.sub(r'<[^>]*>', '', text))
+    return len(re.sub(r'<mark [^>]*/>', '', text))
+
+
+def printReport():
+    report = usage.report()
+    if report:
+        print('\n' + report)